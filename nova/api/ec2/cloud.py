@@ -23,6 +23,7 @@ datastore.
 """
 
 import base64
+import collections
 import time
 
 from oslo.config import cfg
@@ -1042,13 +1043,14 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
+                             result, bdms=None):
         """Format InstanceBlockDeviceMappingResponseItemType."""
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in block_device.legacy_mapping(
-            db.block_device_mapping_get_all_by_instance(context,
-                                                        instance_uuid)):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_uuid)
+        for bdm in block_device.legacy_mapping(bdms):
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1127,18 +1129,40 @@ class CloudController(object):
             except exception.NotFound:
                 instances = []
 
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if not pipelib.is_vpn_image(instance['image_ref'])]
+
+        # Look up the ec2 ids, block device mappings and availability zones
+        # of all the instances at once rather than one instance at a time.
+        instance_uuids = [instance['uuid'] for instance in instances]
+        ec2_ids = ec2utils.ids_to_ec2_inst_ids(instance_uuids)
+        image_uuids = set()
+        for instance in instances:
+            image_uuids.update([instance['image_ref'], instance['kernel_id'],
+                                instance['ramdisk_id']])
+        image_ids = ec2utils.glance_ids_to_ids(context, image_uuids)
+        bdms = collections.defaultdict(list)
+        for bdm in db.block_device_mapping_get_all_by_instance_uuids(
+                context, instance_uuids):
+            bdms[bdm['instance_uuid']].append(bdm)
+        zones = {}
+
+        def _image_ec2_id(image_uuid, image_type):
+            if image_uuid not in image_ids:
+                return ec2utils.glance_id_to_ec2_id(context, image_uuid,
+                                                    image_type)
+            return ec2utils.image_ec2_id(image_ids[image_uuid], image_type)
+
         for instance in instances:
-            if not context.is_admin:
-                if pipelib.is_vpn_image(instance['image_ref']):
-                    continue
             i = {}
             instance_uuid = instance['uuid']
-            ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
-            i['instanceId'] = ec2_id
-            image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['instanceId'] = ec2_ids[instance_uuid]
+            i['imageId'] = _image_ec2_id(instance['image_ref'], 'ami')
+            if instance['kernel_id']:
+                i['kernelId'] = _image_ec2_id(instance['kernel_id'], 'aki')
+            if instance['ramdisk_id']:
+                i['ramdiskId'] = _image_ec2_id(instance['ramdisk_id'], 'ari')
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1176,10 +1200,12 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
+                                      i['rootDeviceName'], i,
+                                      bdms=bdms[instance_uuid])
             host = instance['host']
-            zone = ec2utils.get_availability_zone_by_host(host)
-            i['placement'] = {'availabilityZone': zone}
+            if host not in zones:
+                zones[host] = ec2utils.get_availability_zone_by_host(host)
+            i['placement'] = {'availabilityZone': zones[host]}
             if instance['reservation_id'] not in reservations:
                 r = {}
                 r['reservationId'] = instance['reservation_id']
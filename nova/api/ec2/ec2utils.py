@@ -37,22 +37,66 @@ _CACHE_TIME = 7 * 24 * 60 * 60
 _CACHE = None
 
 
+def _get_cache():
+    global _CACHE
+    if not _CACHE:
+        _CACHE = memorycache.get_client()
+    return _CACHE
+
+
+def _make_cache_key(func_name, reqid):
+    return str("%s:%s" % (func_name, reqid))
+
+
 def memoize(func):
     @functools.wraps(func)
     def memoizer(context, reqid):
-        global _CACHE
-        if not _CACHE:
-            _CACHE = memorycache.get_client()
-        key = "%s:%s" % (func.__name__, reqid)
-        key = str(key)
-        value = _CACHE.get(key)
+        cache = _get_cache()
+        key = _make_cache_key(func.__name__, reqid)
+        value = cache.get(key)
         if value is None:
             value = func(context, reqid)
-            _CACHE.set(key, value, time=_CACHE_TIME)
+            cache.set(key, value, time=_CACHE_TIME)
         return value
     return memoizer
 
 
+def _memoize_multi(func_name, context, reqids, func):
+    """Bulk version of memoize.
+
+    Returns a dict of the values of the memoized function func_name for
+    reqids.  The values not in the cache are looked up with a single
+    func(context, missing_reqids) call, returning them as a dict.  When
+    the cache is memcached, the cached values are read with a single
+    get_multi() call.
+    """
+    cache = _get_cache()
+    keys = dict((_make_cache_key(func_name, reqid), reqid)
+                for reqid in set(reqids))
+    if hasattr(cache, 'get_multi'):
+        cached = cache.get_multi(keys.keys())
+    else:
+        cached = {}
+        for key in keys:
+            value = cache.get(key)
+            if value is not None:
+                cached[key] = value
+    values = dict((keys[key], value) for key, value in cached.iteritems())
+    missing = [reqid for key, reqid in keys.iteritems() if key not in cached]
+    if missing:
+        found = func(context, missing)
+        if hasattr(cache, 'set_multi'):
+            cache.set_multi(dict((_make_cache_key(func_name, reqid), value)
+                                 for reqid, value in found.iteritems()),
+                            time=_CACHE_TIME)
+        else:
+            for reqid, value in found.iteritems():
+                cache.set(_make_cache_key(func_name, reqid), value,
+                          time=_CACHE_TIME)
+        values.update(found)
+    return values
+
+
 def reset_cache():
     global _CACHE
     _CACHE = None
@@ -117,6 +161,23 @@ def glance_id_to_id(context, glance_id):
         return db.s3_image_create(context, glance_id)['id']
 
 
+def glance_ids_to_ids(context, glance_ids):
+    """Convert glance ids to internal (db) ids, as a dict keyed by glance
+    id, looking up the ones not cached in bulk.
+    """
+    def _glance_ids_to_ids(context, glance_ids):
+        ids = dict((image['uuid'], image['id']) for image in
+                   db.s3_image_get_all_by_uuids(context, glance_ids))
+        for glance_id in glance_ids:
+            if glance_id not in ids:
+                ids[glance_id] = db.s3_image_create(context, glance_id)['id']
+        return ids
+
+    glance_ids = [glance_id for glance_id in glance_ids if glance_id]
+    return _memoize_multi('glance_id_to_id', context, glance_ids,
+                          _glance_ids_to_ids)
+
+
 def ec2_id_to_glance_id(context, ec2_id):
     image_id = ec2_id_to_id(ec2_id)
     return id_to_glance_id(context, image_id)
@@ -193,6 +254,16 @@ def id_to_ec2_inst_id(instance_id):
         return id_to_ec2_id(instance_id)
 
 
+def ids_to_ec2_inst_ids(instance_uuids):
+    """Get or create the ec2 instance IDs of instance uuids, as a dict keyed
+    by uuid, looking up the ones not cached in bulk.
+    """
+    ctxt = context.get_admin_context()
+    int_ids = get_int_ids_from_instance_uuids(ctxt, instance_uuids)
+    return dict((instance_uuid, id_to_ec2_id(int_id))
+                for instance_uuid, int_id in int_ids.iteritems())
+
+
 def ec2_inst_id_to_uuid(context, ec2_id):
     """"Convert an instance id to uuid."""
     int_id = ec2_id_to_id(ec2_id)
@@ -286,6 +357,21 @@ def get_int_id_from_instance_uuid(context, instance_uuid):
         return db.ec2_instance_create(context, instance_uuid)['id']
 
 
+def get_int_ids_from_instance_uuids(context, instance_uuids):
+    def _get_int_ids_from_instance_uuids(context, instance_uuids):
+        int_ids = db.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+        for instance_uuid in instance_uuids:
+            if instance_uuid not in int_ids:
+                int_ids[instance_uuid] = db.ec2_instance_create(
+                    context, instance_uuid)['id']
+        return int_ids
+
+    instance_uuids = [instance_uuid for instance_uuid in instance_uuids
+                      if instance_uuid]
+    return _memoize_multi('get_int_id_from_instance_uuid', context,
+                          instance_uuids, _get_int_ids_from_instance_uuids)
+
+
 @memoize
 def get_int_id_from_volume_uuid(context, volume_uuid):
     if volume_uuid is None:
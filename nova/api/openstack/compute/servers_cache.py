@@ -0,0 +1,87 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Response cache for GET /servers/detail.
+
+Add the serverscache filter after keystonecontext in the API pipeline and
+set instance_list_cache_ttl to use it.
+"""
+
+import hashlib
+
+from oslo.config import cfg
+import webob
+import webob.dec
+
+from nova.compute import list_cache
+from nova.openstack.common import strutils
+from nova import wsgi
+
+CONF = cfg.CONF
+CONF.import_opt('instance_list_cache_ttl', 'nova.compute.list_cache')
+
+
+class ServersDetailCache(wsgi.Middleware):
+    """Caches the responses of GET /servers/detail, per project.
+
+    The responses are keyed by the user, roles, URL, query and accepted
+    content type of the request, so that the extensions and policies
+    applied to them are the same.  They are invalidated whenever an
+    instance of the project changes, see nova.compute.list_cache.
+    """
+
+    @staticmethod
+    def _cacheable(req, context):
+        return (CONF.instance_list_cache_ttl > 0 and context is not None and
+                req.method == 'GET' and
+                req.path_info.rstrip('/').endswith('/servers/detail') and
+                # The listings of all the projects can't be invalidated.
+                'all_tenants' not in req.GET)
+
+    @staticmethod
+    def _make_key(req, context):
+        parts = [context.user_id or '',
+                 ','.join(sorted(context.roles)),
+                 str(context.is_admin),
+                 req.script_name + req.path_info,
+                 req.query_string,
+                 req.headers.get('Accept', '')]
+        request_key = '\n'.join(strutils.safe_encode(part) for part in parts)
+        return list_cache.make_key(
+            context.project_id,
+            'servers-detail-%s' % hashlib.md5(request_key).hexdigest())
+
+    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        context = req.environ.get('nova.context')
+        if not self._cacheable(req, context):
+            return self.application
+
+        key = self._make_key(req, context)
+        cached = list_cache.get_listing(key)
+        if cached is not None:
+            status, headers, body = cached
+            resp = webob.Response(status=status, headerlist=list(headers),
+                                  body=body)
+            if 'x-compute-request-id' in resp.headers:
+                resp.headers['x-compute-request-id'] = context.request_id
+            return resp
+
+        resp = req.get_response(self.application)
+        if resp.status_int == 200:
+            list_cache.set_listing(key, (resp.status, resp.headerlist,
+                                         resp.body))
+        return resp
@@ -65,7 +65,7 @@ class CellsManager(manager.Manager):
 
     Scheduling requests get passed to the scheduler class.
     """
-    RPC_API_VERSION = '1.24'
+    RPC_API_VERSION = '1.25'
 
     def __init__(self, *args, **kwargs):
         # Mostly for tests.
@@ -232,6 +232,12 @@ class CellsManager(manager.Manager):
         """Update bandwidth usage at top level cell."""
         self.msg_runner.bw_usage_update_at_top(ctxt, bw_update_info)
 
+    def bw_usages_update_at_top(self, ctxt, start_period, bw_usages,
+                                last_refreshed=None):
+        """Update several bandwidth usages at top level cell."""
+        self.msg_runner.bw_usages_update_at_top(ctxt, start_period,
+                                                bw_usages, last_refreshed)
+
     def sync_instances(self, ctxt, project_id, updated_since, deleted):
         """Force a sync of all instances, potentially by project_id,
         and potentially since a certain date/time.
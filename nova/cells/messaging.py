@@ -1047,6 +1047,17 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             return
         self.db.bw_usage_update(message.ctxt, **bw_update_info)
 
+    def bw_usages_update_at_top(self, message, start_period, bw_usages,
+                                last_refreshed, **kwargs):
+        """Update several Bandwidth usages in the DB if we're a top level
+        cell.
+        """
+        if not self._at_the_top():
+            return
+        self.db.bw_usage_update_all(message.ctxt, start_period, bw_usages,
+                                    last_refreshed=last_refreshed,
+                                    update_cells=False)
+
     def _sync_instance(self, ctxt, instance):
         if instance['deleted']:
             self.msg_runner.instance_destroy_at_top(ctxt, instance)
@@ -1415,6 +1426,15 @@ class MessageRunner(object):
                                     'up', run_locally=False)
         message.process()
 
+    def bw_usages_update_at_top(self, ctxt, start_period, bw_usages,
+                                last_refreshed=None):
+        """Update several bandwidth usages at top level cell."""
+        method_kwargs = dict(start_period=start_period, bw_usages=bw_usages,
+                             last_refreshed=last_refreshed)
+        message = _BroadcastMessage(self, ctxt, 'bw_usages_update_at_top',
+                                    method_kwargs, 'up', run_locally=False)
+        message.process()
+
     def sync_instances(self, ctxt, project_id, updated_since, deleted):
         """Force a sync of all instances, potentially by project_id,
         and potentially since a certain date/time.
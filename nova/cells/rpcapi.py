@@ -81,6 +81,7 @@ class CellsAPI(rpcclient.RpcProxy):
         1.22 - Adds reset_network()
         1.23 - Adds inject_network_info()
         1.24 - Adds backup_instance() and snapshot_instance()
+        1.25 - Adds bw_usages_update_at_top()
     '''
     BASE_RPC_API_VERSION = '1.0'
 
@@ -187,6 +188,23 @@ class CellsAPI(rpcclient.RpcProxy):
         self.client.cast(ctxt, 'bw_usage_update_at_top',
                          bw_update_info=bw_update_info)
 
+    def bw_usages_update_at_top(self, ctxt, start_period, bw_usages,
+                                last_refreshed=None):
+        """Broadcast upwards that several bw_usages were updated."""
+        if not CONF.cells.enable:
+            return
+        if not self.client.can_send_version('1.25'):
+            for bw_usage in bw_usages:
+                self.bw_usage_update_at_top(ctxt, bw_usage['uuid'],
+                        bw_usage['mac'], start_period, bw_usage['bw_in'],
+                        bw_usage['bw_out'], bw_usage['last_ctr_in'],
+                        bw_usage['last_ctr_out'], last_refreshed)
+            return
+        cctxt = self.client.prepare(version='1.25')
+        cctxt.cast(ctxt, 'bw_usages_update_at_top',
+                   start_period=start_period, bw_usages=bw_usages,
+                   last_refreshed=last_refreshed)
+
     def instance_info_cache_update_at_top(self, ctxt, instance_info_cache):
         """Broadcast up that an instance's info_cache has changed."""
         if not CONF.cells.enable:
@@ -42,11 +42,17 @@ def get_instances_to_sync(context, updated_since=None, project_id=None,
         filters['project_id'] = project_id
     if not deleted:
         filters['deleted'] = False
-    # Active instances first.
-    instances = db.instance_get_all_by_filters(
-            context, filters, 'deleted', 'asc')
+    # Only the uuids are needed, skip the joins.
+    columns_to_join = [] if uuids_only else None
     if shuffle:
+        # Active instances first.
+        instances = db.instance_get_all_by_filters(
+                context, filters, 'deleted', 'asc',
+                columns_to_join=columns_to_join)
         random.shuffle(instances)
+    else:
+        instances = _iter_instances_to_sync(context, filters, deleted,
+                                            columns_to_join)
     for instance in instances:
         if uuids_only:
             yield instance['uuid']
@@ -54,6 +60,25 @@ def get_instances_to_sync(context, updated_since=None, project_id=None,
             yield instance
 
 
+def _iter_instances_to_sync(context, filters, deleted, columns_to_join):
+    """Iterate over the instances matching filters, active instances first,
+    reading them a batch at a time.
+    """
+    if not deleted:
+        active_filters = filters
+    else:
+        active_filters = dict(filters, deleted=False, soft_deleted=True)
+    for instance in db.instance_get_all_by_filters_iter(
+            context, active_filters, columns_to_join=columns_to_join):
+        yield instance
+    if not deleted:
+        return
+    deleted_filters = dict(filters, deleted=True, soft_deleted=False)
+    for instance in db.instance_get_all_by_filters_iter(
+            context, deleted_filters, columns_to_join=columns_to_join):
+        yield instance
+
+
 def cell_with_item(cell_name, item):
     """Turn cell_name and item into <cell_name>@<item>."""
     if cell_name is None:
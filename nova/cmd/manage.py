@@ -57,6 +57,7 @@ from __future__ import print_function
 
 import os
 import sys
+import time
 
 import netaddr
 from oslo.config import cfg
@@ -65,6 +66,7 @@ from nova.api.ec2 import ec2utils
 from nova import availability_zones
 from nova.cells import rpc_driver
 from nova.compute import flavors
+from nova.compute import rpcapi as compute_rpcapi
 from nova import config
 from nova import context
 from nova import db
@@ -81,6 +83,7 @@ from nova import servicegroup
 from nova import version
 
 CONF = cfg.CONF
+CONF.import_opt('instance_iter_batch_size', 'nova.db.api')
 CONF.import_opt('network_manager', 'nova.service')
 CONF.import_opt('service_down_time', 'nova.service')
 CONF.import_opt('flat_network_bridge', 'nova.network.manager')
@@ -320,11 +323,6 @@ class FixedIpCommands(object):
             print(_("error: %s") % ex)
             return(2)
 
-        instances = db.instance_get_all(context.get_admin_context())
-        instances_by_uuid = {}
-        for instance in instances:
-            instances_by_uuid[instance['uuid']] = instance
-
         print("%-18s\t%-15s\t%-15s\t%s" % (_('network'),
                                               _('IP address'),
                                               _('hostname'),
@@ -343,13 +341,30 @@ class FixedIpCommands(object):
             print(_('No fixed IP found.'))
             return
 
-        has_ip = False
-        for fixed_ip in fixed_ips:
-            hostname = None
-            host = None
-            network = all_networks.get(fixed_ip['network_id'])
-            if network:
-                has_ip = True
+        fixed_ips = [fixed_ip for fixed_ip in fixed_ips
+                     if fixed_ip['network_id'] in all_networks]
+        has_ip = bool(fixed_ips)
+        batch_size = CONF.instance_iter_batch_size
+        for start in xrange(0, len(fixed_ips), batch_size):
+            batch = fixed_ips[start:start + batch_size]
+            # Only the hostname and host of the instances of the fixed ips
+            # being printed are needed, read them for one batch of fixed ips
+            # at a time without joining the other tables.
+            uuids = set(fixed_ip['instance_uuid'] for fixed_ip in batch
+                        if fixed_ip.get('instance_uuid'))
+            instances_by_uuid = {}
+            if uuids:
+                instances = db.instance_get_all_by_filters(
+                    ctxt, {'uuid': list(uuids), 'deleted': False,
+                           'soft_deleted': True},
+                    columns_to_join=[])
+                for instance in instances:
+                    instances_by_uuid[instance['uuid']] = instance
+
+            for fixed_ip in batch:
+                hostname = None
+                host = None
+                network = all_networks[fixed_ip['network_id']]
                 if fixed_ip.get('instance_uuid'):
                     instance = instances_by_uuid.get(fixed_ip['instance_uuid'])
                     if instance:
@@ -650,11 +665,12 @@ class VmCommands(object):
                                              _('zone'),
                                              _('index'))))
 
-        if host is None:
-            instances = db.instance_get_all(context.get_admin_context())
-        else:
-            instances = db.instance_get_all_by_host(
-                           context.get_admin_context(), host)
+        filters = {'deleted': False, 'soft_deleted': True}
+        if host is not None:
+            filters['host'] = host
+        instances = db.instance_get_all_by_filters_iter(
+            context.get_admin_context(), filters,
+            columns_to_join=['system_metadata'])
 
         for instance in instances:
             instance_type = flavors.extract_flavor(instance)
@@ -873,6 +889,45 @@ class HostCommands(object):
             print("%-25s\t%-15s" % (h['host'], h['availability_zone']))
 
 
+class ImageCommands(object):
+    """Manage the images cached on compute hosts."""
+
+    @args('--image', dest='image_ids', metavar='<image ids>',
+          help='Comma separated list of image ids')
+    @args('--host', metavar='<hosts>',
+          help='Comma separated list of compute hosts')
+    @args('--aggregate', metavar='<aggregates>',
+          help='Comma separated list of aggregate names')
+    def cache(self, image_ids, host=None, aggregate=None):
+        """Download images into the image cache of compute hosts, in the
+        background.
+        """
+        if not host and not aggregate:
+            print(_("Please specify hosts or aggregates."))
+            return(2)
+
+        ctxt = context.get_admin_context()
+        hosts = set(host and host.split(',') or [])
+        if aggregate:
+            names = aggregate.split(',')
+            aggregates = [agg for agg in db.aggregate_get_all(ctxt)
+                          if agg['name'] in names]
+            missing = set(names) - set(agg['name'] for agg in aggregates)
+            if missing:
+                print(_("Aggregates not found: %s") %
+                      ', '.join(sorted(missing)))
+                return(2)
+            for agg in aggregates:
+                hosts.update(agg.hosts)
+
+        image_ids = image_ids.split(',')
+        compute_api = compute_rpcapi.ComputeAPI()
+        for compute_host in sorted(hosts):
+            compute_api.cache_images(ctxt, compute_host, image_ids)
+            print(_("Caching %(count)d image(s) on %(host)s") %
+                  {'count': len(image_ids), 'host': compute_host})
+
+
 class DbCommands(object):
     """Class for managing the database."""
 
@@ -890,17 +945,48 @@ class DbCommands(object):
 
     @args('--max_rows', metavar='<number>',
             help='Maximum number of deleted rows to archive')
-    def archive_deleted_rows(self, max_rows):
+    @args('--sleep', metavar='<seconds>',
+            help='Seconds to wait after each transaction archiving rows, '
+                 'to limit the replication lag')
+    @args('--continuous', action='store_true', default=False,
+            help='Keep archiving batches of max_rows rows, waiting for '
+                 'more rows to be deleted when none are left')
+    def archive_deleted_rows(self, max_rows, sleep=None, continuous=False):
         """Move up to max_rows deleted rows from production tables to shadow
         tables.
+
+        The rows are moved by transactions of a bounded number of rows, each
+        followed by a pause of --sleep seconds.  With --continuous, batches
+        of max_rows rows are archived until the command is interrupted.
         """
         if max_rows is not None:
             max_rows = int(max_rows)
             if max_rows < 0:
                 print(_("Must supply a positive value for max_rows"))
                 return(1)
+        if continuous and not max_rows:
+            print(_("Must supply max_rows with continuous"))
+            return(1)
+        sleep = float(sleep or 0)
+        if sleep < 0:
+            print(_("Must supply a positive value for sleep"))
+            return(1)
         admin_context = context.get_admin_context()
-        db.archive_deleted_rows(admin_context, max_rows)
+        while True:
+            start = time.time()
+            rows = db.archive_deleted_rows(admin_context, max_rows,
+                                           sleep=sleep)
+            if not continuous:
+                return
+            if rows:
+                elapsed = max(time.time() - start, 0.001)
+                print(_("Archived %(rows)d rows in %(elapsed).2f seconds "
+                        "(%(rate)d rows/s)") %
+                      {'rows': rows, 'elapsed': elapsed,
+                       'rate': rows / elapsed})
+            else:
+                # Nothing left to archive, check again in a while.
+                time.sleep(max(sleep, 60))
 
 
 class FlavorCommands(object):
@@ -1250,6 +1336,7 @@ CATEGORIES = {
     'flavor': FlavorCommands,
     'floating': FloatingIpCommands,
     'host': HostCommands,
+    'image': ImageCommands,
     # Deprecated, remove in Icehouse
     'instance_type': FlavorCommands,
     'logs': GetLogCommands,
@@ -0,0 +1,101 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cache of the instance listings of the API, per project.
+
+Every project has a generation, replaced whenever one of its instances
+changes.  The cached listings of a project are keyed by its generation, so
+that replacing it invalidates all of them at once.  The cache is shared by
+all the services when memcached_servers is set.
+"""
+
+from oslo.config import cfg
+
+from nova.openstack.common import memorycache
+from nova.openstack.common import uuidutils
+
+list_cache_opts = [
+    cfg.IntOpt('instance_list_cache_ttl',
+               default=0,
+               help='Number of seconds the API caches the instance '
+                    'listings of a project for, 0 disables the cache. '
+                    'Set it and memcached_servers on the conductor and '
+                    'compute services too, so that they invalidate the '
+                    'listings of the instances they change'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(list_cache_opts)
+
+_CACHE = None
+
+
+def _get_cache():
+    global _CACHE
+    if not _CACHE:
+        _CACHE = memorycache.get_client()
+    return _CACHE
+
+
+def reset_cache():
+    """Reset the cache, mainly for testing purposes."""
+    global _CACHE
+    _CACHE = None
+
+
+def _make_generation_key(project_id):
+    return str("instance-list-generation-%s" % project_id)
+
+
+def _get_generation(project_id):
+    cache = _get_cache()
+    key = _make_generation_key(project_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuidutils.generate_uuid()
+        cache.set(key, generation)
+    return generation
+
+
+def make_key(project_id, key):
+    """Returns the cache key of the listing called key of a project.
+
+    The key has to be made before listing the instances, so that a change
+    made while listing them invalidates the listing.
+    """
+    return str("instance-list-%s-%s" % (_get_generation(project_id), key))
+
+
+def get_listing(key):
+    return _get_cache().get(key)
+
+
+def set_listing(key, value):
+    _get_cache().set(key, value, time=CONF.instance_list_cache_ttl)
+
+
+def invalidate(project_id):
+    """Invalidate the cached instance listings of a project."""
+    if not CONF.instance_list_cache_ttl or project_id is None:
+        return
+    _get_cache().set(_make_generation_key(project_id),
+                     uuidutils.generate_uuid())
+
+
+def invalidate_for_instance(instance):
+    """Invalidate the cached instance listings of the project of instance."""
+    if CONF.instance_list_cache_ttl:
+        invalidate(instance['project_id'])
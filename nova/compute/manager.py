@@ -113,6 +113,10 @@ compute_opts = [
     cfg.IntOpt('network_allocate_retries',
                default=0,
                help="Number of times to retry network allocation on failures"),
+    cfg.IntOpt('heal_instance_info_cache_batch_size',
+               default=10,
+               help='Number of instances whose info_cache is updated on '
+                    'each run of the info_cache self healing task'),
     ]
 
 interval_opts = [
@@ -123,6 +127,12 @@ interval_opts = [
                default=600,
                help='interval to sync power states between '
                     'the database and the hypervisor'),
+    cfg.IntOpt('power_state_event_lifetime',
+               default=0,
+               help='Number of seconds during which the power state '
+                    'reported by a hypervisor lifecycle event is trusted '
+                    'by the power state sync, instead of asking the '
+                    'hypervisor. Set to 0 to always ask the hypervisor.'),
     cfg.IntOpt("heal_instance_info_cache_interval",
                default=60,
                help="Number of seconds between instance info_cache self "
@@ -419,7 +429,7 @@ class ComputeVirtAPI(virtapi.VirtAPI):
 class ComputeManager(manager.SchedulerDependentManager):
     """Manages the running instances from creation to destruction."""
 
-    RPC_API_VERSION = '2.47'
+    RPC_API_VERSION = '2.48'
 
     def __init__(self, compute_driver=None, *args, **kwargs):
         """Load configuration options and connect to the hypervisor."""
@@ -440,6 +450,9 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.consoleauth_rpcapi = consoleauth.rpcapi.ConsoleAuthAPI()
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
         self._resource_tracker_dict = {}
+        # The last power state reported by a lifecycle event for each
+        # instance, with the time of the event.
+        self._event_power_states = {}
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -734,9 +747,6 @@ class ComputeManager(manager.SchedulerDependentManager):
         LOG.info(_("Lifecycle event %(state)d on VM %(uuid)s") %
                   {'state': event.get_transition(),
                    'uuid': event.get_instance_uuid()})
-        context = nova.context.get_admin_context()
-        instance = instance_obj.Instance.get_by_uuid(
-            context, event.get_instance_uuid())
         vm_power_state = None
         if event.get_transition() == virtevent.EVENT_LIFECYCLE_STOPPED:
             vm_power_state = power_state.SHUTDOWN
@@ -751,6 +761,11 @@ class ComputeManager(manager.SchedulerDependentManager):
                         event.get_transition())
 
         if vm_power_state is not None:
+            self._event_power_states[event.get_instance_uuid()] = (
+                vm_power_state, time.time())
+            context = nova.context.get_admin_context()
+            instance = instance_obj.Instance.get_by_uuid(
+                context, event.get_instance_uuid())
             self._sync_instance_power_state(context,
                                             instance,
                                             vm_power_state)
@@ -857,6 +872,22 @@ class ComputeManager(manager.SchedulerDependentManager):
             return self.driver.refresh_instance_security_rules(instance)
         return _sync_refresh()
 
+    @wrap_exception()
+    def cache_images(self, context, image_ids):
+        """Download images into the image cache of the driver, so that
+        instances are created from them without waiting for them.
+        """
+        for image_id in image_ids:
+            try:
+                self.driver.cache_image(context, image_id)
+            except NotImplementedError:
+                LOG.warn(_('The driver does not cache images'))
+                return
+            except Exception:
+                LOG.exception(_('Failed to cache image %s'), image_id)
+            else:
+                LOG.info(_('Cached image %s'), image_id)
+
     @wrap_exception()
     def refresh_provider_fw_rules(self, context):
         """This call passes straight through to the virtualization driver."""
@@ -1167,6 +1198,10 @@ class ComputeManager(manager.SchedulerDependentManager):
         if exc_info:
             # stringify to avoid circular ref problem in json serialization:
             retry['exc'] = traceback.format_exception(*exc_info)
+            # Lets the scheduler count the placements which failed because
+            # its view of the host resources was stale.
+            retry['claim_failed'] = isinstance(exc_info[1],
+                    exception.ComputeResourcesUnavailable)
 
         scheduler_method(context, *method_args)
         return True
@@ -4295,14 +4330,18 @@ class ComputeManager(manager.SchedulerDependentManager):
     @periodic_task.periodic_task
     def _heal_instance_info_cache(self, context):
         """Called periodically.  On every call, try to update the
-        info_cache's network information for another instance by
-        calling to the network manager.
+        info_cache's network information for the next batch of
+        heal_instance_info_cache_batch_size instances by calling to the
+        network API.
 
         This is implemented by keeping a cache of uuids of instances
-        that live on this host.  On each call, we pop one off of a
-        list, pull the DB record, and try the call to the network API.
-        If anything errors, we don't care.  It's possible the instance
-        has been deleted, etc.
+        that live on this host.  On each call, we pop a batch off of a
+        list, pull their DB records with one query, and get the network
+        info of all of them with one call to the network API.  When the
+        list is refilled, the instances without any network info in their
+        info_cache are put first, then the ones whose info_cache was
+        updated the longest time ago.  If anything errors, we don't care.
+        It's possible the instance has been deleted, etc.
         """
         heal_interval = CONF.heal_instance_info_cache_interval
         if not heal_interval:
@@ -4312,40 +4351,51 @@ class ComputeManager(manager.SchedulerDependentManager):
             return
         self._last_info_cache_heal = curr_time
 
+        batch_size = max(CONF.heal_instance_info_cache_batch_size, 1)
         instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
-        instance = None
-
-        while not instance or instance['host'] != self.host:
-            if instance_uuids:
-                try:
-                    instance = instance_obj.Instance.get_by_uuid(
-                        context, instance_uuids.pop(0),
-                        expected_attrs=['system_metadata'])
-                except exception.InstanceNotFound:
-                    # Instance is gone.  Try to grab another.
-                    continue
-            else:
-                # No more in our copy of uuids.  Pull from the DB.
-                db_instances = instance_obj.InstanceList.get_by_host(
-                    context, self.host, expected_attrs=[])
-                if not db_instances:
-                    # None.. just return.
-                    return
-                instance = db_instances[0]
-                instance_uuids = [inst['uuid'] for inst in db_instances[1:]]
-                self._instance_uuids_to_heal = instance_uuids
+        if not instance_uuids:
+            # No more in our copy of uuids.  Pull from the DB.
+            db_instances = instance_obj.InstanceList.get_by_host(
+                context, self.host, expected_attrs=['info_cache'])
+            db_instances = sorted(db_instances,
+                                  key=self._info_cache_heal_priority)
+            instance_uuids = [inst['uuid'] for inst in db_instances]
+            self._instance_uuids_to_heal = instance_uuids
+
+        instances = []
+        while not instances and instance_uuids:
+            batch_uuids = instance_uuids[:batch_size]
+            del instance_uuids[:batch_size]
+            filters = {'uuid': batch_uuids, 'deleted': False}
+            db_instances = instance_obj.InstanceList.get_by_filters(
+                context, filters,
+                expected_attrs=['system_metadata', 'info_cache'])
+            # Skip the instances which are gone or not ours anymore.
+            instances = [instance for instance in db_instances
+                         if instance['host'] == self.host]
+        if not instances:
+            return
 
-        # We have an instance now and it's ours
         try:
-            # Call to network API to get instance info.. this will
-            # force an update to the instance's info_cache
-            self._get_instance_nw_info(context, instance)
-            LOG.debug(_('Updated the info_cache for instance'),
-                      instance=instance)
+            # Call to network API to get the network info of the
+            # instances.. this will force an update to their info_cache
+            self.network_api.get_instance_nw_info_bulk(context, instances)
+            LOG.debug(_('Updated the info_cache of %d instances'),
+                      len(instances))
         except Exception:
             # We don't care about any failures
             pass
 
+    @staticmethod
+    def _info_cache_heal_priority(instance):
+        """Sort key putting the instances whose info_cache is empty first,
+        then the ones whose info_cache was updated the longest time ago.
+        """
+        info_cache = instance.info_cache
+        if not info_cache or not info_cache.network_info:
+            return (False, None)
+        return (True, info_cache.updated_at)
+
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
         if CONF.reboot_timeout > 0:
@@ -4549,26 +4599,27 @@ class ComputeManager(manager.SchedulerDependentManager):
                 return
 
             refreshed = timeutils.utcnow()
+            uuids = list(set(bw_ctr['uuid'] for bw_ctr in bw_counters))
+            usages = self._get_bw_usages(context, uuids, start_time)
+            prev_usages = None
+            bw_usages = []
             for bw_ctr in bw_counters:
-                # Allow switching of greenthreads between queries.
-                greenthread.sleep(0)
                 bw_in = 0
                 bw_out = 0
                 last_ctr_in = None
                 last_ctr_out = None
-                usage = self.conductor_api.bw_usage_get(context,
-                                                        bw_ctr['uuid'],
-                                                        start_time,
-                                                        bw_ctr['mac_address'])
+                usage = usages.get((bw_ctr['uuid'], bw_ctr['mac_address']))
                 if usage:
                     bw_in = usage['bw_in']
                     bw_out = usage['bw_out']
                     last_ctr_in = usage['last_ctr_in']
                     last_ctr_out = usage['last_ctr_out']
                 else:
-                    usage = self.conductor_api.bw_usage_get(
-                        context, bw_ctr['uuid'], prev_time,
-                        bw_ctr['mac_address'])
+                    if prev_usages is None:
+                        prev_usages = self._get_bw_usages(context, uuids,
+                                                          prev_time)
+                    usage = prev_usages.get((bw_ctr['uuid'],
+                                             bw_ctr['mac_address']))
                     if usage:
                         last_ctr_in = usage['last_ctr_in']
                         last_ctr_out = usage['last_ctr_out']
@@ -4587,16 +4638,28 @@ class ComputeManager(manager.SchedulerDependentManager):
                     else:
                         bw_out += (bw_ctr['bw_out'] - last_ctr_out)
 
-                self.conductor_api.bw_usage_update(context,
-                                                   bw_ctr['uuid'],
-                                                   bw_ctr['mac_address'],
-                                                   start_time,
-                                                   bw_in,
-                                                   bw_out,
-                                                   bw_ctr['bw_in'],
-                                                   bw_ctr['bw_out'],
-                                                   last_refreshed=refreshed,
-                                                   update_cells=update_cells)
+                bw_usages.append({'uuid': bw_ctr['uuid'],
+                                  'mac': bw_ctr['mac_address'],
+                                  'bw_in': bw_in,
+                                  'bw_out': bw_out,
+                                  'last_ctr_in': bw_ctr['bw_in'],
+                                  'last_ctr_out': bw_ctr['bw_out']})
+
+            if bw_usages:
+                self.conductor_api.bw_usage_update_all(
+                    context, start_time, bw_usages,
+                    last_refreshed=refreshed, update_cells=update_cells)
+
+    def _get_bw_usages(self, context, uuids, start_period):
+        """Returns the bandwidth usages of the instances in an audit period,
+        keyed by instance uuid and mac address.
+        """
+        if not uuids:
+            return {}
+        usages = self.conductor_api.bw_usage_get_by_uuids(context, uuids,
+                                                          start_period)
+        return dict(((usage['uuid'], usage['mac']), usage)
+                    for usage in usages)
 
     def _get_host_volume_bdms(self, context, host):
         """Return all block device mappings on a compute host."""
@@ -4658,7 +4721,15 @@ class ComputeManager(manager.SchedulerDependentManager):
         virtual machines known by the hypervisor and if the number matches the
         number of virtual machines known by the database, we proceed in a lazy
         loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        same power state as is in the database.  The power states of all the
+        instances are read from the hypervisor at once, and the instances
+        whose power state is already in sync are not read again from the
+        database.
+
+        When power_state_event_lifetime is set, the power state reported by
+        a recent lifecycle event is used instead of asking the hypervisor,
+        so only the instances without a recent event are read from the
+        hypervisor.
         """
         db_instances = instance_obj.InstanceList.get_by_host(context,
                                                              self.host)
@@ -4672,20 +4743,31 @@ class ComputeManager(manager.SchedulerDependentManager):
                      {'num_db_instances': num_db_instances,
                       'num_vm_instances': num_vm_instances})
 
+        self._expire_event_power_states(db_instances)
+
+        sync_instances = []
         for db_instance in db_instances:
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
                 continue
-            # No pending tasks. Now try to figure out the real vm_power_state.
+            sync_instances.append(db_instance)
+
+        # No pending tasks. Now try to figure out the real vm_power_states.
+        vm_power_states = dict(
+            (uuid, vm_power_state) for uuid, (vm_power_state, event_time)
+            in self._event_power_states.iteritems())
+        poll_instances = [db_instance for db_instance in sync_instances
+                          if db_instance['uuid'] not in vm_power_states]
+        if poll_instances:
+            vm_power_states.update(self._get_vm_power_states(poll_instances))
+        for db_instance in sync_instances:
+            if db_instance['uuid'] not in vm_power_states:
+                continue
+            vm_power_state = vm_power_states[db_instance['uuid']]
+            if self._power_state_in_sync(db_instance, vm_power_state):
+                continue
             try:
-                try:
-                    vm_instance = self.driver.get_info(db_instance)
-                    vm_power_state = vm_instance['state']
-                except exception.InstanceNotFound:
-                    vm_power_state = power_state.NOSTATE
-                # Note(maoy): the above get_info call might take a long time,
-                # for example, because of a broken libvirt driver.
                 try:
                     self._sync_instance_power_state(context,
                                                     db_instance,
@@ -4699,6 +4781,88 @@ class ComputeManager(manager.SchedulerDependentManager):
                                 "while processing an instance."),
                                 instance=db_instance)
 
+    def _expire_event_power_states(self, db_instances):
+        """Forget the power states reported by lifecycle events which are
+        older than power_state_event_lifetime, or which are about instances
+        no longer on this host.
+        """
+        uuids = set(db_instance['uuid'] for db_instance in db_instances)
+        for uuid, (vm_power_state, event_time) in (
+                self._event_power_states.items()):
+            if (uuid not in uuids or
+                    time.time() - event_time >=
+                    CONF.power_state_event_lifetime):
+                del self._event_power_states[uuid]
+
+    def _get_vm_power_states(self, db_instances):
+        """Returns a dict of the power states of the instances on the
+        hypervisor, keyed by instance uuid.
+
+        The instances missing from the hypervisor are in the NOSTATE power
+        state.  If the driver cannot list the instances at once, their power
+        states are read one instance at a time, and the instances whose power
+        state cannot be read are left out of the dict.
+        """
+        try:
+            vm_infos = self.driver.get_info_all(db_instances)
+            return dict((db_instance['uuid'],
+                         vm_infos.get(db_instance['uuid'],
+                                      {'state': power_state.NOSTATE})['state'])
+                        for db_instance in db_instances)
+        except Exception:
+            LOG.exception(_("Periodic sync_power_state task could not list "
+                            "the instances, reading them one at a time."))
+
+        vm_power_states = {}
+        for db_instance in db_instances:
+            try:
+                try:
+                    vm_instance = self.driver.get_info(db_instance)
+                    vm_power_state = vm_instance['state']
+                except exception.InstanceNotFound:
+                    vm_power_state = power_state.NOSTATE
+            except Exception:
+                LOG.exception(_("Periodic sync_power_state task had an error "
+                                "while processing an instance."),
+                                instance=db_instance)
+                continue
+            vm_power_states[db_instance['uuid']] = vm_power_state
+        return vm_power_states
+
+    def _power_state_matches_vm_state(self, vm_state, vm_power_state):
+        """Returns True if the power state on the hypervisor is a rational
+        one for the vm_state, so there is no discrepancy to resolve.
+        """
+        # Note(maoy): we go through all possible vm_states.
+        if vm_state in (vm_states.BUILDING,
+                        vm_states.RESCUED,
+                        vm_states.RESIZED,
+                        vm_states.SUSPENDED,
+                        vm_states.PAUSED,
+                        vm_states.ERROR):
+            # TODO(maoy): we ignore these vm_state for now.
+            return True
+        elif vm_state == vm_states.ACTIVE:
+            # The only rational power state should be RUNNING
+            return vm_power_state == power_state.RUNNING
+        elif vm_state == vm_states.STOPPED:
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED)
+        elif vm_state in (vm_states.SOFT_DELETED,
+                          vm_states.DELETED):
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN)
+        return False
+
+    def _power_state_in_sync(self, db_instance, vm_power_state):
+        """Returns True if _sync_instance_power_state would have nothing to
+        do for the instance, as last read from the database.
+        """
+        return (db_instance['power_state'] == vm_power_state and
+                self._power_state_matches_vm_state(db_instance['vm_state'],
+                                                   vm_power_state))
+
     def _sync_instance_power_state(self, context, db_instance, vm_power_state):
         """Align instance power state between the database and hypervisor.
 
@@ -4743,18 +4907,12 @@ class ComputeManager(manager.SchedulerDependentManager):
             db_instance.save()
             db_power_state = vm_power_state
 
+        if self._power_state_matches_vm_state(vm_state, vm_power_state):
+            return
+
         # Note(maoy): Now resolve the discrepancy between vm_state and
-        # vm_power_state. We go through all possible vm_states.
-        if vm_state in (vm_states.BUILDING,
-                        vm_states.RESCUED,
-                        vm_states.RESIZED,
-                        vm_states.SUSPENDED,
-                        vm_states.PAUSED,
-                        vm_states.ERROR):
-            # TODO(maoy): we ignore these vm_state for now.
-            pass
-        elif vm_state == vm_states.ACTIVE:
-            # The only rational power state should be RUNNING
+        # vm_power_state.
+        if vm_state == vm_states.ACTIVE:
             if vm_power_state in (power_state.SHUTDOWN,
                                   power_state.CRASHED):
                 LOG.warn(_("Instance shutdown by itself. Calling "
@@ -4798,28 +4956,23 @@ class ComputeManager(manager.SchedulerDependentManager):
                 LOG.warn(_("Instance is unexpectedly not found. Ignore."),
                          instance=db_instance)
         elif vm_state == vm_states.STOPPED:
-            if vm_power_state not in (power_state.NOSTATE,
-                                      power_state.SHUTDOWN,
-                                      power_state.CRASHED):
-                LOG.warn(_("Instance is not stopped. Calling "
-                           "the stop API."), instance=db_instance)
-                try:
-                    # NOTE(russellb) Force the stop, because normally the
-                    # compute API would not allow an attempt to stop a stopped
-                    # instance.
-                    self.compute_api.force_stop(context, db_instance)
-                except Exception:
-                    LOG.exception(_("error during stop() in "
-                                    "sync_power_state."),
-                                  instance=db_instance)
+            LOG.warn(_("Instance is not stopped. Calling "
+                       "the stop API."), instance=db_instance)
+            try:
+                # NOTE(russellb) Force the stop, because normally the
+                # compute API would not allow an attempt to stop a stopped
+                # instance.
+                self.compute_api.force_stop(context, db_instance)
+            except Exception:
+                LOG.exception(_("error during stop() in "
+                                "sync_power_state."),
+                              instance=db_instance)
         elif vm_state in (vm_states.SOFT_DELETED,
                           vm_states.DELETED):
-            if vm_power_state not in (power_state.NOSTATE,
-                                      power_state.SHUTDOWN):
-                # Note(maoy): this should be taken care of periodically in
-                # _cleanup_running_deleted_instances().
-                LOG.warn(_("Instance is not (soft-)deleted."),
-                         instance=db_instance)
+            # Note(maoy): this should be taken care of periodically in
+            # _cleanup_running_deleted_instances().
+            LOG.warn(_("Instance is not (soft-)deleted."),
+                     instance=db_instance)
 
     @periodic_task.periodic_task
     def _reclaim_queued_deletes(self, context):
@@ -4947,15 +5100,31 @@ class ComputeManager(manager.SchedulerDependentManager):
                                     instance=instance)
 
     def _running_deleted_instances(self, context):
-        """Returns a list of instances nova thinks is deleted,
+        """Iterates over the instances nova thinks is deleted,
         but the hypervisor thinks is still running.
+
+        The deleted instances of the host are read a batch at a time, as
+        they pile up over time.
         """
         timeout = CONF.running_deleted_instance_timeout
         filters = {'deleted': True,
                    'soft_deleted': False,
                    'host': self.host}
-        instances = self._get_instances_on_driver(context, filters)
-        return [i for i in instances if self._deleted_old_enough(i, timeout)]
+        driver_names = None
+        try:
+            filters['uuid'] = self.driver.list_instance_uuids()
+        except NotImplementedError:
+            # The driver doesn't support uuids listing, so we'll have
+            # to match the instances by name.
+            driver_names = set(self.driver.list_instances())
+        instances = instance_obj.InstanceList.iter_by_filters(context,
+                                                              filters)
+        for instance in instances:
+            if driver_names is not None and (
+                    instance['name'] not in driver_names):
+                continue
+            if self._deleted_old_enough(instance, timeout):
+                yield instance
 
     def _deleted_old_enough(self, instance, timeout):
         deleted_at = instance['deleted_at']
@@ -291,12 +291,18 @@ class ResourceTracker(object):
             self.pci_tracker.set_hvdevs(jsonutils.loads(resources.pop(
                 'pci_passthrough_devices')))
 
+        cached_images = resources.pop('cached_images', [])
+
         # Grab all instances assigned to this node:
         instances = instance_obj.InstanceList.get_by_host_and_node(
             context, self.host, self.nodename)
 
         # Now calculate usage based on instance utilization:
         self._update_usage_from_instances(resources, instances)
+        self.stats.update_stats_for_cached_images(cached_images)
+        # The stats are only set per instance, so set them here too for the
+        # cached images of the hosts without instances to be reported.
+        resources['stats'] = self.stats
 
         # Grab all in-progress migrations:
         capi = self.conductor_api
@@ -202,6 +202,7 @@ class ComputeAPI(rpcclient.RpcProxy):
         2.45 - Made resize_instance() take new-world objects
         2.46 - Made finish_resize() take new-world objects
         2.47 - Made finish_revert_resize() take new-world objects
+        2.48 - Add cache_images()
     '''
 
     #
@@ -267,6 +268,10 @@ class ComputeAPI(rpcclient.RpcProxy):
                    instance=instance_p, volume_id=volume_id,
                    mountpoint=mountpoint)
 
+    def cache_images(self, ctxt, host, image_ids):
+        cctxt = self.client.prepare(server=host, version='2.48')
+        cctxt.cast(ctxt, 'cache_images', image_ids=image_ids)
+
     def change_instance_metadata(self, ctxt, instance, diff):
         instance_p = jsonutils.to_primitive(instance)
         cctxt = self.client.prepare(server=_compute_host(None, instance))
@@ -160,6 +160,17 @@ class LocalAPI(object):
                                              last_refreshed,
                                              update_cells=update_cells)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        return self._manager.bw_usage_get_by_uuids(context, uuids,
+                                                   start_period)
+
+    def bw_usage_update_all(self, context, start_period, bw_usages,
+                            last_refreshed=None, update_cells=True):
+        return self._manager.bw_usage_update_all(context, start_period,
+                                                 bw_usages,
+                                                 last_refreshed=last_refreshed,
+                                                 update_cells=update_cells)
+
     def security_group_get_by_instance(self, context, instance):
         return self._manager.security_group_get_by_instance(context, instance)
 
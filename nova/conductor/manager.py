@@ -74,7 +74,7 @@ class ConductorManager(manager.Manager):
     namespace.  See the ComputeTaskManager class for details.
     """
 
-    RPC_API_VERSION = '1.58'
+    RPC_API_VERSION = '1.59'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -248,6 +248,16 @@ class ConductorManager(manager.Manager):
         usage = self.db.bw_usage_get(context, uuid, start_period, mac)
         return jsonutils.to_primitive(usage)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        usages = self.db.bw_usage_get_by_uuids(context, uuids, start_period)
+        return jsonutils.to_primitive(usages)
+
+    def bw_usage_update_all(self, context, start_period, bw_usages,
+                            last_refreshed=None, update_cells=True):
+        self.db.bw_usage_update_all(context, start_period, bw_usages,
+                                    last_refreshed=last_refreshed,
+                                    update_cells=update_cells)
+
     # NOTE(russellb) This method can be removed in 2.0 of this API.  It is
     # deprecated in favor of the method in the base API.
     def get_backdoor_port(self, context):
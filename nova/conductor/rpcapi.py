@@ -110,6 +110,7 @@ class ConductorAPI(rpcclient.RpcProxy):
                   migration_get_unconfirmed_by_dest_compute
     1.57 - Remove migration_create()
     1.58 - Remove migration_get()
+    1.59 - Added bw_usage_get_by_uuids and bw_usage_update_all
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -229,6 +230,19 @@ class ConductorAPI(rpcclient.RpcProxy):
         cctxt = self.client.prepare(version=version)
         return cctxt.call(context, 'bw_usage_update', **msg_kwargs)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        cctxt = self.client.prepare(version='1.59')
+        return cctxt.call(context, 'bw_usage_get_by_uuids',
+                          uuids=uuids, start_period=start_period)
+
+    def bw_usage_update_all(self, context, start_period, bw_usages,
+                            last_refreshed=None, update_cells=True):
+        cctxt = self.client.prepare(version='1.59')
+        return cctxt.call(context, 'bw_usage_update_all',
+                          start_period=start_period, bw_usages=bw_usages,
+                          last_refreshed=last_refreshed,
+                          update_cells=update_cells)
+
     def security_group_get_by_instance(self, context, instance):
         instance_p = jsonutils.to_primitive(instance)
         cctxt = self.client.prepare(version='1.8')
@@ -62,6 +62,10 @@ db_opts = [
     cfg.StrOpt('snapshot_name_template',
                default='snapshot-%s',
                help='Template string to be used to generate snapshot names'),
+    cfg.IntOpt('instance_iter_batch_size',
+               default=100,
+               help='Number of instances read from the database at a time '
+                    'by the tasks iterating over many instances'),
     ]
 
 CONF = cfg.CONF
@@ -198,6 +202,19 @@ def compute_node_get_all(context, no_date_fields=False):
     return IMPL.compute_node_get_all(context, no_date_fields)
 
 
+def compute_node_get_all_changed_since(context, changed_since):
+    """Get the computeNodes created, updated or deleted since a given time.
+
+    A computeNode is also returned when its service changed.  Deleted
+    computeNodes are included, with a non-zero 'deleted' field.
+
+    :returns: List of dictionaries in the same format as
+              compute_node_get_all(), the 'service' of a computeNode being
+              None when the service was deleted.
+    """
+    return IMPL.compute_node_get_all_changed_since(context, changed_since)
+
+
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     """Get computeNodes given a hypervisor hostname match string."""
     return IMPL.compute_node_search_by_hypervisor(context, hypervisor_match)
@@ -625,6 +642,38 @@ def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                             columns_to_join=columns_to_join)
 
 
+def instance_get_batch_by_filters(context, filters, last_id=None, limit=None,
+                                  columns_to_join=None):
+    """Get the instances that match all filters with an id greater than
+    last_id, ordered by id.
+    """
+    return IMPL.instance_get_batch_by_filters(context, filters,
+                                              last_id=last_id, limit=limit,
+                                              columns_to_join=columns_to_join)
+
+
+def instance_get_all_by_filters_iter(context, filters, batch_size=None,
+                                     columns_to_join=None):
+    """Iterate over all instances that match all filters, ordered by id.
+
+    The instances are read batch_size at a time, each batch starting after
+    the id of the last instance of the previous one, so that the instances
+    do not all have to be held in memory at once.
+    """
+    if batch_size is None:
+        batch_size = CONF.instance_iter_batch_size
+    last_id = None
+    while True:
+        instances = instance_get_batch_by_filters(
+                context, filters, last_id=last_id, limit=batch_size,
+                columns_to_join=columns_to_join)
+        for instance in instances:
+            yield instance
+        if len(instances) < batch_size:
+            return
+        last_id = instances[-1]['id']
+
+
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
     """Get instances and joins active during a certain time window.
@@ -651,6 +700,11 @@ def instance_get_all_by_host_and_not_type(context, host, type_id=None):
     return IMPL.instance_get_all_by_host_and_not_type(context, host, type_id)
 
 
+def instance_get_hosts_by_not_type(context, type_id=None):
+    """Get the hosts running instances with a different type_id."""
+    return IMPL.instance_get_hosts_by_not_type(context, type_id)
+
+
 def instance_get_floating_address(context, instance_id):
     """Get the first floating ip address of an instance."""
     return IMPL.instance_get_floating_address(context, instance_id)
@@ -1166,6 +1220,12 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    """Get all block device mapping belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(
+        context, instance_uuids)
+
+
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
     """Get block device mapping for a given volume."""
@@ -1648,6 +1708,25 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
     return rv
 
 
+def bw_usage_update_all(context, start_period, bw_usages,
+                        last_refreshed=None, update_cells=True):
+    """Update cached bandwidth usages in a given audit period.
+
+    bw_usages is a list of dicts with the uuid, mac, bw_in, bw_out,
+    last_ctr_in and last_ctr_out of each usage.  Creates new records if
+    needed.
+    """
+    rv = IMPL.bw_usage_update_all(context, start_period, bw_usages,
+                                  last_refreshed=last_refreshed)
+    if update_cells:
+        try:
+            cells_rpcapi.CellsAPI().bw_usages_update_at_top(context,
+                    start_period, bw_usages, last_refreshed)
+        except Exception:
+            LOG.exception(_("Failed to notify cells of bw_usage update"))
+    return rv
+
+
 ###################
 
 
@@ -1682,6 +1761,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by the provided uuids."""
+    return IMPL.s3_image_get_all_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     return IMPL.s3_image_create(context, image_uuid)
@@ -1848,6 +1932,13 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return IMPL.get_ec2_instance_id_by_uuid(context, instance_id)
 
 
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    """Get the ec2 ids of instance uuids from instance_id_mappings table,
+    as a dict keyed by uuid.
+    """
+    return IMPL.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+
+
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     """Get uuid through ec2 id from instance_id_mappings table."""
     return IMPL.get_instance_uuid_by_ec2_id(context, ec2_id)
@@ -1906,20 +1997,22 @@ def task_log_get(context, task_name, period_beginning,
 ####################
 
 
-def archive_deleted_rows(context, max_rows=None):
+def archive_deleted_rows(context, max_rows=None, sleep=0):
     """Move up to max_rows rows from production tables to corresponding shadow
-    tables.
+    tables, waiting sleep seconds after each batch of rows moved.
 
     :returns: number of rows archived.
     """
-    return IMPL.archive_deleted_rows(context, max_rows=max_rows)
+    return IMPL.archive_deleted_rows(context, max_rows=max_rows, sleep=sleep)
 
 
-def archive_deleted_rows_for_table(context, tablename, max_rows=None):
+def archive_deleted_rows_for_table(context, tablename, max_rows=None,
+                                   sleep=0):
     """Move up to max_rows rows from tablename to corresponding shadow
-    table.
+    table, waiting sleep seconds after each batch of rows moved.
 
     :returns: number of rows archived.
     """
     return IMPL.archive_deleted_rows_for_table(context, tablename,
-                                               max_rows=max_rows)
+                                               max_rows=max_rows,
+                                               sleep=sleep)
@@ -86,6 +86,10 @@ get_session = db_session.get_session
 
 
 _SHADOW_TABLE_PREFIX = 'shadow_'
+# Number of deleted rows archived per transaction
+_ARCHIVE_BATCH_SIZE = 1000
+# The engine and schema reflected by archive_deleted_rows
+_archive_metadata = None
 _DEFAULT_QUOTA_NAME = 'default'
 PER_PROJECT_QUOTAS = ['fixed_ips', 'floating_ips', 'networks']
 
@@ -586,6 +590,61 @@ def compute_node_get_all(context, no_date_fields):
     return compute_nodes
 
 
+def compute_node_get_all_changed_since(context, changed_since):
+    engine = get_engine()
+
+    compute_node = models.ComputeNode.__table__
+    service = models.Service.__table__
+    stat = models.ComputeNodeStat.__table__
+
+    def changed(table):
+        # soft_delete() keeps updated_at untouched, so deleted rows have
+        # to be found by their deleted_at.
+        return or_(table.c.created_at >= changed_since,
+                   table.c.updated_at >= changed_since,
+                   table.c.deleted_at >= changed_since)
+
+    with engine.begin() as conn:
+        # A compute node has to be returned when its service changed as well,
+        # e.g. on every service heartbeat or when it gets disabled.
+        changed_service_ids = select([service.c.id]).\
+                                where((service.c.binary == 'nova-compute') &
+                                      changed(service))
+        compute_node_query = select([compute_node]).\
+                                where(changed(compute_node) |
+                                      compute_node.c.service_id.in_(
+                                          changed_service_ids))
+        compute_node_rows = conn.execute(compute_node_query).fetchall()
+        if not compute_node_rows:
+            return []
+
+        service_ids = set(row['service_id'] for row in compute_node_rows)
+        service_query = select([service]).\
+                            where((service.c.deleted == 0) &
+                                  (service.c.binary == 'nova-compute') &
+                                  service.c.id.in_(service_ids))
+        service_rows = conn.execute(service_query).fetchall()
+
+        compute_node_ids = [row['id'] for row in compute_node_rows]
+        stat_query = select([stat]).\
+                        where((stat.c.deleted == 0) &
+                              stat.c.compute_node_id.in_(compute_node_ids))
+        stat_rows = conn.execute(stat_query).fetchall()
+
+    services = dict((row['id'], dict(row.items())) for row in service_rows)
+    stats = collections.defaultdict(list)
+    for row in stat_rows:
+        stats[row['compute_node_id']].append(dict(row.items()))
+
+    compute_nodes = []
+    for row in compute_node_rows:
+        node = dict(row.items())
+        node['service'] = services.get(row['service_id'])
+        node['stats'] = stats[row['id']]
+        compute_nodes.append(node)
+    return compute_nodes
+
+
 @require_admin_context
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
@@ -1839,6 +1898,54 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
 
     session = get_session()
 
+    query_prefix, manual_joins = _instance_get_all_by_filters_query(
+            context, filters, session, columns_to_join)
+    query_prefix = query_prefix.order_by(sort_fn[sort_dir](
+            getattr(models.Instance, sort_key)))
+
+    # paginate query
+    if marker is not None:
+        try:
+            marker = _instance_get_by_uuid(context, marker, session=session)
+        except exception.InstanceNotFound:
+            raise exception.MarkerNotFound(marker)
+    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
+                           models.Instance, limit,
+                           [sort_key, 'created_at', 'id'],
+                           marker=marker,
+                           sort_dir=sort_dir)
+
+    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+
+
+@require_context
+def instance_get_batch_by_filters(context, filters, last_id=None, limit=None,
+                                  columns_to_join=None):
+    """Return the instances matching filters whose id is greater than
+    last_id, ordered by id.
+
+    Unlike the marker of instance_get_all_by_filters, last_id does not
+    need to match an existing instance, so that batches can be read one
+    after the other while instances are deleted.
+    """
+    session = get_session()
+
+    query_prefix, manual_joins = _instance_get_all_by_filters_query(
+            context, filters, session, columns_to_join)
+    if last_id is not None:
+        query_prefix = query_prefix.filter(models.Instance.id > last_id)
+    query_prefix = query_prefix.order_by(asc(models.Instance.id))
+    if limit is not None:
+        query_prefix = query_prefix.limit(limit)
+
+    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+
+
+def _instance_get_all_by_filters_query(context, filters, session,
+                                       columns_to_join):
+    """Return the query of the instances matching filters, and the columns
+    to join after running it.
+    """
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
         manual_joins = ['metadata', 'system_metadata']
@@ -1849,9 +1956,6 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     for column in columns_to_join:
         query_prefix = query_prefix.options(joinedload(column))
 
-    query_prefix = query_prefix.order_by(sort_fn[sort_dir](
-            getattr(models.Instance, sort_key)))
-
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
     filters = filters.copy()
@@ -1912,19 +2016,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               models.InstanceMetadata.instance_uuid,
                               filters)
 
-    # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
-
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return query_prefix, manual_joins
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2085,6 +2177,18 @@ def instance_get_all_by_host_and_not_type(context, host, type_id=None):
                    filter(models.Instance.instance_type_id != type_id).all())
 
 
+@require_admin_context
+def instance_get_hosts_by_not_type(context, type_id=None):
+    hosts = []
+    for result in model_query(context, models.Instance.host,
+                              base_model=models.Instance).\
+            filter(models.Instance.host != None).\
+            filter(models.Instance.instance_type_id != type_id).\
+            distinct():
+        hosts.append(result[0])
+    return hosts
+
+
 # NOTE(jkoelker) This is only being left here for compat with floating
 #                ips. Currently the network_api doesn't return floaters
 #                in network_info. Once it starts return the model. This
@@ -3520,6 +3624,16 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                        instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
@@ -4741,6 +4855,63 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
             pass
 
 
+@require_context
+@_retry_on_deadlock
+def bw_usage_update_all(context, start_period, bw_usages,
+                        last_refreshed=None):
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    try:
+        _bw_usage_update_all(context, start_period, bw_usages,
+                             last_refreshed)
+    except db_exc.DBDuplicateEntry:
+        # Another greenthread created some of the usage entries at the
+        # same time.  They exist now, so update them instead.
+        _bw_usage_update_all(context, start_period, bw_usages,
+                             last_refreshed)
+
+
+def _bw_usage_update_all(context, start_period, bw_usages, last_refreshed):
+    session = get_session()
+
+    # Read the keys of the existing records once, then update those and
+    # create the missing ones in the same transaction.
+    with session.begin():
+        uuids = set(bw_usage['uuid'] for bw_usage in bw_usages)
+        existing = set()
+        if uuids:
+            query = model_query(context, models.BandwidthUsage.uuid,
+                                models.BandwidthUsage.mac,
+                                base_model=models.BandwidthUsage,
+                                session=session, read_deleted="yes").\
+                            filter(models.BandwidthUsage.uuid.in_(uuids)).\
+                            filter_by(start_period=start_period)
+            existing = set((row.uuid, row.mac) for row in query.all())
+
+        for bw_usage in bw_usages:
+            values = {'last_refreshed': last_refreshed,
+                      'last_ctr_in': bw_usage['last_ctr_in'],
+                      'last_ctr_out': bw_usage['last_ctr_out'],
+                      'bw_in': bw_usage['bw_in'],
+                      'bw_out': bw_usage['bw_out']}
+            if (bw_usage['uuid'], bw_usage['mac']) in existing:
+                model_query(context, models.BandwidthUsage,
+                            session=session, read_deleted="yes").\
+                        filter_by(start_period=start_period).\
+                        filter_by(uuid=bw_usage['uuid']).\
+                        filter_by(mac=bw_usage['mac']).\
+                        update(values, synchronize_session=False)
+                continue
+
+            bwusage = models.BandwidthUsage()
+            bwusage.update(values)
+            bwusage.start_period = start_period
+            bwusage.uuid = bw_usage['uuid']
+            bwusage.mac = bw_usage['mac']
+            session.add(bwusage)
+
+
 ####################
 
 
@@ -4889,6 +5060,15 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by the provided uuids."""
+    if not image_uuids:
+        return []
+    return model_query(context, models.S3Image, read_deleted="yes").\
+                 filter(models.S3Image.uuid.in_(image_uuids)).\
+                 all()
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     try:
@@ -5388,6 +5568,17 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return result['id']
 
 
+@require_context
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return {}
+    result = _ec2_instance_get_query(context).\
+                    filter(models.InstanceIdMapping.uuid.in_(
+                           instance_uuids)).\
+                    all()
+    return dict((mapping['uuid'], mapping['id']) for mapping in result)
+
+
 @require_context
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     result = _ec2_instance_get_query(context).\
@@ -5490,79 +5681,209 @@ def _get_default_deleted_value(table):
         return None
 
 
+def _archive_rows_by_keys(conn, table, shadow_table, column, shadow_column,
+                          deleted, keys):
+    """Move the deleted rows of table whose keys are in the sorted list keys
+    to shadow_table, in one transaction.
+
+    When a foreign key constraint keeps some of the rows from being
+    deleted, the keys are split in halves which are archived separately,
+    until only the rows still referenced are left behind.
+
+    :returns: numbers of rows archived and skipped
+    """
+    # Imported here as nova.db.sqlalchemy.utils imports this module.
+    from nova.db.sqlalchemy import utils as db_utils
+
+    first_key = keys[0]
+    last_key = keys[-1]
+    in_range = and_(deleted, column >= first_key, column <= last_key)
+
+    # The shadow table may not list its columns in the same order.
+    columns = [table.c[shadow_table_column.name]
+               for shadow_table_column in shadow_table.c]
+    insert_statement = db_utils.InsertFromSelect(shadow_table,
+                                                 select(columns, in_range))
+    # Only delete the rows which made it to the shadow table, in case
+    # some were deleted in between.
+    archived_keys = select([shadow_column],
+                           and_(shadow_column >= first_key,
+                                shadow_column <= last_key))
+    delete_statement = table.delete(and_(in_range,
+                                         column.in_(archived_keys)))
+    try:
+        # Group the insert and delete in a transaction.
+        with conn.begin():
+            conn.execute(insert_statement)
+            result = conn.execute(delete_statement)
+    except IntegrityError:
+        # A foreign key constraint keeps us from deleting some of
+        # these rows until we clean up a dependent table.
+        if len(keys) == 1:
+            LOG.debug(_("Foreign key constraint failure archiving deleted "
+                        "row %(key)s of %(table)s, skipping it"),
+                      {'key': first_key, 'table': table.name})
+            return 0, 1
+        middle = len(keys) // 2
+        first_archived, first_skipped = _archive_rows_by_keys(
+            conn, table, shadow_table, column, shadow_column, deleted,
+            keys[:middle])
+        last_archived, last_skipped = _archive_rows_by_keys(
+            conn, table, shadow_table, column, shadow_column, deleted,
+            keys[middle:])
+        return (first_archived + last_archived,
+                first_skipped + last_skipped)
+    return result.rowcount, 0
+
+
+def _archive_deleted_rows_for_table(conn, table, shadow_table, max_rows,
+                                    sleep=0):
+    """Move up to max_rows deleted rows of table to shadow_table, all of
+    them when max_rows is None.
+
+    The rows are moved in batches of at most _ARCHIVE_BATCH_SIZE rows, each
+    with an INSERT ... SELECT and a DELETE run on the database server in a
+    transaction of its own.  Only the keys of the rows are returned to
+    Python, to delimit the batches.  The rows still referenced by other
+    rows are left behind.  Each batch which archived rows is followed by a
+    pause of sleep seconds, to let the replicas catch up.
+
+    :returns: number of rows archived
+    """
+    if max_rows is not None and max_rows <= 0:
+        return 0
+    try:
+        column = table.c.id
+        shadow_column = shadow_table.c.id
+    except AttributeError:
+        # We have one table (dns_domains) where the key is called
+        # "domain" rather than "id"
+        column = table.c.domain
+        shadow_column = shadow_table.c.domain
+    deleted = table.c.deleted != _get_default_deleted_value(table)
+
+    rows_archived = 0
+    rows_skipped = 0
+    last_key = None
+    while max_rows is None or rows_archived < max_rows:
+        batch_size = _ARCHIVE_BATCH_SIZE
+        if max_rows is not None:
+            batch_size = min(batch_size, max_rows - rows_archived)
+        query = select([column], deleted)
+        if last_key is not None:
+            # Move on past the rows which could not be archived.
+            query = query.where(column > last_key)
+        keys = [row[0] for row in
+                conn.execute(query.order_by(column).limit(batch_size))]
+        if not keys:
+            break
+        archived, skipped = _archive_rows_by_keys(conn, table, shadow_table,
+                                                  column, shadow_column,
+                                                  deleted, keys)
+        rows_archived += archived
+        rows_skipped += skipped
+        last_key = keys[-1]
+        if archived and sleep:
+            time.sleep(sleep)
+
+    if rows_skipped:
+        LOG.warning(_("Skipped %(rows)d deleted rows of %(table)s which "
+                      "other rows still reference"),
+                    {'rows': rows_skipped, 'table': table.name})
+    return rows_archived
+
+
+def _get_archive_metadata(engine):
+    """Returns the reflected schema of the database of engine.
+
+    The schema is only reflected once, rather than for each batch of rows
+    archived.
+    """
+    global _archive_metadata
+    if _archive_metadata is None or _archive_metadata[0] is not engine:
+        metadata = MetaData()
+        metadata.reflect(bind=engine)
+        _archive_metadata = (engine, metadata)
+    return _archive_metadata[1]
+
+
 @require_admin_context
-def archive_deleted_rows_for_table(context, tablename, max_rows):
+def archive_deleted_rows_for_table(context, tablename, max_rows, sleep=0):
     """Move up to max_rows rows from one tables to the corresponding
-    shadow table.
+    shadow table, waiting sleep seconds after each batch.
 
     :returns: number of rows archived
     """
     # The context argument is only used for the decorator.
     engine = get_engine()
-    conn = engine.connect()
     metadata = MetaData()
     metadata.bind = engine
     table = Table(tablename, metadata, autoload=True)
-    default_deleted_value = _get_default_deleted_value(table)
     shadow_tablename = _SHADOW_TABLE_PREFIX + tablename
-    rows_archived = 0
     try:
         shadow_table = Table(shadow_tablename, metadata, autoload=True)
     except NoSuchTableError:
         # No corresponding shadow table; skip it.
-        return rows_archived
-    # Group the insert and delete in a transaction.
-    with conn.begin():
-        # TODO(dripton): It would be more efficient to insert(select) and then
-        # delete(same select) without ever returning the selected rows back to
-        # Python.  sqlalchemy does not support that directly, but we have
-        # nova.db.sqlalchemy.utils.InsertFromSelect for the insert side.  We
-        # need a corresponding function for the delete side.
-        try:
-            column = table.c.id
-            column_name = "id"
-        except AttributeError:
-            # We have one table (dns_domains) where the key is called
-            # "domain" rather than "id"
-            column = table.c.domain
-            column_name = "domain"
-        query = select([table],
-                       table.c.deleted != default_deleted_value).\
-                       order_by(column).limit(max_rows)
-        rows = conn.execute(query).fetchall()
-        if rows:
-            keys = [getattr(row, column_name) for row in rows]
-            delete_statement = table.delete(column.in_(keys))
-            try:
-                result = conn.execute(delete_statement)
-            except IntegrityError:
-                # A foreign key constraint keeps us from deleting some of
-                # these rows until we clean up a dependent table.  Just
-                # skip this table for now; we'll come back to it later.
-                return rows_archived
-            insert_statement = shadow_table.insert()
-            conn.execute(insert_statement, rows)
-            rows_archived = result.rowcount
-    return rows_archived
+        return 0
+    conn = engine.connect()
+    try:
+        return _archive_deleted_rows_for_table(conn, table, shadow_table,
+                                               max_rows, sleep=sleep)
+    finally:
+        conn.close()
 
 
 @require_admin_context
-def archive_deleted_rows(context, max_rows=None):
+def archive_deleted_rows(context, max_rows=None, sleep=0):
     """Move up to max_rows rows from production tables to the corresponding
-    shadow tables.
+    shadow tables, waiting sleep seconds after each batch.
+
+    The tables are archived in foreign key dependency order, the tables
+    referencing others first, so that the rows they reference can be
+    archived in the same run.
 
     :returns: Number of rows archived.
     """
     # The context argument is only used for the decorator.
-    tablenames = []
+    engine = get_engine()
+    metadata = _get_archive_metadata(engine)
+    tablenames = set()
     for model_class in models.__dict__.itervalues():
         if hasattr(model_class, "__tablename__"):
-            tablenames.append(model_class.__tablename__)
+            tablenames.add(model_class.__tablename__)
+    conn = engine.connect()
+    try:
+        return _archive_deleted_rows(conn, metadata, tablenames, max_rows,
+                                     sleep)
+    finally:
+        conn.close()
+
+
+def _archive_deleted_rows(conn, metadata, tablenames, max_rows, sleep):
     rows_archived = 0
-    for tablename in tablenames:
-        rows_archived += archive_deleted_rows_for_table(context, tablename,
-                                         max_rows=max_rows - rows_archived)
-        if rows_archived >= max_rows:
+    # sorted_tables lists the referenced tables before the ones
+    # referencing them.
+    for table in reversed(metadata.sorted_tables):
+        shadow_table = metadata.tables.get(_SHADOW_TABLE_PREFIX + table.name)
+        if table.name not in tablenames or shadow_table is None:
+            continue
+        if max_rows is None:
+            table_max_rows = None
+        else:
+            table_max_rows = max_rows - rows_archived
+        start = time.time()
+        table_rows = _archive_deleted_rows_for_table(conn, table,
+                                                     shadow_table,
+                                                     table_max_rows,
+                                                     sleep=sleep)
+        if table_rows:
+            elapsed = max(time.time() - start, 0.001)
+            LOG.info(_("Archived %(rows)d deleted rows of %(table)s in "
+                       "%(elapsed).2f seconds (%(rate)d rows/s)"),
+                     {'rows': table_rows, 'table': table.name,
+                      'elapsed': elapsed, 'rate': table_rows / elapsed})
+        rows_archived += table_rows
+        if max_rows is not None and rows_archived >= max_rows:
             break
     return rows_archived
 
@@ -17,6 +17,8 @@
 Filter support
 """
 
+import time
+
 from nova import loadables
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
@@ -64,6 +66,37 @@ class BaseFilterHandler(loadables.BaseLoader):
     This class should be subclassed where one needs to use filters.
     """
 
+    def __init__(self, *args, **kwargs):
+        super(BaseFilterHandler, self).__init__(*args, **kwargs)
+        self.filter_stats = {}
+
+    def add_filter_stats(self, cls_name, start, num_in, num_out):
+        """Account a run of a filter, started at time start, which got
+        num_in objects and kept num_out of them.  Returns the time the
+        filter took.
+        """
+        elapsed = time.time() - start
+        stats = self.filter_stats.get(cls_name)
+        if stats is None:
+            stats = {'calls': 0, 'time': 0.0, 'objs_in': 0, 'objs_out': 0}
+            self.filter_stats[cls_name] = stats
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['objs_in'] += num_in
+        stats['objs_out'] += num_out
+        return elapsed
+
+    def get_filter_stats(self):
+        """Returns the number of runs, the total time and the total number
+        of objects in and out of each filter, by filter class name.
+        """
+        return dict((cls_name, dict(stats))
+                    for cls_name, stats in self.filter_stats.iteritems())
+
+    def reset_filter_stats(self):
+        """Forget the runs of the filters accounted so far."""
+        self.filter_stats = {}
+
     def get_filtered_objects(self, filter_classes, objs,
             filter_properties, index=0):
         list_objs = list(objs)
@@ -73,16 +106,22 @@ class BaseFilterHandler(loadables.BaseLoader):
             filter = filter_cls()
 
             if filter.run_filter_for_index(index):
+                start = time.time()
+                num_in = len(list_objs)
                 objs = filter.filter_all(list_objs,
                                                filter_properties)
                 if objs is None:
+                    self.add_filter_stats(cls_name, start, num_in, 0)
                     LOG.debug(_("Filter %(cls_name)s says to stop filtering"),
                           {'cls_name': cls_name})
                     return
                 list_objs = list(objs)
+                elapsed = self.add_filter_stats(cls_name, start, num_in,
+                                                len(list_objs))
                 LOG.debug(_("Filter %(cls_name)s returned "
-                            "%(obj_len)d host(s)"),
-                          {'cls_name': cls_name, 'obj_len': len(list_objs)})
+                            "%(obj_len)d host(s) in %(elapsed).4f seconds"),
+                          {'cls_name': cls_name, 'obj_len': len(list_objs),
+                           'elapsed': elapsed})
                 if len(list_objs) == 0:
                     break
         return list_objs
@@ -398,6 +398,24 @@ class API(base.Base):
                                            result, update_cells=False)
         return result
 
+    def get_instance_nw_info_bulk(self, context, instances):
+        """Returns the network info of several instances, keyed by instance
+        uuid.
+
+        The network manager only returns the network info of one instance
+        at a time.  The instances whose network info can't be fetched are
+        left out.
+        """
+        result = {}
+        for instance in instances:
+            try:
+                result[instance['uuid']] = self.get_instance_nw_info(
+                    context, instance)
+            except Exception:
+                LOG.exception(_('Failed to get the network info'),
+                              instance=instance)
+        return result
+
     def _get_instance_nw_info(self, context, instance):
         """Returns all network info related to an instance."""
         instance_type = flavors.extract_flavor(instance)
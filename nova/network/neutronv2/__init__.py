@@ -27,6 +27,10 @@ from nova.openstack.common import log as logging
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+# The admin token is shared by the admin clients until it expires, rather
+# than fetched from keystone for each of them.
+_ADMIN_AUTH_TOKEN = None
+
 
 def _get_auth_token():
     try:
@@ -47,15 +51,46 @@ def _get_auth_token():
             LOG.error(_('Neutron client authentication failed: %s'), e)
 
 
+def _get_admin_auth_token():
+    global _ADMIN_AUTH_TOKEN
+    if not _ADMIN_AUTH_TOKEN:
+        _ADMIN_AUTH_TOKEN = _get_auth_token()
+    return _ADMIN_AUTH_TOKEN
+
+
+class AdminClient(clientv20.Client):
+    """Client authenticated with the shared admin token.
+
+    The client holds the admin credentials, so that it authenticates again
+    when the token expires.  The new token replaces the shared one.
+    """
+
+    def do_request(self, *args, **kwargs):
+        global _ADMIN_AUTH_TOKEN
+        try:
+            return super(AdminClient, self).do_request(*args, **kwargs)
+        finally:
+            _ADMIN_AUTH_TOKEN = self.httpclient.auth_token
+
+
 def _get_client(token=None):
-    if not token and CONF.neutron_auth_strategy:
-        token = _get_auth_token()
     params = {
         'endpoint_url': CONF.neutron_url,
         'timeout': CONF.neutron_url_timeout,
         'insecure': CONF.neutron_api_insecure,
         'ca_cert': CONF.neutron_ca_certificates_file,
     }
+    if not token and CONF.neutron_auth_strategy:
+        params.update({
+            'token': _get_admin_auth_token(),
+            'username': CONF.neutron_admin_username,
+            'tenant_name': CONF.neutron_admin_tenant_name,
+            'region_name': CONF.neutron_region_name,
+            'password': CONF.neutron_admin_password,
+            'auth_url': CONF.neutron_admin_auth_url,
+            'auth_strategy': CONF.neutron_auth_strategy,
+        })
+        return AdminClient(**params)
     if token:
         params['token'] = token
     else:
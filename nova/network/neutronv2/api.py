@@ -463,6 +463,23 @@ class API(base.Base):
         nw_info = self._build_network_info_model(context, instance, networks)
         return network_model.NetworkInfo.hydrate(nw_info)
 
+    def get_instance_nw_info_bulk(self, context, instances):
+        """Return the network information of several instances, keyed by
+        instance uuid, and update their caches.
+
+        The ports, floating ips, subnets and networks of all the instances
+        are fetched with a handful of calls, rather than for each instance.
+        The order of the ports of each instance is taken from its info_cache.
+        """
+        nw_infos = self._build_network_info_models(context, instances)
+        result = {}
+        for instance, nw_info in zip(instances, nw_infos):
+            nw_info = network_model.NetworkInfo.hydrate(nw_info)
+            update_instance_info_cache(self, context, instance, nw_info,
+                                       update_cells=False)
+            result[instance['uuid']] = nw_info
+        return result
+
     @refresh_cache
     def add_fixed_ip_to_instance(self, context, instance, network_id,
                                  conductor_api=None):
@@ -836,11 +853,12 @@ class API(base.Base):
             raise exception.FloatingIpMultipleFoundForAddress(address=address)
         return fips[0]
 
-    def _get_floating_ips_by_fixed_and_port(self, client, fixed_ip, port):
-        """Get floatingips from fixed ip and port."""
+    def _get_floating_ips_by_ports(self, client, port_ids):
+        """Get the floatingips of a list of ports."""
+        if not port_ids:
+            return []
         try:
-            data = client.list_floatingips(fixed_ip_address=fixed_ip,
-                                           port_id=port)
+            data = client.list_floatingips(port_id=port_ids)
         # If a neutron plugin does not implement the L3 API a 404 from
         # list_floatingips will be raised.
         except neutronv2.exceptions.NeutronClientException as e:
@@ -910,21 +928,22 @@ class API(base.Base):
         """Force add a network to the project."""
         raise NotImplementedError()
 
-    def _nw_info_get_ips(self, client, port):
+    def _nw_info_get_ips(self, port, floating_ips):
         network_IPs = []
         for fixed_ip in port['fixed_ips']:
             fixed = network_model.FixedIP(address=fixed_ip['ip_address'])
-            floats = self._get_floating_ips_by_fixed_and_port(
-                client, fixed_ip['ip_address'], port['id'])
-            for ip in floats:
+            for ip in floating_ips:
+                if (ip['port_id'] != port['id'] or
+                        ip['fixed_ip_address'] != fixed_ip['ip_address']):
+                    continue
                 fip = network_model.IP(address=ip['floating_ip_address'],
                                        type='floating')
                 fixed.add_floating_ip(fip)
             network_IPs.append(fixed)
         return network_IPs
 
-    def _nw_info_get_subnets(self, context, port, network_IPs):
-        subnets = self._get_subnets_from_port(context, port)
+    def _nw_info_get_subnets(self, port, network_IPs, ipam_subnets):
+        subnets = self._get_subnets_from_port(port, ipam_subnets)
         for subnet in subnets:
             subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
                              if fixed_ip.is_in_subnet(subnet)]
@@ -987,19 +1006,74 @@ class API(base.Base):
             net_ids = [iface['network']['id'] for iface in network_cache]
             networks = self._get_available_networks(context,
                                                     instance['project_id'])
+        else:
+            net_ids = [n['id'] for n in networks]
+        ports = self._nw_info_order_ports(ports, net_ids)
+        return self._nw_info_build_models(context, client,
+                                          [(ports, networks)])[0]
 
+    def _build_network_info_models(self, context, instances):
+        """Return the network info models of several instances, in the
+        order of instances.
+        """
+        client = neutronv2.get_client(context, admin=True)
+        data = client.list_ports(
+            device_id=[instance['uuid'] for instance in instances])
+        ports_by_device = {}
+        for port in data.get('ports', []):
+            ports_by_device.setdefault(port['device_id'], []).append(port)
+
+        networks_by_project = {}
+        instances_ports = []
+        for instance in instances:
+            project_id = instance['project_id']
+            if project_id not in networks_by_project:
+                networks_by_project[project_id] = (
+                    self._get_available_networks(context, project_id))
+            # retrieve networks from info_cache to get correct nic order
+            info_cache = instance['info_cache']
+            network_cache = info_cache and info_cache['network_info'] or []
+            if isinstance(network_cache, basestring):
+                network_cache = jsonutils.loads(network_cache)
+            net_ids = [iface['network']['id'] for iface in network_cache]
+            ports = [port for port
+                     in ports_by_device.get(instance['uuid'], [])
+                     if port['tenant_id'] == project_id]
+            ports = self._nw_info_order_ports(ports, net_ids)
+            instances_ports.append((ports, networks_by_project[project_id]))
+        return self._nw_info_build_models(context, client, instances_ports)
+
+    @staticmethod
+    def _nw_info_order_ports(ports, net_ids):
         # ensure ports are in preferred network order, and filter out
         # those not attached to one of the provided list of networks
-        else:
-            net_ids = [n['id'] for n in networks]
         ports = [port for port in ports if port['network_id'] in net_ids]
         _ensure_requested_network_ordering(lambda x: x['network_id'],
                                            ports, net_ids)
+        return ports
 
+    def _nw_info_build_models(self, context, client, instances_ports):
+        """Return the network info models of a list of (ports, networks)
+        tuples, one for each instance.
+        """
+        all_ports = [port for ports, networks in instances_ports
+                     for port in ports]
+        # The floating ips and subnets of all the ports are fetched at once,
+        # rather than for each port.
+        floating_ips = self._get_floating_ips_by_ports(
+            client, [port['id'] for port in all_ports if port['fixed_ips']])
+        ipam_subnets = self._get_subnets_from_ports(context, all_ports)
+        return [self._nw_info_build_model(ports, networks, floating_ips,
+                                          ipam_subnets)
+                for ports, networks in instances_ports]
+
+    def _nw_info_build_model(self, ports, networks, floating_ips,
+                             ipam_subnets):
         nw_info = network_model.NetworkInfo()
         for port in ports:
-            network_IPs = self._nw_info_get_ips(client, port)
-            subnets = self._nw_info_get_subnets(context, port, network_IPs)
+            network_IPs = self._nw_info_get_ips(port, floating_ips)
+            subnets = self._nw_info_get_subnets(port, network_IPs,
+                                                ipam_subnets)
 
             devname = "tap" + port['id']
             devname = devname[:network_model.NIC_NAME_LEN]
@@ -1017,39 +1091,63 @@ class API(base.Base):
                 devname=devname))
         return nw_info
 
-    def _get_subnets_from_port(self, context, port):
-        """Return the subnets for a given port."""
+    def _get_subnets_from_ports(self, context, ports):
+        """Return the subnets of a list of ports, keyed by id.
 
-        fixed_ips = port['fixed_ips']
-        # No fixed_ips for the port means there is no subnet associated
-        # with the network the port is created on.
+        The subnets are fetched in a single call, and so are the DHCP ports
+        of their networks, which give the DHCP server of each subnet.
+        """
+        subnet_ids = set()
+        for port in ports:
+            subnet_ids.update(ip['subnet_id'] for ip in port['fixed_ips'])
+        # No fixed_ips for the ports means there is no subnet associated
+        # with the networks the ports are created on.
         # Since list_subnets(id=[]) returns all subnets visible for the
-        # current tenant, returned subnets may contain subnets which is not
-        # related to the port. To avoid this, the method returns here.
-        if not fixed_ips:
-            return []
-        search_opts = {'id': [ip['subnet_id'] for ip in fixed_ips]}
-        data = neutronv2.get_client(context).list_subnets(**search_opts)
-        ipam_subnets = data.get('subnets', [])
-        subnets = []
+        # current tenant, returned subnets may contain subnets which are not
+        # related to the ports. To avoid this, the method returns here.
+        if not subnet_ids:
+            return {}
+        client = neutronv2.get_client(context)
+        data = client.list_subnets(id=list(subnet_ids))
+        ipam_subnets = dict((subnet['id'], subnet)
+                            for subnet in data.get('subnets', []))
+        if not ipam_subnets:
+            return {}
 
-        for subnet in ipam_subnets:
+        # attempt to populate DHCP server field
+        network_ids = set(subnet['network_id']
+                          for subnet in ipam_subnets.values())
+        data = client.list_ports(network_id=list(network_ids),
+                                 device_owner='network:dhcp')
+        for p in data.get('ports', []):
+            for ip_pair in p['fixed_ips']:
+                subnet = ipam_subnets.get(ip_pair['subnet_id'])
+                if subnet is not None and 'dhcp_server' not in subnet:
+                    subnet['dhcp_server'] = ip_pair['ip_address']
+        return ipam_subnets
+
+    def _get_subnets_from_port(self, port, ipam_subnets):
+        """Return the subnets for a given port.
+
+        :param ipam_subnets: the subnets of the port, as returned by
+                             _get_subnets_from_ports().
+        """
+        subnets = []
+        subnet_ids = []
+        for ip in port['fixed_ips']:
+            if (ip['subnet_id'] in ipam_subnets and
+                    ip['subnet_id'] not in subnet_ids):
+                subnet_ids.append(ip['subnet_id'])
+
+        for subnet_id in subnet_ids:
+            subnet = ipam_subnets[subnet_id]
             subnet_dict = {'cidr': subnet['cidr'],
                            'gateway': network_model.IP(
                                 address=subnet['gateway_ip'],
                                 type='gateway'),
             }
-
-            # attempt to populate DHCP server field
-            search_opts = {'network_id': subnet['network_id'],
-                           'device_owner': 'network:dhcp'}
-            data = neutronv2.get_client(context).list_ports(**search_opts)
-            dhcp_ports = data.get('ports', [])
-            for p in dhcp_ports:
-                for ip_pair in p['fixed_ips']:
-                    if ip_pair['subnet_id'] == subnet['id']:
-                        subnet_dict['dhcp_server'] = ip_pair['ip_address']
-                        break
+            if 'dhcp_server' in subnet:
+                subnet_dict['dhcp_server'] = subnet['dhcp_server']
 
             subnet_object = network_model.Subnet(**subnet_dict)
             for dns in subnet.get('dns_nameservers', []):
@@ -25,6 +25,7 @@ import datetime
 from oslo.config import cfg
 
 from nova.compute import flavors
+from nova.compute import list_cache
 import nova.context
 from nova import db
 from nova.image import glance
@@ -107,6 +108,8 @@ def send_update(context, old_instance, new_instance, service=None, host=None):
     in that instance
     """
 
+    list_cache.invalidate_for_instance(new_instance)
+
     if not CONF.notify_on_state_change:
         # skip all this if updates are disabled
         return
@@ -156,6 +159,8 @@ def send_update_with_states(context, instance, old_vm_state, new_vm_state,
     are any, in the instance
     """
 
+    list_cache.invalidate_for_instance(instance)
+
     if not CONF.notify_on_state_change:
         # skip all this if updates are disabled
         return
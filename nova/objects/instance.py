@@ -14,6 +14,7 @@
 
 from nova.cells import opts as cells_opts
 from nova.cells import rpcapi as cells_rpcapi
+from nova.compute import list_cache
 from nova import db
 from nova import exception
 from nova import notifications
@@ -31,6 +32,7 @@ from oslo.config import cfg
 
 
 CONF = cfg.CONF
+CONF.import_opt('instance_iter_batch_size', 'nova.db.api')
 LOG = logging.getLogger(__name__)
 
 
@@ -293,6 +295,7 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                 }
         db_inst = db.instance_create(context, updates)
         Instance._from_db_object(context, self, db_inst, expected_attrs)
+        list_cache.invalidate(db_inst['project_id'])
 
     @base.remotable
     def destroy(self, context):
@@ -314,6 +317,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
             raise exception.ObjectActionError(action='destroy',
                                               reason='host changed')
         delattr(self, base.get_attrname('id'))
+        if self.obj_attr_is_set('project_id'):
+            list_cache.invalidate(self.project_id)
 
     def _save_info_cache(self, context):
         self.info_cache.save(context)
@@ -497,6 +502,36 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
+    @base.remotable_classmethod
+    def get_batch_by_filters(cls, context, filters, last_id=None, limit=None,
+                             expected_attrs=None):
+        db_inst_list = db.instance_get_batch_by_filters(
+            context, filters, last_id=last_id, limit=limit,
+            columns_to_join=_expected_cols(expected_attrs))
+        return _make_instance_list(context, cls(), db_inst_list,
+                                   expected_attrs)
+
+    @classmethod
+    def iter_by_filters(cls, context, filters, batch_size=None,
+                        expected_attrs=None):
+        """Iterate over the instances matching filters, ordered by id.
+
+        The instances are loaded batch_size at a time, with the
+        expected_attrs of each batch joined when it is loaded.
+        """
+        if batch_size is None:
+            batch_size = CONF.instance_iter_batch_size
+        last_id = None
+        while True:
+            inst_list = cls.get_batch_by_filters(
+                context, filters, last_id=last_id, limit=batch_size,
+                expected_attrs=expected_attrs)
+            for instance in inst_list:
+                yield instance
+            if len(inst_list) < batch_size:
+                return
+            last_id = inst_list[-1].id
+
     @base.remotable_classmethod
     def get_by_host(cls, context, host, expected_attrs=None):
         db_inst_list = db.instance_get_all_by_host(
@@ -41,6 +41,8 @@ class InstanceInfoCache(base.NovaPersistentObject, base.NovaObject):
     def _from_db_object(context, info_cache, db_obj):
         info_cache.instance_uuid = db_obj['instance_uuid']
         info_cache.network_info = db_obj['network_info']
+        for field in ('created_at', 'updated_at', 'deleted_at'):
+            info_cache[field] = db_obj.get(field)
         info_cache.obj_reset_changes()
         info_cache._context = context
         return info_cache
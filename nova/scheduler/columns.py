@@ -0,0 +1,63 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of host states, used to filter and weigh all the hosts at
+once instead of one host at a time.
+"""
+
+import itertools
+
+
+class HostStateColumns(object):
+    """Parallel lists of the attributes of a list of host states.
+
+    columns['free_ram_mb'] is the list of the free_ram_mb of every host,
+    in the order of columns.host_states.  A column is built the first time
+    it is read and then kept, so that the filters and weighers reading the
+    same attribute share it.
+    """
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            column = [getattr(host_state, name)
+                      for host_state in self.host_states]
+            self._columns[name] = column
+        return column
+
+    def compress(self, mask):
+        """Returns the columns of the hosts whose value in mask is true."""
+        columns = HostStateColumns(itertools.compress(self.host_states, mask))
+        for name, column in self._columns.iteritems():
+            columns._columns[name] = list(itertools.compress(column, mask))
+        return columns
+
+    def set_limits(self, key, limits, mask=None):
+        """Set limits[key] of each host state to the matching value of the
+        limits column, for the hosts whose value in mask is true.
+        """
+        host_limits = zip(self.host_states, limits)
+        if mask is not None:
+            host_limits = itertools.compress(host_limits, mask)
+        for host_state, limit in host_limits:
+            host_state.limits[key] = limit
@@ -36,6 +36,7 @@ from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
+from nova.scheduler import metrics
 from nova import servicegroup
 
 LOG = logging.getLogger(__name__)
@@ -105,6 +106,17 @@ class Scheduler(object):
         self.host_manager = importutils.import_object(
                 CONF.scheduler_host_manager)
         self.servicegroup_api = servicegroup.API()
+        self.metrics = metrics.SchedulerMetrics()
+
+    def get_stats(self):
+        """Returns the metrics of this scheduler with the statistics of the
+        filters and weighers of its host manager.
+        """
+        stats = self.metrics.to_dict()
+        stats['filters'] = self.host_manager.filter_handler.get_filter_stats()
+        stats['weighers'] = (
+                self.host_manager.weight_handler.get_weigher_stats())
+        return stats
 
     def update_service_capabilities(self, service_name, host, capabilities):
         """Process a capability update from a service node."""
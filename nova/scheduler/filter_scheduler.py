@@ -19,6 +19,7 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import bisect
 import random
 
 from oslo.config import cfg
@@ -47,7 +48,14 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='Filter and weigh the hosts only once for a request '
+                     'with multiple instances.  After each instance, only '
+                     'the chosen host is filtered and weighed again.  This '
+                     'requires filters and weighers whose result for a '
+                     'host only depends on that host.'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -81,8 +89,9 @@ class FilterScheduler(driver.Scheduler):
                    'instance_uuids': instance_uuids})
         LOG.debug(_("Request Spec: %s") % request_spec)
 
-        weighed_hosts = self._schedule(context, request_spec,
-                                       filter_properties, instance_uuids)
+        with self.metrics.timed('schedule'):
+            weighed_hosts = self._schedule(context, request_spec,
+                                           filter_properties, instance_uuids)
 
         # NOTE: Pop instance_uuids as individual creates do not need the
         # set of uuids. Do not pop before here as the upper exception
@@ -130,8 +139,9 @@ class FilterScheduler(driver.Scheduler):
     def select_hosts(self, context, request_spec, filter_properties):
         """Selects a filtered set of hosts."""
         instance_uuids = request_spec.get('instance_uuids')
-        hosts = [host.obj.host for host in self._schedule(context,
-            request_spec, filter_properties, instance_uuids)]
+        with self.metrics.timed('schedule'):
+            hosts = [host.obj.host for host in self._schedule(context,
+                request_spec, filter_properties, instance_uuids)]
         if not hosts:
             raise exception.NoValidHost(reason="")
         return hosts
@@ -140,8 +150,9 @@ class FilterScheduler(driver.Scheduler):
         """Selects a filtered set of hosts and nodes."""
         num_instances = request_spec['num_instances']
         instance_uuids = request_spec.get('instance_uuids')
-        selected_hosts = self._schedule(context, request_spec,
-                                        filter_properties, instance_uuids)
+        with self.metrics.timed('schedule'):
+            selected_hosts = self._schedule(context, request_spec,
+                                            filter_properties, instance_uuids)
 
         # Couldn't fulfill the request_spec
         if len(selected_hosts) < num_instances:
@@ -257,6 +268,12 @@ class FilterScheduler(driver.Scheduler):
         # retry is enabled, update attempt count:
         if retry:
             retry['num_attempts'] += 1
+            self.metrics.incr('reschedules')
+            if retry.get('claim_failed'):
+                # The chosen host did not have the resources the scheduler
+                # thought it had, usually because another scheduler worker
+                # or request placed an instance there in the meantime.
+                self.metrics.incr('claim_conflicts')
         else:
             retry = {
                 'num_attempts': 1,
@@ -323,11 +340,16 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self.host_manager.get_all_host_states(elevated)
 
-        selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+        if CONF.scheduler_batch_placement and num_instances > 1:
+            return self._schedule_batch(hosts, filter_properties,
+                                        instance_properties, num_instances,
+                                        update_group_hosts)
+
+        selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -343,12 +365,8 @@ class FilterScheduler(driver.Scheduler):
 
             LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
-
+            scheduler_host_subset_size = self._get_host_subset_size(
+                    weighed_hosts)
             chosen_host = random.choice(
                 weighed_hosts[0:scheduler_host_subset_size])
             selected_hosts.append(chosen_host)
@@ -359,3 +377,71 @@ class FilterScheduler(driver.Scheduler):
             if update_group_hosts is True:
                 filter_properties['group_hosts'].append(chosen_host.obj.host)
         return selected_hosts
+
+    def _schedule_batch(self, hosts, filter_properties, instance_properties,
+                        num_instances, update_group_hosts):
+        """Returns a list of hosts for num_instances instances, filtering
+        and weighing all the hosts only once.  Each time a host is chosen,
+        only that host is filtered and weighed again, and moved to its new
+        place in the weighed hosts.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
+
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                filter_properties)
+
+        LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
+
+        # Negated weights of weighed_hosts, in increasing order, to find
+        # where a weighed again host goes with bisect.
+        sort_keys = [-weighed_host.weight for weighed_host in weighed_hosts]
+
+        selected_hosts = []
+        for num in xrange(num_instances):
+            if not weighed_hosts:
+                # Can't get any more locally.
+                break
+
+            scheduler_host_subset_size = self._get_host_subset_size(
+                    weighed_hosts)
+            chosen_index = random.randrange(scheduler_host_subset_size)
+            chosen_host = weighed_hosts.pop(chosen_index)
+            del sort_keys[chosen_index]
+            selected_hosts.append(chosen_host)
+
+            # Now consume the resources so the filter/weights
+            # will change for the next instance.
+            chosen_host.obj.consume_from_instance(instance_properties)
+            if update_group_hosts is True:
+                filter_properties['group_hosts'].append(chosen_host.obj.host)
+
+            if num + 1 == num_instances:
+                break
+
+            # Only the chosen host changed, so it is the only one which
+            # has to be checked again for the next instance.
+            if not self.host_manager.get_filtered_hosts([chosen_host.obj],
+                    filter_properties, index=num + 1):
+                continue
+            weighed_host = self.host_manager.get_weighed_hosts(
+                    [chosen_host.obj], filter_properties)[0]
+            position = bisect.bisect_right(sort_keys, -weighed_host.weight)
+            sort_keys.insert(position, -weighed_host.weight)
+            weighed_hosts.insert(position, weighed_host)
+        return selected_hosts
+
+    def _get_host_subset_size(self, weighed_hosts):
+        """Returns the number of best weighed hosts to randomly choose a
+        host from.
+        """
+        scheduler_host_subset_size = CONF.scheduler_host_subset_size
+        if scheduler_host_subset_size > len(weighed_hosts):
+            scheduler_host_subset_size = len(weighed_hosts)
+        if scheduler_host_subset_size < 1:
+            scheduler_host_subset_size = 1
+        return scheduler_host_subset_size
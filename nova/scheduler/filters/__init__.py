@@ -17,11 +17,40 @@
 Scheduler host filters
 """
 
+import time
+
+from oslo.config import cfg
+
 from nova import filters
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler import columns as host_columns
+
+filter_order_opts = [
+    cfg.BoolOpt('scheduler_adaptive_filter_order',
+                default=False,
+                help='Run the host filters in the order which minimizes '
+                     'their expected cost, based on the time per host and '
+                     'the rate of hosts passing each filter observed so '
+                     'far, instead of the configured order'),
+    cfg.ListOpt('scheduler_pinned_filters',
+                default=[],
+                help='Host filters which keep their configured position '
+                     'when scheduler_adaptive_filter_order is set'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(filter_order_opts)
+
+LOG = logging.getLogger(__name__)
 
 
 class BaseHostFilter(filters.BaseFilter):
     """Base class for host filters."""
+
+    # Set to true in a subclass implementing filter_columns()
+    supports_columns = False
+
     def _filter_one(self, obj, filter_properties):
         """Return True if the object passes the filter, otherwise False."""
         return self.host_passes(obj, filter_properties)
@@ -32,11 +61,96 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def filter_columns(self, columns, filter_properties):
+        """Return a list telling for each host of the HostStateColumns
+        whether it passes the filter.  It has to give the same result as
+        host_passes(), including the limits set on the host states.
+        Override this in a subclass and set supports_columns.
+        """
+        raise NotImplementedError()
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
 
+    def _filter_rank(self, filter_cls):
+        """Returns the sort key of a filter class for the adaptive order.
+
+        Filters are ordered by increasing cost per host removed, which is
+        the order minimizing the total cost of independent filters.
+        Filters which have not run yet come first, to learn their cost.
+        """
+        stats = self.filter_stats.get(filter_cls.__name__)
+        if not stats or not stats['objs_in']:
+            return (0.0, 0.0)
+        cost = stats['time'] / stats['objs_in']
+        rejected = 1.0 - float(stats['objs_out']) / stats['objs_in']
+        if rejected <= 0:
+            return (float('inf'), cost)
+        return (cost / rejected, cost)
+
+    def order_filters(self, filter_classes):
+        """Returns filter_classes in the order they should run in.
+
+        Unless scheduler_adaptive_filter_order is set, this is the
+        configured order.  Otherwise the filters are sorted by
+        _filter_rank(), except the ones in scheduler_pinned_filters which
+        keep their position.
+        """
+        if not CONF.scheduler_adaptive_filter_order:
+            return filter_classes
+        pinned = set(CONF.scheduler_pinned_filters)
+        movable = iter(sorted((filter_cls for filter_cls in filter_classes
+                               if filter_cls.__name__ not in pinned),
+                              key=self._filter_rank))
+        return [filter_cls if filter_cls.__name__ in pinned else next(movable)
+                for filter_cls in filter_classes]
+
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties, index=0):
+        return super(HostFilterHandler, self).get_filtered_objects(
+                self.order_filters(filter_classes), objs, filter_properties,
+                index)
+
+    def get_filtered_columns(self, filter_classes, objs,
+            filter_properties, index=0):
+        """Same as get_filtered_objects(), but filters the hosts with whole
+        column operations for the filters supporting them.  The other
+        filters are run one host at a time.
+        """
+        filter_classes = self.order_filters(filter_classes)
+        columns = host_columns.HostStateColumns(objs)
+        LOG.debug(_("Starting with %d host(s)"), len(columns))
+        for filter_cls in filter_classes:
+            cls_name = filter_cls.__name__
+            filter = filter_cls()
+
+            if filter.run_filter_for_index(index):
+                start = time.time()
+                num_in = len(columns)
+                if filter.supports_columns:
+                    mask = filter.filter_columns(columns, filter_properties)
+                    columns = columns.compress(mask)
+                else:
+                    objs = filter.filter_all(columns.host_states,
+                                             filter_properties)
+                    if objs is None:
+                        self.add_filter_stats(cls_name, start, num_in, 0)
+                        LOG.debug(_("Filter %(cls_name)s says to stop "
+                                    "filtering"), {'cls_name': cls_name})
+                        return
+                    columns = host_columns.HostStateColumns(objs)
+                elapsed = self.add_filter_stats(cls_name, start, num_in,
+                                                len(columns))
+                LOG.debug(_("Filter %(cls_name)s returned "
+                            "%(obj_len)d host(s) in %(elapsed).4f seconds"),
+                          {'cls_name': cls_name, 'obj_len': len(columns),
+                           'elapsed': elapsed})
+                if len(columns) == 0:
+                    break
+        return columns.host_states
+
 
 def all_filters():
     """Return a list of filter classes found in this directory.
@@ -34,6 +34,8 @@ class ComputeFilter(filters.BaseHostFilter):
     # Host state does not change within a request
     run_filter_once_per_request = True
 
+    supports_columns = True
+
     def host_passes(self, host_state, filter_properties):
         """Returns True for only active compute nodes."""
         service = host_state.service
@@ -44,3 +46,9 @@ class ComputeFilter(filters.BaseHostFilter):
                     "heard from in a while"), {'host_state': host_state})
             return False
         return True
+
+    def filter_columns(self, columns, filter_properties):
+        """Returns True for only active compute nodes."""
+        service_is_up = self.servicegroup_api.service_is_up
+        return [service_is_up(service) and not service['disabled']
+                for service in columns['service']]
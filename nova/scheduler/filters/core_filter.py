@@ -17,10 +17,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -67,9 +67,38 @@ class BaseCoreFilter(filters.BaseHostFilter):
 class CoreFilter(BaseCoreFilter):
     """CoreFilter filters based on CPU core utilization."""
 
+    supports_columns = True
+
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def filter_columns(self, columns, filter_properties):
+        """Return True for the hosts having sufficient CPU cores."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return [True] * len(columns)
+
+        host_vcpus_total = columns['vcpus_total']
+        if not all(host_vcpus_total):
+            # Fail safe
+            LOG.warning(_("VCPUs not set; assuming CPU collection broken"))
+
+        instance_vcpus = instance_type['vcpus']
+        cpu_allocation_ratio = CONF.cpu_allocation_ratio
+        vcpus_totals = [total * cpu_allocation_ratio if total else 0
+                        for total in host_vcpus_total]
+
+        # Only provide a VCPU limit to compute if the virt driver is reporting
+        # an accurate count of installed VCPUs. (XenServer driver does not)
+        columns.set_limits('vcpu', vcpus_totals,
+                           [vcpus_total > 0 for vcpus_total in vcpus_totals])
+
+        vcpus_used = columns['vcpus_used']
+        return [not host_total or vcpus_total - used >= instance_vcpus
+                for host_total, vcpus_total, used in zip(host_vcpus_total,
+                                                         vcpus_totals,
+                                                         vcpus_used)]
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -78,12 +107,8 @@ class AggregateCoreFilter(BaseCoreFilter):
     """
 
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='cpu_allocation_ratio')
+        metadata = utils.aggregate_metadata_get_by_host(
+                     host_state, filter_properties, key='cpu_allocation_ratio')
         aggregate_vals = metadata.get('cpu_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
@@ -31,6 +31,8 @@ CONF.register_opt(disk_allocation_ratio_opt)
 class DiskFilter(filters.BaseHostFilter):
     """Disk Filter with over subscription flag."""
 
+    supports_columns = True
+
     def host_passes(self, host_state, filter_properties):
         """Filter based on disk usage."""
         instance_type = filter_properties.get('instance_type')
@@ -55,3 +57,23 @@ class DiskFilter(filters.BaseHostFilter):
         disk_gb_limit = disk_mb_limit / 1024
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
+
+    def filter_columns(self, columns, filter_properties):
+        """Filter based on disk usage."""
+        instance_type = filter_properties.get('instance_type')
+        requested_disk = 1024 * (instance_type['root_gb'] +
+                                 instance_type['ephemeral_gb'])
+        disk_allocation_ratio = CONF.disk_allocation_ratio
+
+        total_usable_disk_mb = [total * 1024
+                                for total in columns['total_usable_disk_gb']]
+        disk_mb_limits = [total * disk_allocation_ratio
+                          for total in total_usable_disk_mb]
+        passes = [limit - (total - free) >= requested_disk
+                  for limit, total, free in zip(disk_mb_limits,
+                                                total_usable_disk_mb,
+                                                columns['free_disk_mb'])]
+
+        columns.set_limits('disk_gb',
+                           [limit / 1024 for limit in disk_mb_limits], passes)
+        return passes
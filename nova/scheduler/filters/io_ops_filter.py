@@ -32,6 +32,8 @@ CONF.register_opt(max_io_ops_per_host_opt)
 class IoOpsFilter(filters.BaseHostFilter):
     """Filter out hosts with too many concurrent I/O operations."""
 
+    supports_columns = True
+
     def host_passes(self, host_state, filter_properties):
         """Use information about current vm and task states collected from
         compute node statistics to decide whether to filter.
@@ -45,3 +47,8 @@ class IoOpsFilter(filters.BaseHostFilter):
                         {'host_state': host_state,
                          'max_io_ops': max_io_ops})
         return passes
+
+    def filter_columns(self, columns, filter_properties):
+        max_io_ops = CONF.max_io_ops_per_host
+        return [num_io_ops < max_io_ops
+                for num_io_ops in columns['num_io_ops']]
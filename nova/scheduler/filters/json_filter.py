@@ -24,6 +24,11 @@ class JsonFilter(filters.BaseHostFilter):
     """Host Filter to allow simple JSON-based grammar for
     selecting hosts.
     """
+
+    # Compiled queries, shared by all the requests, by query string
+    _compiled_queries = {}
+    compiled_queries_max = 100
+
     def _op_compare(self, args, op):
         """Returns True if the specified operator can successfully
         compare the first item in the args with all the rest. Will
@@ -86,59 +91,83 @@ class JsonFilter(filters.BaseHostFilter):
         'and': _and,
     }
 
-    def _parse_string(self, string, host_state):
-        """Strings prefixed with $ are capability lookups in the
+    def _compile_string(self, string):
+        """Returns a function giving the value of string for a host.
+
+        Strings prefixed with $ are capability lookups in the
         form '$variable' where 'variable' is an attribute in the
         HostState class.  If $variable is a dictionary, you may
         use: $variable.dictkey
         """
         if not string:
-            return None
+            return lambda host_state: None
         if not string.startswith("$"):
-            return string
+            return lambda host_state: string
 
         path = string[1:].split(".")
-        obj = getattr(host_state, path[0], None)
-        if obj is None:
-            return None
-        for item in path[1:]:
-            obj = obj.get(item, None)
+        attribute = path[0]
+        keys = path[1:]
+
+        def _lookup(host_state):
+            obj = getattr(host_state, attribute, None)
             if obj is None:
                 return None
-        return obj
-
-    def _process_filter(self, query, host_state):
-        """Recursively parse the query structure."""
+            for item in keys:
+                obj = obj.get(item, None)
+                if obj is None:
+                    return None
+            return obj
+        return _lookup
+
+    def _compile_filter(self, query):
+        """Recursively parse the query structure into a function giving
+        the result of the query for a host.
+        """
         if not query:
-            return True
-        cmd = query[0]
-        method = self.commands[cmd]
-        cooked_args = []
+            return lambda host_state: True
+        method = self.commands[query[0]]
+        arg_functions = []
         for arg in query[1:]:
             if isinstance(arg, list):
-                arg = self._process_filter(arg, host_state)
+                arg_functions.append(self._compile_filter(arg))
             elif isinstance(arg, basestring):
-                arg = self._parse_string(arg, host_state)
-            if arg is not None:
-                cooked_args.append(arg)
-        result = method(self, cooked_args)
-        return result
-
-    def host_passes(self, host_state, filter_properties):
-        """Return a list of hosts that can fulfill the requirements
-        specified in the query.
+                arg_functions.append(self._compile_string(arg))
+            elif arg is not None:
+                arg_functions.append(lambda host_state, arg=arg: arg)
+
+        def _evaluate(host_state):
+            cooked_args = []
+            for arg_function in arg_functions:
+                arg = arg_function(host_state)
+                if arg is not None:
+                    cooked_args.append(arg)
+            return method(self, cooked_args)
+        return _evaluate
+
+    def _get_compiled_query(self, filter_properties):
+        """Returns the compiled query of the scheduler hints, or None if
+        there is no query.
         """
         try:
             query = filter_properties['scheduler_hints']['query']
         except KeyError:
             query = None
         if not query:
-            return True
+            return None
 
+        compiled_query = self._compiled_queries.get(query)
+        if compiled_query is None:
+            compiled_query = self._compile_filter(jsonutils.loads(query))
+            if len(self._compiled_queries) >= self.compiled_queries_max:
+                self._compiled_queries.clear()
+            self._compiled_queries[query] = compiled_query
+        return compiled_query
+
+    def _query_passes(self, compiled_query, host_state):
         # NOTE(comstud): Not checking capabilities or service for
         # enabled/disabled so that a provided json filter can decide
 
-        result = self._process_filter(jsonutils.loads(query), host_state)
+        result = compiled_query(host_state)
         if isinstance(result, list):
             # If any succeeded, include the host
             result = any(result)
@@ -146,3 +175,22 @@ class JsonFilter(filters.BaseHostFilter):
             # Filter it out.
             return True
         return False
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        """Yield the hosts matching the query, which is only compiled
+        once for all the hosts.
+        """
+        compiled_query = self._get_compiled_query(filter_properties)
+        for host_state in filter_obj_list:
+            if (compiled_query is None or
+                    self._query_passes(compiled_query, host_state)):
+                yield host_state
+
+    def host_passes(self, host_state, filter_properties):
+        """Return a list of hosts that can fulfill the requirements
+        specified in the query.
+        """
+        compiled_query = self._get_compiled_query(filter_properties)
+        if compiled_query is None:
+            return True
+        return self._query_passes(compiled_query, host_state)
@@ -16,6 +16,7 @@
 
 from nova import db
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 
 class TypeAffinityFilter(filters.BaseHostFilter):
@@ -25,6 +26,22 @@ class TypeAffinityFilter(filters.BaseHostFilter):
     (spread) set to 1 (default).
     """
 
+    # All the instances of a request have the same type, so a host which
+    # can take the first one can take the others too.
+    run_filter_once_per_request = True
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        """Yield the hosts which have no instance of another type, looking
+        up all the hosts with a single query.
+        """
+        instance_type = filter_properties.get('instance_type')
+        context = filter_properties['context'].elevated()
+        other_type_hosts = set(db.instance_get_hosts_by_not_type(
+                     context, instance_type['id']))
+        for host_state in filter_obj_list:
+            if host_state.host not in other_type_hosts:
+                yield host_state
+
     def host_passes(self, host_state, filter_properties):
         """Dynamically limits hosts to one instance type
 
@@ -51,8 +68,7 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
 
     def host_passes(self, host_state, filter_properties):
         instance_type = filter_properties.get('instance_type')
-        context = filter_properties['context'].elevated()
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='instance_type')
+        metadata = utils.aggregate_metadata_get_by_host(
+                     host_state, filter_properties, key='instance_type')
         return (len(metadata) == 0 or
                 instance_type['name'] in metadata['instance_type'])
@@ -0,0 +1,39 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bench of utility methods used by filters."""
+
+from nova import db
+
+
+def aggregate_metadata_get_by_host(host_state, filter_properties, key=None):
+    """Returns the aggregate metadata for the host of host_state.
+
+    The result has the same format as db.aggregate_metadata_get_by_host():
+    a dict where each value is a set of the values found in the different
+    aggregates.  The metadata loaded by the HostManager for the current
+    request is used when available, so that filters do not need to hit the
+    DB once per host.
+    """
+    metadata = host_state.aggregate_metadata
+    if metadata is None:
+        context = filter_properties['context'].elevated()
+        return db.aggregate_metadata_get_by_host(context, host_state.host,
+                                                 key=key)
+    if key is None:
+        return metadata
+    if key in metadata:
+        return {key: metadata[key]}
+    return {}
@@ -17,6 +17,7 @@
 Manage hosts in the current zone.
 """
 
+import collections
 import UserDict
 
 from oslo.config import cfg
@@ -55,6 +56,20 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.IntOpt('scheduler_host_state_resync_interval',
+               default=0,
+               help='Interval in seconds between full reloads of the compute '
+                    'nodes cached by the scheduler.  Between two reloads, '
+                    'only the compute nodes changed since the previous '
+                    'request are read from the database.  A value of 0 '
+                    'disables the cache and reads all compute nodes for '
+                    'every request.'),
+    cfg.BoolOpt('scheduler_use_host_columns',
+                default=False,
+                help='Filter and weigh all the hosts at once, using lists '
+                     'of the host state values, for the filters and '
+                     'weighers supporting it.  The other filters and '
+                     'weighers are run one host at a time.'),
     ]
 
 CONF = cfg.CONF
@@ -122,6 +137,7 @@ class HostState(object):
         self.num_instances_by_project = {}
         self.num_instances_by_os_type = {}
         self.num_io_ops = 0
+        self.cached_images = set()
 
         # Other information
         self.host_ip = None
@@ -134,6 +150,12 @@ class HostState(object):
         # Resource oversubscription values for the compute host:
         self.limits = {}
 
+        # Aggregates the host belongs to, and their metadata merged in the
+        # same format as db.aggregate_metadata_get_by_host().  These are
+        # loaded by the HostManager for every request.
+        self.aggregates = None
+        self.aggregate_metadata = None
+
         self.updated = None
 
     def update_capabilities(self, capabilities=None, service=None):
@@ -146,6 +168,15 @@ class HostState(object):
             service = {}
         self.service = ReadOnlyDict(service)
 
+    def update_aggregates(self, aggregates):
+        """Update the aggregates the host belongs to and their metadata."""
+        metadata = collections.defaultdict(set)
+        for aggregate in aggregates:
+            for key, value in aggregate['metadetails'].iteritems():
+                metadata[key].add(value)
+        self.aggregates = aggregates
+        self.aggregate_metadata = dict(metadata)
+
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
         if (self.updated and compute['updated_at']
@@ -221,6 +252,10 @@ class HostState(object):
 
         self.num_io_ops = int(self.stats.get('io_workload', 0))
 
+        # Track the images cached on the host
+        self.cached_images = set(k[13:] for k in self.stats.keys() if
+                k.startswith("cached_image_"))
+
     def consume_from_instance(self, instance):
         """Incrementally update host state from an instance."""
         disk_mb = (instance['root_gb'] + instance['ephemeral_gb']) * 1024
@@ -289,6 +324,13 @@ class HostManager(object):
         # { (host, hypervisor_hostname) : { <service> : { cap k : v }}}
         self.service_states = {}
         self.host_state_map = {}
+        # { compute node id : compute node }, used when
+        # scheduler_host_state_resync_interval is set
+        self._compute_nodes = {}
+        self._compute_nodes_synced_at = None
+        self._compute_nodes_resynced_at = None
+        # { (host, hypervisor_hostname) : compute node last applied }
+        self._host_state_compute_nodes = {}
         self.filter_handler = filters.HostFilterHandler()
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
@@ -393,11 +435,17 @@ class HostManager(object):
                     return name_to_cls_map.values()
             hosts = name_to_cls_map.itervalues()
 
+        if CONF.scheduler_use_host_columns:
+            return self.filter_handler.get_filtered_columns(filter_classes,
+                    hosts, filter_properties, index)
         return self.filter_handler.get_filtered_objects(filter_classes,
                 hosts, filter_properties, index)
 
     def get_weighed_hosts(self, hosts, weight_properties):
         """Weigh the hosts."""
+        if CONF.scheduler_use_host_columns:
+            return self.weight_handler.get_weighed_columns(
+                    self.weight_classes, hosts, weight_properties)
         return self.weight_handler.get_weighed_objects(self.weight_classes,
                 hosts, weight_properties)
 
@@ -419,6 +467,52 @@ class HostManager(object):
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         self.service_states[state_key] = capab_copy
 
+    def _get_aggregates_by_host(self, context):
+        """Returns a dict mapping each host to the list of aggregates it
+        belongs to.  All aggregates are loaded with a single DB query.
+        """
+        aggregates_by_host = collections.defaultdict(list)
+        for aggregate in db.aggregate_get_all(context):
+            for host in aggregate['hosts']:
+                aggregates_by_host[host].append(aggregate)
+        return aggregates_by_host
+
+    def _get_compute_nodes(self, context):
+        """Returns the compute nodes to build the host states from.
+
+        If scheduler_host_state_resync_interval is set, the compute nodes
+        are cached and only the ones which changed since the previous call
+        are read from the DB, with a full reload every resync interval.
+        """
+        resync_interval = CONF.scheduler_host_state_resync_interval
+        if resync_interval <= 0:
+            return db.compute_node_get_all(context)
+
+        # Take the time before reading, so that the compute nodes updated
+        # while we are reading are read again next time.
+        now = timeutils.utcnow()
+        if (self._compute_nodes_resynced_at is None or
+                timeutils.is_older_than(self._compute_nodes_resynced_at,
+                                        resync_interval)):
+            compute_nodes = db.compute_node_get_all(context)
+            self._compute_nodes = dict((compute['id'], compute)
+                                      for compute in compute_nodes)
+            self._compute_nodes_resynced_at = now
+        else:
+            compute_nodes = db.compute_node_get_all_changed_since(context,
+                    self._compute_nodes_synced_at)
+            for compute in compute_nodes:
+                if compute['deleted']:
+                    self._compute_nodes.pop(compute['id'], None)
+                else:
+                    self._compute_nodes[compute['id']] = compute
+            LOG.debug(_("Read %(changed)d changed compute node(s), "
+                        "%(total)d cached"),
+                      {'changed': len(compute_nodes),
+                       'total': len(self._compute_nodes)})
+        self._compute_nodes_synced_at = now
+        return self._compute_nodes.values()
+
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
@@ -426,7 +520,10 @@ class HostManager(object):
         """
 
         # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
+        compute_nodes = self._get_compute_nodes(context)
+        # Aggregate membership and metadata are used by several filters, so
+        # load them once here instead of once per host in each filter.
+        aggregates_by_host = self._get_aggregates_by_host(context)
         seen_nodes = set()
         for compute in compute_nodes:
             service = compute['service']
@@ -446,7 +543,11 @@ class HostManager(object):
                         capabilities=capabilities,
                         service=dict(service.iteritems()))
                 self.host_state_map[state_key] = host_state
-            host_state.update_from_compute_node(compute)
+            # Compute nodes served from the cache have already been applied
+            if self._host_state_compute_nodes.get(state_key) is not compute:
+                host_state.update_from_compute_node(compute)
+                self._host_state_compute_nodes[state_key] = compute
+            host_state.update_aggregates(aggregates_by_host.get(host, []))
             seen_nodes.add(state_key)
 
         # remove compute nodes from host_state_map if they are not active
@@ -456,5 +557,6 @@ class HostManager(object):
             LOG.info(_("Removing dead compute node %(host)s:%(node)s "
                        "from scheduler") % {'host': host, 'node': node})
             del self.host_state_map[state_key]
+            self._host_state_compute_nodes.pop(state_key, None)
 
         return self.host_state_map.itervalues()
@@ -33,6 +33,7 @@ from nova import exception
 from nova import manager
 from nova.objects import instance as instance_obj
 from nova.openstack.common import excutils
+from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
@@ -48,8 +49,21 @@ scheduler_driver_opt = cfg.StrOpt('scheduler_driver',
         default='nova.scheduler.filter_scheduler.FilterScheduler',
         help='Default driver to use for the scheduler')
 
+scheduler_manager_opts = [
+    cfg.IntOpt('scheduler_workers',
+               help='Number of worker processes for the scheduler '
+                    'service.  Each worker consumes from the scheduler '
+                    'topic and keeps its own host states and metrics'),
+    cfg.IntOpt('scheduler_metrics_report_interval',
+               default=600,
+               help='Interval in seconds at which each scheduler worker '
+                    'logs its scheduling times and placement conflicts. '
+                    'Set to 0 to disable'),
+]
+
 CONF = cfg.CONF
 CONF.register_opt(scheduler_driver_opt)
+CONF.register_opts(scheduler_manager_opts)
 
 QUOTAS = quota.QUOTAS
 
@@ -57,7 +71,7 @@ QUOTAS = quota.QUOTAS
 class SchedulerManager(manager.Manager):
     """Chooses a host to run instances on."""
 
-    RPC_API_VERSION = '2.9'
+    RPC_API_VERSION = '2.11'
 
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         if not scheduler_driver:
@@ -272,6 +286,29 @@ class SchedulerManager(manager.Manager):
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
 
+    @periodic_task.periodic_task(
+        spacing=CONF.scheduler_metrics_report_interval)
+    def _report_metrics(self, context):
+        if CONF.scheduler_metrics_report_interval <= 0:
+            return
+        stats = self.driver.get_stats()
+        LOG.info(_("Scheduler metrics: counters %(counters)s, "
+                   "timings %(timings)s"), stats)
+        for cls_name, filter_stats in sorted(stats['filters'].iteritems()):
+            LOG.info(_("Filter %(cls_name)s: %(calls)d runs in %(time).3f "
+                       "seconds, %(objs_in)d host(s) in, %(objs_out)d "
+                       "host(s) out"), dict(filter_stats, cls_name=cls_name))
+        for cls_name, weigher_stats in sorted(stats['weighers'].iteritems()):
+            LOG.info(_("Weigher %(cls_name)s: %(calls)d runs in %(time).3f "
+                       "seconds, %(objs)d host(s) weighed"),
+                     dict(weigher_stats, cls_name=cls_name))
+
+    def get_scheduler_stats(self, context):
+        """Returns the scheduling metrics and the statistics of the filters
+        and weighers of the scheduler worker handling the call.
+        """
+        return jsonutils.to_primitive(self.driver.get_stats())
+
     # NOTE(russellb) This method can be removed in 3.0 of this API.  It is
     # deprecated in favor of the method in the base API.
     def get_backdoor_port(self, context):
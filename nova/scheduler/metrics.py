@@ -0,0 +1,65 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Counters and timings kept in memory by a scheduler process.
+"""
+
+import collections
+import contextlib
+import time
+
+
+class SchedulerMetrics(object):
+    """Counters and timings of one scheduler process.
+
+    When the scheduler runs several workers, each worker process has its
+    own metrics, the same way it has its own host states.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = collections.defaultdict(int)
+        self.timings = {}
+
+    def incr(self, name, value=1):
+        self.counters[name] += value
+
+    def add_timing(self, name, seconds):
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = {'count': 0, 'total': 0.0, 'max': 0.0}
+            self.timings[name] = timing
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        """Context manager adding the time spent in its block to the
+        timing called name.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.time() - start)
+
+    def to_dict(self):
+        return {'counters': dict(self.counters),
+                'timings': dict((name, dict(timing))
+                                for name, timing in self.timings.iteritems())}
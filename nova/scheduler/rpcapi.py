@@ -72,6 +72,7 @@ class SchedulerAPI(rpcclient.RpcProxy):
               by the compute manager for retries.
         2.9 - Added the legacy_bdm_in_spec parameter to run_instance()
         2.10 - Deprecated live_migration() call, moved to conductor
+        2.11 - Add get_scheduler_stats()
     '''
 
     #
@@ -144,3 +145,7 @@ class SchedulerAPI(rpcclient.RpcProxy):
         return cctxt.call(ctxt, 'select_hosts',
                           request_spec=request_spec,
                           filter_properties=filter_properties)
+
+    def get_scheduler_stats(self, ctxt):
+        cctxt = self.client.prepare(version='2.11')
+        return cctxt.call(ctxt, 'get_scheduler_stats')
@@ -17,8 +17,11 @@
 Scheduler host weights
 """
 
+import time
+
 from oslo.config import cfg
 
+from nova.scheduler import columns as host_columns
 from nova import weights
 
 CONF = cfg.CONF
@@ -37,7 +40,16 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    # Set to true in a subclass implementing weigh_columns()
+    supports_columns = False
+
+    def weigh_columns(self, columns, weight_properties):
+        """Return the list of the weights of the hosts of the
+        HostStateColumns, before applying the weight multiplier.
+        Override this in a subclass and set supports_columns.
+        """
+        raise NotImplementedError()
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
@@ -46,6 +58,38 @@ class HostWeightHandler(weights.BaseWeightHandler):
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
 
+    def get_weighed_columns(self, weigher_classes, obj_list,
+            weighing_properties):
+        """Same as get_weighed_objects(), but weighs the hosts with whole
+        column operations for the weighers supporting them.  The other
+        weighers weigh one host at a time.
+        """
+        if not obj_list:
+            return []
+
+        columns = host_columns.HostStateColumns(obj_list)
+        weights = [0.0] * len(columns)
+        for weigher_cls in weigher_classes:
+            start = time.time()
+            weigher = weigher_cls()
+            if weigher.supports_columns:
+                multiplier = weigher._weight_multiplier()
+                weights = [weight + multiplier * host_weight
+                           for weight, host_weight in zip(weights,
+                               weigher.weigh_columns(columns,
+                                                     weighing_properties))]
+            else:
+                weighed_objs = [self.object_class(obj, weight)
+                                for obj, weight in zip(columns.host_states,
+                                                       weights)]
+                weigher.weigh_objects(weighed_objs, weighing_properties)
+                weights = [weighed_obj.weight for weighed_obj in weighed_objs]
+            self.add_weigher_stats(weigher_cls.__name__, start, len(columns))
+
+        weighed_objs = [self.object_class(obj, weight)
+                        for obj, weight in zip(columns.host_states, weights)]
+        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+
 
 def all_weighers():
     """Return a list of weight plugin classes found in this directory."""
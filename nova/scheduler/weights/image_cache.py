@@ -0,0 +1,63 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Image Cache Weigher.  Weigh hosts by whether they have the image of the
+instance cached.
+
+Hosts report the images they have cached in their stats, which only some
+virt drivers do.  The weight of a host holding the image is the value of
+the 'image_cache_weight_multiplier' option, to be weighed against the free
+RAM in MB of the RAM weigher.
+"""
+
+from oslo.config import cfg
+
+from nova.scheduler import weights
+
+image_cache_weight_opts = [
+        cfg.FloatOpt('image_cache_weight_multiplier',
+                     default=1.0,
+                     help='Multiplier used for weighing hosts which have the '
+                          'image of the instance cached. It adds to the free '
+                          'RAM in MB the RAM weigher weighs hosts by, so it '
+                          'has to be in the thousands to outweigh it.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_cache_weight_opts)
+
+
+class ImageCacheWeigher(weights.BaseHostWeigher):
+    supports_columns = True
+
+    def _weight_multiplier(self):
+        """Override the weight multiplier."""
+        return CONF.image_cache_weight_multiplier
+
+    @staticmethod
+    def _get_image_id(weight_properties):
+        spec = weight_properties.get('request_spec') or {}
+        return spec.get('instance_properties', {}).get('image_ref')
+
+    def _weigh_object(self, host_state, weight_properties):
+        """Higher weights win.  We want hosts with the image cached."""
+        image_id = self._get_image_id(weight_properties)
+        return image_id in host_state.cached_images and 1.0 or 0.0
+
+    def weigh_columns(self, columns, weight_properties):
+        image_id = self._get_image_id(weight_properties)
+        return [image_id in cached_images and 1.0 or 0.0
+                for cached_images in columns['cached_images']]
@@ -845,6 +845,35 @@ class CloudTestCase(test.TestCase):
         db.service_destroy(self.context, comp1['id'])
         db.service_destroy(self.context, comp2['id'])
 
+    def test_ids_to_ec2_inst_ids(self):
+        inst1 = db.instance_create(self.context, {})
+        inst2 = db.instance_create(self.context, {})
+        ec2_id1 = ec2utils.id_to_ec2_inst_id(inst1['uuid'])
+        ec2utils.reset_cache()
+
+        self.mox.StubOutWithMock(db, 'get_ec2_instance_id_by_uuid')
+        self.mox.ReplayAll()
+        ec2_ids = ec2utils.ids_to_ec2_inst_ids([inst1['uuid'],
+                                                inst2['uuid']])
+        self.assertEqual(ec2_id1, ec2_ids[inst1['uuid']])
+        self.assertEqual(ec2utils.id_to_ec2_inst_id(inst2['uuid']),
+                         ec2_ids[inst2['uuid']])
+
+    def test_glance_ids_to_ids(self):
+        image_id = ec2utils.glance_id_to_id(self.context, 'fake-image-1')
+        ec2utils.reset_cache()
+
+        self.mox.StubOutWithMock(db, 's3_image_get_by_uuid')
+        self.mox.ReplayAll()
+        image_ids = ec2utils.glance_ids_to_ids(
+            self.context, ['fake-image-1', 'fake-image-2', None])
+        self.assertEqual(['fake-image-1', 'fake-image-2'],
+                         sorted(image_ids.keys()))
+        self.assertEqual(image_id, image_ids['fake-image-1'])
+        self.assertEqual(image_ids['fake-image-2'],
+                         ec2utils.glance_id_to_id(self.context,
+                                                  'fake-image-2'))
+
     def test_describe_instances_all_invalid(self):
         # Makes sure describe_instances works and filters results.
         self.flags(use_ipv6=True)
@@ -0,0 +1,97 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import webob
+import webob.dec
+
+from nova.api.openstack.compute import servers_cache
+from nova.compute import list_cache
+from nova import context
+from nova import notifications
+from nova import test
+
+
+class ServersDetailCacheTest(test.NoDBTestCase):
+    def setUp(self):
+        super(ServersDetailCacheTest, self).setUp()
+        self.flags(instance_list_cache_ttl=10)
+        list_cache.reset_cache()
+        self.addCleanup(list_cache.reset_cache)
+        self.calls = 0
+
+        @webob.dec.wsgify
+        def fake_app(req):
+            self.calls += 1
+            resp = webob.Response(body='servers %d' % self.calls)
+            resp.headers['x-compute-request-id'] = (
+                req.environ['nova.context'].request_id)
+            return resp
+
+        self.app = servers_cache.ServersDetailCache(fake_app)
+
+    def _get(self, url, project_id='fake', roles=None, method='GET'):
+        req = webob.Request.blank(url, method=method)
+        req.environ['nova.context'] = context.RequestContext(
+            'fake_user', project_id, roles=roles or [])
+        return req.get_response(self.app), req.environ['nova.context']
+
+    def test_cached(self):
+        resp, ctxt = self._get('/v2/fake/servers/detail')
+        self.assertEqual('servers 1', resp.body)
+        resp, ctxt = self._get('/v2/fake/servers/detail')
+        self.assertEqual('servers 1', resp.body)
+        self.assertEqual(ctxt.request_id,
+                         resp.headers['x-compute-request-id'])
+        self.assertEqual(1, self.calls)
+
+    def test_keyed_by_request(self):
+        self._get('/v2/fake/servers/detail')
+        self._get('/v2/fake/servers/detail?name=foo')
+        self._get('/v2/fake/servers/detail', roles=['admin'])
+        self._get('/v2/other/servers/detail', project_id='other')
+        self.assertEqual(4, self.calls)
+
+    def test_not_cached(self):
+        self._get('/v2/fake/servers')
+        self._get('/v2/fake/servers')
+        self._get('/v2/fake/servers/detail?all_tenants=1')
+        self._get('/v2/fake/servers/detail?all_tenants=1')
+        self._get('/v2/fake/servers/detail', method='POST')
+        self._get('/v2/fake/servers/detail', method='POST')
+        self.assertEqual(6, self.calls)
+
+    def test_disabled(self):
+        self.flags(instance_list_cache_ttl=0)
+        self._get('/v2/fake/servers/detail')
+        self._get('/v2/fake/servers/detail')
+        self.assertEqual(2, self.calls)
+
+    def test_invalidate(self):
+        self._get('/v2/fake/servers/detail')
+        self._get('/v2/other/servers/detail', project_id='other')
+        list_cache.invalidate('fake')
+        resp, ctxt = self._get('/v2/fake/servers/detail')
+        self.assertEqual('servers 3', resp.body)
+        self._get('/v2/other/servers/detail', project_id='other')
+        self.assertEqual(3, self.calls)
+
+    def test_invalidated_by_instance_update(self):
+        self._get('/v2/fake/servers/detail')
+        instance = {'project_id': 'fake', 'vm_state': 'active',
+                    'task_state': None}
+        notifications.send_update(context.get_admin_context(), instance,
+                                  instance)
+        self._get('/v2/fake/servers/detail')
+        self.assertEqual(2, self.calls)
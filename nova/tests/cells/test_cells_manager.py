@@ -193,6 +193,16 @@ class CellsManagerClassTestCase(test.NoDBTestCase):
         self.cells_manager.bw_usage_update_at_top(
                 self.ctxt, bw_update_info='fake-bw-info')
 
+    def test_bw_usages_update_at_top(self):
+        self.mox.StubOutWithMock(self.msg_runner,
+                                 'bw_usages_update_at_top')
+        self.msg_runner.bw_usages_update_at_top(self.ctxt,
+                'fake-start-period', 'fake-bw-usages', 'fake-refreshed')
+        self.mox.ReplayAll()
+        self.cells_manager.bw_usages_update_at_top(
+                self.ctxt, start_period='fake-start-period',
+                bw_usages='fake-bw-usages', last_refreshed='fake-refreshed')
+
     def test_heal_instances(self):
         self.flags(instance_updated_at_threshold=1000,
                    instance_update_num_instances=2,
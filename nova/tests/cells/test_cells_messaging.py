@@ -1589,6 +1589,28 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         self.src_msg_runner.bw_usage_update_at_top(self.ctxt,
                                                    fake_bw_update_info)
 
+    def test_bw_usages_update_at_top(self):
+        fake_bw_usages = [{'uuid': 'fake_uuid',
+                           'mac': 'fake_mac',
+                           'bw_in': 'fake_bw_in',
+                           'bw_out': 'fake_bw_out',
+                           'last_ctr_in': 'fake_last_ctr_in',
+                           'last_ctr_out': 'fake_last_ctr_out'}]
+
+        # Shouldn't be called for these 2 cells
+        self.mox.StubOutWithMock(self.src_db_inst, 'bw_usage_update_all')
+        self.mox.StubOutWithMock(self.mid_db_inst, 'bw_usage_update_all')
+
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'bw_usage_update_all')
+        self.tgt_db_inst.bw_usage_update_all(self.ctxt,
+                'fake_start_period', fake_bw_usages,
+                last_refreshed='fake_last_refreshed', update_cells=False)
+
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.bw_usages_update_at_top(self.ctxt,
+                'fake_start_period', fake_bw_usages, 'fake_last_refreshed')
+
     def test_sync_instances(self):
         # Reset this, as this is a broadcast down.
         self._setup_attrs(up=False)
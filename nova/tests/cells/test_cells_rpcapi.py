@@ -236,6 +236,45 @@ class CellsAPITestCase(test.NoDBTestCase):
         self._check_result(call_info, 'bw_usage_update_at_top',
                 expected_args)
 
+    def test_bw_usages_update_at_top(self):
+        bw_usages = [{'uuid': 'fake_uuid', 'mac': 'fake_mac',
+                      'bw_in': 'fake_bw_in', 'bw_out': 'fake_bw_out',
+                      'last_ctr_in': 'fake_ctr_in',
+                      'last_ctr_out': 'fake_ctr_out'}]
+
+        call_info = self._stub_rpc_method('cast', None)
+
+        self.cells_rpcapi.bw_usages_update_at_top(
+                self.fake_context, 'fake_start_period', bw_usages,
+                last_refreshed='fake_refreshed')
+
+        expected_args = {'start_period': 'fake_start_period',
+                         'bw_usages': bw_usages,
+                         'last_refreshed': 'fake_refreshed'}
+        self._check_result(call_info, 'bw_usages_update_at_top',
+                expected_args, version='1.25')
+
+    def test_bw_usages_update_at_top_version_cap(self):
+        self.flags(cells='1.24', group='upgrade_levels')
+        self.cells_rpcapi = cells_rpcapi.CellsAPI()
+        bw_usages = [{'uuid': 'fake_uuid', 'mac': 'fake_mac',
+                      'bw_in': 'fake_bw_in', 'bw_out': 'fake_bw_out',
+                      'last_ctr_in': 'fake_ctr_in',
+                      'last_ctr_out': 'fake_ctr_out'}]
+
+        call_info = self._stub_rpc_method('cast', None)
+
+        self.cells_rpcapi.bw_usages_update_at_top(
+                self.fake_context, 'fake_start_period', bw_usages,
+                last_refreshed='fake_refreshed')
+
+        bw_update_info = dict(bw_usages[0],
+                              start_period='fake_start_period',
+                              last_refreshed='fake_refreshed')
+        expected_args = {'bw_update_info': bw_update_info}
+        self._check_result(call_info, 'bw_usage_update_at_top',
+                expected_args)
+
     def test_get_cell_info_for_neighbors(self):
         call_info = self._stub_rpc_method('call', 'fake_response')
         result = self.cells_rpcapi.get_cell_info_for_neighbors(
@@ -28,57 +28,80 @@ class CellsUtilsTestCase(test.NoDBTestCase):
     def test_get_instances_to_sync(self):
         fake_context = 'fake_context'
 
-        call_info = {'get_all': 0, 'shuffle': 0}
+        call_info = {'get_all': 0, 'iter': 0, 'shuffle': 0}
 
         def random_shuffle(_list):
             call_info['shuffle'] += 1
 
         def instance_get_all_by_filters(context, filters,
-                sort_key, sort_order):
+                sort_key, sort_order, columns_to_join=None):
             self.assertEqual(context, fake_context)
             self.assertEqual(sort_key, 'deleted')
             self.assertEqual(sort_order, 'asc')
             call_info['got_filters'] = filters
+            call_info['got_columns'] = columns_to_join
             call_info['get_all'] += 1
-            return ['fake_instance1', 'fake_instance2', 'fake_instance3']
+            return [{'uuid': 'fake_uuid1'}, {'uuid': 'fake_uuid2'},
+                    {'uuid': 'fake_uuid3'}]
+
+        def instance_get_all_by_filters_iter(context, filters,
+                columns_to_join=None):
+            self.assertEqual(context, fake_context)
+            call_info.setdefault('got_iter_filters', []).append(filters)
+            call_info['got_columns'] = columns_to_join
+            call_info['iter'] += 1
+            if filters.get('deleted'):
+                return iter(['fake_instance3'])
+            return iter(['fake_instance1', 'fake_instance2'])
 
         self.stubs.Set(db, 'instance_get_all_by_filters',
                 instance_get_all_by_filters)
+        self.stubs.Set(db, 'instance_get_all_by_filters_iter',
+                instance_get_all_by_filters_iter)
         self.stubs.Set(random, 'shuffle', random_shuffle)
 
         instances = cells_utils.get_instances_to_sync(fake_context)
         self.assertTrue(inspect.isgenerator(instances))
-        self.assertEqual(len([x for x in instances]), 3)
-        self.assertEqual(call_info['get_all'], 1)
-        self.assertEqual(call_info['got_filters'], {})
+        self.assertEqual([x for x in instances],
+                         ['fake_instance1', 'fake_instance2',
+                          'fake_instance3'])
+        self.assertEqual(call_info['get_all'], 0)
+        self.assertEqual(call_info['iter'], 2)
+        self.assertEqual(call_info['got_iter_filters'],
+                [{'deleted': False, 'soft_deleted': True},
+                 {'deleted': True, 'soft_deleted': False}])
+        self.assertEqual(call_info['got_columns'], None)
         self.assertEqual(call_info['shuffle'], 0)
 
         instances = cells_utils.get_instances_to_sync(fake_context,
                                                       shuffle=True)
         self.assertTrue(inspect.isgenerator(instances))
         self.assertEqual(len([x for x in instances]), 3)
-        self.assertEqual(call_info['get_all'], 2)
+        self.assertEqual(call_info['get_all'], 1)
         self.assertEqual(call_info['got_filters'], {})
         self.assertEqual(call_info['shuffle'], 1)
 
+        call_info['got_iter_filters'] = []
         instances = cells_utils.get_instances_to_sync(fake_context,
-                updated_since='fake-updated-since')
+                updated_since='fake-updated-since', deleted=False)
         self.assertTrue(inspect.isgenerator(instances))
-        self.assertEqual(len([x for x in instances]), 3)
-        self.assertEqual(call_info['get_all'], 3)
-        self.assertEqual(call_info['got_filters'],
-                {'changes-since': 'fake-updated-since'})
+        self.assertEqual(len([x for x in instances]), 2)
+        self.assertEqual(call_info['iter'], 3)
+        self.assertEqual(call_info['got_iter_filters'],
+                [{'changes-since': 'fake-updated-since', 'deleted': False}])
         self.assertEqual(call_info['shuffle'], 1)
 
         instances = cells_utils.get_instances_to_sync(fake_context,
                 project_id='fake-project',
-                updated_since='fake-updated-since', shuffle=True)
+                updated_since='fake-updated-since', shuffle=True,
+                uuids_only=True)
         self.assertTrue(inspect.isgenerator(instances))
         self.assertEqual(len([x for x in instances]), 3)
-        self.assertEqual(call_info['get_all'], 4)
+        self.assertEqual(call_info['get_all'], 2)
         self.assertEqual(call_info['got_filters'],
                 {'changes-since': 'fake-updated-since',
                  'project_id': 'fake-project'})
+        self.assertEqual(call_info['got_columns'], [])
         self.assertEqual(call_info['shuffle'], 2)
 
     def test_split_cell_and_item(self):
@@ -4893,12 +4893,16 @@ class ComputeTestCase(BaseTestCase):
         instance2 = self._create_fake_instance({"deleted_at": deleted_at,
                                                 "deleted": True})
 
-        self.mox.StubOutWithMock(self.compute, '_get_instances_on_driver')
-        self.compute._get_instances_on_driver(
+        self.mox.StubOutWithMock(self.compute.driver, 'list_instance_uuids')
+        self.compute.driver.list_instance_uuids().AndReturn(
+            [instance1['uuid'], instance2['uuid']])
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'iter_by_filters')
+        instance_obj.InstanceList.iter_by_filters(
             admin_context, {'deleted': True,
                             'soft_deleted': False,
-                            'host': self.compute.host}).AndReturn([instance1,
-                                                                   instance2])
+                            'host': self.compute.host,
+                            'uuid': [instance1['uuid'], instance2['uuid']]}
+            ).AndReturn(iter([instance1, instance2]))
         self.flags(running_deleted_instance_timeout=3600,
                    running_deleted_instance_action='reap')
 
@@ -4933,11 +4937,15 @@ class ComputeTestCase(BaseTestCase):
         instance1['deleted'] = True
         instance1['deleted_at'] = "sometimeago"
 
-        self.mox.StubOutWithMock(self.compute, '_get_instances_on_driver')
-        self.compute._get_instances_on_driver(
+        self.mox.StubOutWithMock(self.compute.driver, 'list_instance_uuids')
+        self.compute.driver.list_instance_uuids().AndReturn(['fake-uuid'])
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'iter_by_filters')
+        instance_obj.InstanceList.iter_by_filters(
             admin_context, {'deleted': True,
                             'soft_deleted': False,
-                            'host': self.compute.host}).AndReturn([instance1])
+                            'host': self.compute.host,
+                            'uuid': ['fake-uuid']}).AndReturn(
+                                iter([instance1]))
 
         self.mox.StubOutWithMock(timeutils, 'is_older_than')
         timeutils.is_older_than('sometimeago',
@@ -4945,7 +4953,33 @@ class ComputeTestCase(BaseTestCase):
 
         self.mox.ReplayAll()
         val = self.compute._running_deleted_instances(admin_context)
-        self.assertEqual(val, [instance1])
+        self.assertEqual(list(val), [instance1])
+
+    def test_running_deleted_instances_by_name(self):
+        admin_context = context.get_admin_context()
+
+        self.compute.host = 'host'
+
+        instance1 = {'name': 'instance-1', 'deleted': True,
+                     'deleted_at': None}
+        instance2 = {'name': 'instance-2', 'deleted': True,
+                     'deleted_at': None}
+
+        self.mox.StubOutWithMock(self.compute.driver, 'list_instance_uuids')
+        self.compute.driver.list_instance_uuids().AndRaise(
+            NotImplementedError())
+        self.mox.StubOutWithMock(self.compute.driver, 'list_instances')
+        self.compute.driver.list_instances().AndReturn(['instance-2'])
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'iter_by_filters')
+        instance_obj.InstanceList.iter_by_filters(
+            admin_context, {'deleted': True,
+                            'soft_deleted': False,
+                            'host': self.compute.host}).AndReturn(
+                                iter([instance1, instance2]))
+
+        self.mox.ReplayAll()
+        val = self.compute._running_deleted_instances(admin_context)
+        self.assertEqual(list(val), [instance2])
 
     def test_get_instance_nw_info(self):
         fake_network.unset_stub_network_methods(self.stubs)
@@ -4971,9 +5005,46 @@ class ComputeTestCase(BaseTestCase):
                                                     fake_instance)
         self.assertEqual(fake_nw_info, result)
 
+    def _stub_heal_instance_info_cache(self, instances, instance_map):
+        call_info = {'get_all_by_host': 0, 'get_by_uuid': 0,
+                'get_all_by_filters': 0, 'healed': [], 'batches': []}
+
+        def fake_instance_get_all_by_host(context, host, columns_to_join):
+            call_info['get_all_by_host'] += 1
+            self.assertEqual(['info_cache'], columns_to_join)
+            return instances[:]
+
+        def fake_instance_get_all_by_filters(context, filters, sort_key,
+                                             sort_dir, limit=None,
+                                             marker=None,
+                                             columns_to_join=None):
+            call_info['get_all_by_filters'] += 1
+            self.assertEqual(['system_metadata', 'info_cache'],
+                             columns_to_join)
+            self.assertFalse(filters['deleted'])
+            found = [instance_map[uuid] for uuid in filters['uuid']
+                     if uuid in instance_map]
+            call_info['get_by_uuid'] += len(found)
+            return found
+
+        # NOTE(comstud): Override the stub in setUp()
+        def fake_get_instance_nw_info_bulk(context, instances):
+            uuids = [instance['uuid'] for instance in instances]
+            call_info['batches'].append(uuids)
+            call_info['healed'].extend(uuids)
+
+        self.stubs.Set(db, 'instance_get_all_by_host',
+                fake_instance_get_all_by_host)
+        self.stubs.Set(db, 'instance_get_all_by_filters',
+                fake_instance_get_all_by_filters)
+        self.stubs.Set(self.compute.network_api, 'get_instance_nw_info_bulk',
+                fake_get_instance_nw_info_bulk)
+        return call_info
+
     def test_heal_instance_info_cache(self):
         # Update on every call for the test
-        self.flags(heal_instance_info_cache_interval=-1)
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=1)
         ctxt = context.get_admin_context()
 
         instance_map = {}
@@ -4985,72 +5056,139 @@ class ComputeTestCase(BaseTestCase):
             # These won't be in our instance since they're not requested
             instances.append(instance_map[inst_uuid])
 
-        call_info = {'get_all_by_host': 0, 'get_by_uuid': 0,
-                'get_nw_info': 0, 'expected_instance': None}
-
-        def fake_instance_get_all_by_host(context, host, columns_to_join):
-            call_info['get_all_by_host'] += 1
-            self.assertEqual([], columns_to_join)
-            return instances[:]
-
-        def fake_instance_get_by_uuid(context, instance_uuid, columns_to_join):
-            if instance_uuid not in instance_map:
-                raise exception.InstanceNotFound(instance_id=instance_uuid)
-            call_info['get_by_uuid'] += 1
-            self.assertEqual(['system_metadata'], columns_to_join)
-            return instance_map[instance_uuid]
-
-        # NOTE(comstud): Override the stub in setUp()
-        def fake_get_instance_nw_info(context, instance):
-            # Note that this exception gets caught in compute/manager
-            # and is ignored.  However, the below increment of
-            # 'get_nw_info' won't happen, and you'll get an assert
-            # failure checking it below.
-            self.assertEqual(call_info['expected_instance']['uuid'],
-                             instance['uuid'])
-            call_info['get_nw_info'] += 1
+        call_info = self._stub_heal_instance_info_cache(instances,
+                                                        instance_map)
 
-        self.stubs.Set(db, 'instance_get_all_by_host',
-                fake_instance_get_all_by_host)
-        self.stubs.Set(db, 'instance_get_by_uuid',
-                fake_instance_get_by_uuid)
-        self.stubs.Set(self.compute, '_get_instance_nw_info',
-                fake_get_instance_nw_info)
-
-        call_info['expected_instance'] = instances[0]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(0, call_info['get_by_uuid'])
-        self.assertEqual(1, call_info['get_nw_info'])
+        self.assertEqual(1, call_info['get_by_uuid'])
+        self.assertEqual([instances[0]['uuid']], call_info['healed'])
 
-        call_info['expected_instance'] = instances[1]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(1, call_info['get_by_uuid'])
-        self.assertEqual(2, call_info['get_nw_info'])
+        self.assertEqual(2, call_info['get_by_uuid'])
+        self.assertEqual([instances[0]['uuid'], instances[1]['uuid']],
+                         call_info['healed'])
 
         # Make an instance switch hosts
         instances[2]['host'] = 'not-me'
         # Make an instance disappear
         instance_map.pop(instances[3]['uuid'])
         # '2' and '3' should be skipped..
-        call_info['expected_instance'] = instances[4]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(call_info['get_all_by_host'], 1)
-        # Incremented for '2' and '4'.. '3' caused a raise above.
-        self.assertEqual(call_info['get_by_uuid'], 3)
-        self.assertEqual(call_info['get_nw_info'], 3)
+        # Incremented for '2' and '4'.. '3' was not found.
+        self.assertEqual(call_info['get_by_uuid'], 4)
+        self.assertEqual(instances[4]['uuid'], call_info['healed'][-1])
+        self.assertEqual(3, len(call_info['healed']))
         # Should be no more left.
         self.assertEqual(len(self.compute._instance_uuids_to_heal), 0)
 
         # This should cause a DB query now so we get first instance
         # back again
-        call_info['expected_instance'] = instances[0]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(call_info['get_all_by_host'], 2)
-        # Stays the same, because the instance came from the DB
-        self.assertEqual(call_info['get_by_uuid'], 3)
-        self.assertEqual(call_info['get_nw_info'], 4)
+        self.assertEqual(call_info['get_by_uuid'], 5)
+        self.assertEqual(instances[0]['uuid'], call_info['healed'][-1])
+        self.assertEqual(4, len(call_info['healed']))
+
+    def test_heal_instance_info_cache_batch(self):
+        # Update on every call for the test
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=3)
+        ctxt = context.get_admin_context()
+
+        instance_map = {}
+        instances = []
+        # Caches updated the longest time ago are healed first.
+        updated_ats = [datetime.datetime(2013, 10, 3),
+                       datetime.datetime(2013, 10, 1),
+                       datetime.datetime(2013, 10, 2), None, None]
+        for x in xrange(5):
+            inst_uuid = 'fake-uuid-%s' % x
+            info_cache = None
+            if x < 3:
+                info_cache = {'instance_uuid': inst_uuid,
+                              'network_info': '[{"id": "fake-vif"}]',
+                              'updated_at': updated_ats[x]}
+            instance_map[inst_uuid] = fake_instance.fake_db_instance(
+                uuid=inst_uuid, host=CONF.host, created_at=None,
+                info_cache=info_cache)
+            instances.append(instance_map[inst_uuid])
+
+        call_info = self._stub_heal_instance_info_cache(instances,
+                                                        instance_map)
+
+        # The instances without network info are healed first.
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual([['fake-uuid-3', 'fake-uuid-4', 'fake-uuid-1']],
+                         call_info['batches'])
+
+        # The rest of the instances are read with one query, and healed
+        # with one call.
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual(1, call_info['get_all_by_host'])
+        self.assertEqual(2, call_info['get_all_by_filters'])
+        self.assertEqual([['fake-uuid-3', 'fake-uuid-4', 'fake-uuid-1'],
+                          ['fake-uuid-2', 'fake-uuid-0']],
+                         call_info['batches'])
+        self.assertEqual([], self.compute._instance_uuids_to_heal)
+
+    def test_poll_bandwidth_usage(self):
+        self.flags(bandwidth_poll_interval=1)
+        self.flags(bandwidth_update_interval=0, group='cells')
+        ctxt = context.get_admin_context()
+        prev_time, start_time = utils.last_completed_audit_period()
+        bw_counters = [
+            # Existing usage in the current audit period
+            {'uuid': 'fake-uuid-1', 'mac_address': 'fake-mac-1',
+             'bw_in': 1100, 'bw_out': 2200},
+            # Usage in the previous audit period, with a counter rollover
+            {'uuid': 'fake-uuid-1', 'mac_address': 'fake-mac-2',
+             'bw_in': 300, 'bw_out': 600},
+            # No usage yet
+            {'uuid': 'fake-uuid-2', 'mac_address': 'fake-mac-3',
+             'bw_in': 10, 'bw_out': 20}]
+        usages = [{'uuid': 'fake-uuid-1', 'mac': 'fake-mac-1',
+                   'bw_in': 50, 'bw_out': 60,
+                   'last_ctr_in': 1000, 'last_ctr_out': 2000}]
+        prev_usages = [{'uuid': 'fake-uuid-1', 'mac': 'fake-mac-2',
+                        'bw_in': 1, 'bw_out': 2,
+                        'last_ctr_in': 400, 'last_ctr_out': 500}]
+
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'instance_get_all_by_host')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_all_bw_counters')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'bw_usage_get_by_uuids')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'bw_usage_update_all')
+
+        self.compute.conductor_api.instance_get_all_by_host(
+            ctxt, self.compute.host, columns_to_join=[]).AndReturn(
+                'fake-instances')
+        self.compute.driver.get_all_bw_counters('fake-instances').AndReturn(
+            bw_counters)
+        uuids = mox.SameElementsAs(['fake-uuid-1', 'fake-uuid-2'])
+        self.compute.conductor_api.bw_usage_get_by_uuids(
+            ctxt, uuids, start_time).AndReturn(usages)
+        self.compute.conductor_api.bw_usage_get_by_uuids(
+            ctxt, uuids, prev_time).AndReturn(prev_usages)
+        self.compute.conductor_api.bw_usage_update_all(
+            ctxt, start_time,
+            [{'uuid': 'fake-uuid-1', 'mac': 'fake-mac-1',
+              'bw_in': 150, 'bw_out': 260,
+              'last_ctr_in': 1100, 'last_ctr_out': 2200},
+             {'uuid': 'fake-uuid-1', 'mac': 'fake-mac-2',
+              'bw_in': 300, 'bw_out': 100,
+              'last_ctr_in': 300, 'last_ctr_out': 600},
+             {'uuid': 'fake-uuid-2', 'mac': 'fake-mac-3',
+              'bw_in': 0, 'bw_out': 0,
+              'last_ctr_in': 10, 'last_ctr_out': 20}],
+            last_refreshed=mox.IgnoreArg(), update_cells=False)
+        self.mox.ReplayAll()
+
+        self.compute._poll_bandwidth_usage(ctxt)
 
     def test_poll_rescued_instances(self):
         timed_out_time = timeutils.utcnow() - datetime.timedelta(minutes=5)
@@ -5523,6 +5661,21 @@ class ComputeTestCase(BaseTestCase):
 
         self.compute._init_instance(admin_context, instance)
 
+    def test_cache_images(self):
+        self.mox.StubOutWithMock(self.compute.driver, 'cache_image')
+        self.compute.driver.cache_image(self.context, 'image1').AndRaise(
+            test.TestingException)
+        self.compute.driver.cache_image(self.context, 'image2')
+        self.mox.ReplayAll()
+        self.compute.cache_images(self.context, ['image1', 'image2'])
+
+    def test_cache_images_not_implemented(self):
+        self.mox.StubOutWithMock(self.compute.driver, 'cache_image')
+        self.compute.driver.cache_image(self.context, 'image1').AndRaise(
+            NotImplementedError)
+        self.mox.ReplayAll()
+        self.compute.cache_images(self.context, ['image1', 'image2'])
+
     def test_add_remove_fixed_ip_updates_instance_updated_at(self):
         def _noop(*args, **kwargs):
             pass
@@ -5672,6 +5825,92 @@ class ComputeTestCase(BaseTestCase):
         self.mox.ReplayAll()
         self.compute._sync_power_states(ctxt)
 
+    def test_sync_power_states_skips_instances_in_sync(self):
+        ctxt = self.context.elevated()
+        self._create_fake_instance({'host': self.compute.host,
+                                    'vm_state': vm_states.ACTIVE,
+                                    'power_state': power_state.RUNNING})
+        instance = self._create_fake_instance(
+                {'host': self.compute.host,
+                 'vm_state': vm_states.ACTIVE,
+                 'power_state': power_state.RUNNING})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+
+        self.compute.driver.get_info(mox.IgnoreArg()).AndReturn(
+            {'state': power_state.RUNNING})
+        self.compute.driver.get_info(mox.IgnoreArg()).AndReturn(
+            {'state': power_state.SHUTDOWN})
+        self.compute._sync_instance_power_state(
+                ctxt, mox.ContainsKeyValue('uuid', instance['uuid']),
+                power_state.SHUTDOWN)
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
+    def test_sync_power_states_get_info_all_fails(self):
+        ctxt = self.context.elevated()
+        self._create_fake_instance({'host': self.compute.host})
+        self._create_fake_instance({'host': self.compute.host})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info_all')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+
+        self.compute.driver.get_info_all(mox.IgnoreArg()).AndRaise(
+            test.TestingException())
+        # Instances whose power state cannot be read are not synced.
+        self.compute.driver.get_info(mox.IgnoreArg()).AndRaise(
+            test.TestingException())
+        self.compute.driver.get_info(mox.IgnoreArg()).AndReturn(
+            {'state': power_state.RUNNING})
+        self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
+                                                power_state.RUNNING)
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
+    def test_sync_power_states_uses_recent_events(self):
+        self.flags(power_state_event_lifetime=600)
+        ctxt = self.context.elevated()
+        instance1 = self._create_fake_instance({'host': self.compute.host})
+        instance2 = self._create_fake_instance({'host': self.compute.host})
+        self.compute._event_power_states = {
+            instance1['uuid']: (power_state.RUNNING, time.time()),
+            'deleted-uuid': (power_state.RUNNING, time.time())}
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info_all')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+
+        # Only the instance without a recent event is polled.
+        self.compute.driver.get_info_all(
+                [mox.ContainsKeyValue('uuid', instance2['uuid'])]).AndReturn(
+            {instance2['uuid']: {'state': power_state.SHUTDOWN}})
+        self.compute._sync_instance_power_state(
+                ctxt, mox.ContainsKeyValue('uuid', instance1['uuid']),
+                power_state.RUNNING)
+        self.compute._sync_instance_power_state(
+                ctxt, mox.ContainsKeyValue('uuid', instance2['uuid']),
+                power_state.SHUTDOWN)
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+        self.assertEqual([instance1['uuid']],
+                         self.compute._event_power_states.keys())
+
+    def test_sync_power_states_expires_events(self):
+        self.flags(power_state_event_lifetime=600)
+        ctxt = self.context.elevated()
+        instance = self._create_fake_instance({'host': self.compute.host})
+        self.compute._event_power_states = {
+            instance['uuid']: (power_state.RUNNING, time.time() - 600)}
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info_all')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+
+        self.compute.driver.get_info_all(
+                [mox.ContainsKeyValue('uuid', instance['uuid'])]).AndReturn(
+            {instance['uuid']: {'state': power_state.SHUTDOWN}})
+        self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
+                                                power_state.SHUTDOWN)
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+        self.assertEqual({}, self.compute._event_power_states)
+
     def _test_lifecycle_event(self, lifecycle_event, power_state):
         instance = self._create_fake_instance()
         uuid = instance['uuid']
@@ -5686,6 +5925,11 @@ class ComputeTestCase(BaseTestCase):
         self.compute.handle_events(event.LifecycleEvent(uuid, lifecycle_event))
         self.mox.VerifyAll()
         self.mox.UnsetStubs()
+        if power_state != None:
+            self.assertEqual(power_state,
+                             self.compute._event_power_states[uuid][0])
+        else:
+            self.assertNotIn(uuid, self.compute._event_power_states)
 
     def test_lifecycle_events(self):
         self._test_lifecycle_event(event.EVENT_LIFECYCLE_STOPPED,
@@ -8789,6 +9033,20 @@ class ComputeReschedulingTestCase(BaseTestCase):
         self.assertEqual(1, len(request_spec['instance_uuids']))
         self.assertEqual(self.updated_task_state, self.expected_task_state)
         self.assertEqual(exc_str, filter_properties['retry']['exc'])
+        self.assertFalse(filter_properties['retry']['claim_failed'])
+
+    def test_reschedule_claim_failed(self):
+        retry = dict(num_attempts=1)
+        filter_properties = dict(retry=retry)
+        request_spec = {'instance_uuids': ['foo']}
+        try:
+            raise exception.ComputeResourcesUnavailable()
+        except exception.ComputeResourcesUnavailable:
+            exc_info = sys.exc_info()
+
+        self.assertTrue(self._reschedule(filter_properties=filter_properties,
+            request_spec=request_spec, exc_info=exc_info))
+        self.assertTrue(filter_properties['retry']['claim_failed'])
 
 
 class ComputeReschedulingResizeTestCase(ComputeReschedulingTestCase):
@@ -518,6 +518,26 @@ class TrackerTestCase(BaseTrackerTestCase):
         self.assertEqual(0, self.tracker.compute_node['current_workload'])
         self._assert('{}', 'pci_stats')
 
+    def test_cached_images(self):
+        resources = self.tracker.driver.get_available_resource('fakenode')
+        resources['cached_images'] = ['image1']
+        self.stubs.Set(self.tracker.driver, 'get_available_resource',
+                       lambda nodename: dict(resources))
+        updates = []
+
+        def fake_compute_node_update(ctx, compute_node_id, values,
+                                     prune_stats=False):
+            updates.append(dict(values))
+            return self._fake_compute_node_update(ctx, compute_node_id,
+                                                  values, prune_stats)
+
+        self.stubs.Set(db, 'compute_node_update', fake_compute_node_update)
+        self.tracker.update_available_resource(self.context)
+        # No instances are on the host, the stats are still persisted
+        self.assertEqual(1, len(updates))
+        self.assertEqual(1, updates[0]['stats']['cached_image_image1'])
+        self.assertNotIn('cached_images', updates[0])
+
 
 class TrackerPciStatsTestCase(BaseTrackerTestCase):
 
@@ -156,6 +156,10 @@ class ComputeRpcAPITestCase(test.TestCase):
                 instance=self.fake_instance, migration={'id': 'fake_id'},
                 host='host', reservations=list('fake_res'), version='2.47')
 
+    def test_cache_images(self):
+        self._test_compute_api('cache_images', 'cast', host='host',
+                image_ids=['image1', 'image2'], version='2.48')
+
     def test_get_console_output(self):
         self._test_compute_api('get_console_output', 'call',
                 instance=self.fake_instance, tail_length='tl')
@@ -200,3 +200,9 @@ class StatsTestCase(test.NoDBTestCase):
 
         self.assertEqual(0, len(self.stats))
         self.assertEqual(0, len(self.stats.states))
+
+    def test_update_stats_for_cached_images(self):
+        self.stats.update_stats_for_cached_images(['image1', 'image2'])
+        self.stats.update_stats_for_cached_images(['image2', 'image3'])
+        self.assertEqual({'cached_image_image2': 1,
+                          'cached_image_image3': 1}, self.stats)
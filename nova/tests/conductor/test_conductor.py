@@ -242,6 +242,26 @@ class _BaseTestCase(object):
         result = self.conductor.bw_usage_update(*update_args)
         self.assertEqual(result, 'foo')
 
+    def test_bw_usage_get_by_uuids(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_get_by_uuids')
+        db.bw_usage_get_by_uuids(self.context, ['uuid1', 'uuid2'],
+                                 0).AndReturn(['foo'])
+        self.mox.ReplayAll()
+        result = self.conductor.bw_usage_get_by_uuids(self.context,
+                                                      ['uuid1', 'uuid2'], 0)
+        self.assertEqual(result, ['foo'])
+
+    def test_bw_usage_update_all(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_update_all')
+        bw_usages = [{'uuid': 'uuid', 'mac': 'mac', 'bw_in': 10,
+                      'bw_out': 20, 'last_ctr_in': 5, 'last_ctr_out': 10}]
+        db.bw_usage_update_all(self.context, 0, bw_usages,
+                               last_refreshed=20, update_cells=False)
+        self.mox.ReplayAll()
+        self.conductor.bw_usage_update_all(self.context, 0, bw_usages,
+                                           last_refreshed=20,
+                                           update_cells=False)
+
     def test_security_group_get_by_instance(self):
         fake_inst = {'uuid': 'fake-instance'}
         self.mox.StubOutWithMock(db, 'security_group_get_by_instance')
@@ -22,6 +22,7 @@
 import copy
 import datetime
 import iso8601
+import time
 import types
 import uuid as stdlib_uuid
 
@@ -37,6 +38,7 @@ from sqlalchemy.orm import query
 from sqlalchemy.sql.expression import select
 
 from nova import block_device
+from nova.cells import rpcapi as cells_rpcapi
 from nova.compute import vm_states
 from nova import context
 from nova import db
@@ -1437,6 +1439,48 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         filtered_instances = db.instance_get_all_by_filters(self.ctxt, {})
         self._assertEqualListsOfInstances(instances, filtered_instances)
 
+    def test_instance_get_batch_by_filters(self):
+        instances = [self.create_instance_with_args(host='host1')
+                     for i in range(3)]
+        self.create_instance_with_args(host='host2')
+        instances.sort(key=lambda instance: instance['id'])
+        result = db.instance_get_batch_by_filters(self.ctxt,
+                                                  {'host': 'host1'}, limit=2)
+        self.assertEqual([instances[0]['uuid'], instances[1]['uuid']],
+                         [instance['uuid'] for instance in result])
+        result = db.instance_get_batch_by_filters(
+                self.ctxt, {'host': 'host1'}, last_id=result[-1]['id'],
+                limit=2)
+        self.assertEqual([instances[2]['uuid']],
+                         [instance['uuid'] for instance in result])
+
+    def test_instance_get_all_by_filters_iter(self):
+        instances = [self.create_instance_with_args() for i in range(5)]
+        self.mox.StubOutWithMock(sqlalchemy_api,
+                                 'instance_get_batch_by_filters')
+        last_id = None
+        for batch in (instances[:2], instances[2:4], instances[4:]):
+            sqlalchemy_api.instance_get_batch_by_filters(
+                    self.ctxt, {}, last_id=last_id, limit=2,
+                    columns_to_join=[]).AndReturn(batch)
+            last_id = batch[-1]['id']
+        self.mox.ReplayAll()
+        result = db.instance_get_all_by_filters_iter(self.ctxt, {},
+                batch_size=2, columns_to_join=[])
+        self.assertEqual([instance['uuid'] for instance in instances],
+                         [instance['uuid'] for instance in result])
+
+    def test_instance_get_all_by_filters_iter_deleted_last(self):
+        instances = [self.create_instance_with_args() for i in range(3)]
+        instances.sort(key=lambda instance: instance['id'])
+        result = db.instance_get_all_by_filters_iter(
+                self.ctxt, {'deleted': False, 'soft_deleted': True},
+                batch_size=1)
+        self.assertEqual(instances[0]['uuid'], result.next()['uuid'])
+        db.instance_destroy(self.ctxt, instances[0]['uuid'])
+        self.assertEqual([instances[1]['uuid'], instances[2]['uuid']],
+                         [instance['uuid'] for instance in result])
+
     def test_instance_metadata_get_multi(self):
         uuids = [self.create_instance_with_args()['uuid'] for i in range(3)]
         meta = sqlalchemy_api._instance_metadata_get_multi(self.ctxt, uuids)
@@ -1637,6 +1681,23 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(result[0]['uuid'], instance['uuid'])
         self.assertEqual(result[0]['system_metadata'], [])
 
+    def test_instance_get_hosts_by_not_type(self):
+        self.create_instance_with_args(host='h1', instance_type_id=1)
+        self.create_instance_with_args(host='h2', instance_type_id=1)
+        self.create_instance_with_args(host='h2', instance_type_id=2)
+        self.create_instance_with_args(host='h3', instance_type_id=3)
+        self.create_instance_with_args(host=None, instance_type_id=4)
+        deleted = self.create_instance_with_args(host='h4',
+                                                 instance_type_id=5)
+        db.instance_destroy(self.ctxt, deleted['uuid'])
+
+        self.assertEqual(['h2', 'h3'],
+                         sorted(db.instance_get_hosts_by_not_type(self.ctxt,
+                                                                  1)))
+        self.assertEqual(['h1', 'h2'],
+                         sorted(db.instance_get_hosts_by_not_type(self.ctxt,
+                                                                  3)))
+
     def test_instance_get_all_hung_in_rebooting(self):
         # Ensure no instances are returned.
         results = db.instance_get_all_hung_in_rebooting(self.ctxt, 10)
@@ -4338,6 +4399,28 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+
+        bmds_values = [{'instance_uuid': uuid1,
+                        'device_name': 'first'},
+                       {'instance_uuid': uuid2,
+                        'device_name': 'second'},
+                       {'instance_uuid': uuid3,
+                        'device_name': 'third'}]
+
+        for bdm in bmds_values:
+            self._create_bdm(bdm)
+
+        bmd = db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, [uuid1, uuid2])
+        self.assertEqual(sorted(['first', 'second']),
+                         sorted([b['device_name'] for b in bmd]))
+        self.assertEqual([], db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, []))
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
@@ -5203,6 +5286,13 @@ class S3ImageTestCase(test.TestCase):
                          sorted([db.s3_image_get(self.ctxt, ref.id).uuid
                          for ref in self.images]))
 
+    def test_s3_image_get_all_by_uuids(self):
+        refs = db.s3_image_get_all_by_uuids(
+            self.ctxt, self.values[:2] + [uuidutils.generate_uuid()])
+        self.assertEqual(sorted(self.values[:2]),
+                         sorted([ref.uuid for ref in refs]))
+        self.assertEqual([], db.s3_image_get_all_by_uuids(self.ctxt, []))
+
     def test_s3_image_get_not_found(self):
         self.assertRaises(exception.ImageNotFound, db.s3_image_get, self.ctxt,
                           100500)
@@ -5340,6 +5430,46 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects(expected, result,
                                         ignored_keys=['stats'])
 
+    def test_compute_node_get_all_changed_since(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        since = timeutils.utcnow() + datetime.timedelta(seconds=10)
+        self.assertEqual([],
+                db.compute_node_get_all_changed_since(self.ctxt, since))
+
+        timeutils.advance_time_seconds(20)
+        db.compute_node_update(self.ctxt, self.item['id'], {'vcpus': 4})
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual(1, len(nodes))
+        node = nodes[0]
+        self.assertEqual(4, node['vcpus'])
+        self.assertEqual(0, node['deleted'])
+        self.assertEqual(self.service['id'], node['service']['id'])
+        self._stats_equal(self.stats, self._stats_as_dict(node['stats']))
+
+    def test_compute_node_get_all_changed_since_service_changed(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        since = timeutils.utcnow() + datetime.timedelta(seconds=10)
+
+        timeutils.advance_time_seconds(20)
+        db.service_update(self.ctxt, self.service['id'], {'disabled': True})
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual(1, len(nodes))
+        self.assertTrue(nodes[0]['service']['disabled'])
+
+    def test_compute_node_get_all_changed_since_deleted(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        since = timeutils.utcnow() + datetime.timedelta(seconds=10)
+
+        timeutils.advance_time_seconds(20)
+        db.service_destroy(self.ctxt, self.service['id'])
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual(1, len(nodes))
+        self.assertNotEqual(0, nodes[0]['deleted'])
+        self.assertEqual(None, nodes[0]['service'])
+
     def test_compute_node_get(self):
         compute_node_id = self.item['id']
         node = db.compute_node_get(self.ctxt, compute_node_id)
@@ -5965,6 +6095,50 @@ class BwUsageTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualObjects(bw_usage, expected_bw_usage,
                                  ignored_keys=self._ignored_keys)
 
+    def test_bw_usage_update_all(self):
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        refreshed = now - datetime.timedelta(seconds=5)
+
+        db.bw_usage_update(self.ctxt, 'fake_uuid1', 'fake_mac1',
+                           start_period, 100, 200, 12345, 67890,
+                           update_cells=False)
+        # Same instance and mac in another audit period
+        db.bw_usage_update(self.ctxt, 'fake_uuid1', 'fake_mac1',
+                           now, 1, 2, 3, 4, update_cells=False)
+
+        bw_usages = [{'uuid': 'fake_uuid1', 'mac': 'fake_mac1',
+                      'bw_in': 150, 'bw_out': 250,
+                      'last_ctr_in': 12395, 'last_ctr_out': 67940},
+                     {'uuid': 'fake_uuid1', 'mac': 'fake_mac2',
+                      'bw_in': 10, 'bw_out': 20,
+                      'last_ctr_in': 30, 'last_ctr_out': 40},
+                     {'uuid': 'fake_uuid2', 'mac': 'fake_mac3',
+                      'bw_in': 50, 'bw_out': 60,
+                      'last_ctr_in': 70, 'last_ctr_out': 80}]
+        db.bw_usage_update_all(self.ctxt, start_period, bw_usages,
+                               last_refreshed=refreshed, update_cells=False)
+
+        for bw_usage in bw_usages:
+            expected = dict(bw_usage, start_period=start_period,
+                            last_refreshed=refreshed)
+            usage = db.bw_usage_get(self.ctxt, bw_usage['uuid'],
+                                    start_period, bw_usage['mac'])
+            self._assertEqualObjects(expected, usage,
+                                     ignored_keys=self._ignored_keys)
+        # The other audit period is untouched
+        usage = db.bw_usage_get(self.ctxt, 'fake_uuid1', now, 'fake_mac1')
+        self.assertEqual(1, usage['bw_in'])
+
+    def test_bw_usage_update_all_updates_cells(self):
+        start_period = timeutils.utcnow()
+        self.mox.StubOutWithMock(cells_rpcapi.CellsAPI,
+                                 'bw_usages_update_at_top')
+        cells_rpcapi.CellsAPI.bw_usages_update_at_top(self.ctxt,
+                start_period, [], None)
+        self.mox.ReplayAll()
+        db.bw_usage_update_all(self.ctxt, start_period, [])
+
 
 class Ec2TestCase(test.TestCase):
 
@@ -6046,6 +6220,15 @@ class Ec2TestCase(test.TestCase):
         inst_id = db.get_ec2_instance_id_by_uuid(self.ctxt, 'fake-uuid')
         self.assertEqual(inst['id'], inst_id)
 
+    def test_get_ec2_instance_ids_by_uuids(self):
+        inst1 = db.ec2_instance_create(self.ctxt, 'fake-uuid1')
+        inst2 = db.ec2_instance_create(self.ctxt, 'fake-uuid2')
+        db.ec2_instance_create(self.ctxt, 'fake-uuid3')
+        inst_ids = db.get_ec2_instance_ids_by_uuids(
+            self.ctxt, ['fake-uuid1', 'fake-uuid2', 'uuid-not-present'])
+        self.assertEqual({'fake-uuid1': inst1['id'],
+                          'fake-uuid2': inst2['id']}, inst_ids)
+
     def test_get_instance_uuid_by_ec2_id(self):
         inst = db.ec2_instance_create(self.ctxt, 'fake-uuid')
         inst_uuid = db.get_instance_uuid_by_ec2_id(self.ctxt, inst['id'])
@@ -6300,6 +6483,116 @@ class ArchiveTestCase(test.TestCase):
         num = db.archive_deleted_rows_for_table(self.context, "console_pools")
         self.assertEqual(num, 1)
 
+    def test_archive_deleted_rows_fk_dependency_order(self):
+        # consoles.pool_id depends on console_pools.id
+        dialect = self.engine.url.get_dialect()
+        if dialect == sqlite.dialect:
+            import sqlite3
+            tup = sqlite3.sqlite_version_info
+            if tup[0] < 3 or (tup[0] == 3 and tup[1] < 7):
+                self.skipTest(
+                    'sqlite version too old for reliable SQLA foreign_keys')
+            self.conn.execute("PRAGMA foreign_keys = ON")
+        ins_stmt = self.console_pools.insert().values(deleted=1)
+        result = self.conn.execute(ins_stmt)
+        id1 = result.inserted_primary_key[0]
+        self.ids.append(id1)
+        ins_stmt = self.consoles.insert().values(deleted=1,
+                                                 pool_id=id1)
+        result = self.conn.execute(ins_stmt)
+        id2 = result.inserted_primary_key[0]
+        self.ids.append(id2)
+        # consoles is archived before console_pools in a single run.
+        num = db.archive_deleted_rows(self.context, max_rows=10)
+        self.assertEqual(num, 2)
+        rows = self.conn.execute(select([self.console_pools])).fetchall()
+        self.assertEqual(len(rows), 0)
+        rows = self.conn.execute(select([self.consoles])).fetchall()
+        self.assertEqual(len(rows), 0)
+
+    def test_archive_deleted_rows_fk_constraint_skips_referenced_rows(self):
+        # consoles.pool_id depends on console_pools.id
+        dialect = self.engine.url.get_dialect()
+        if dialect == sqlite.dialect:
+            import sqlite3
+            tup = sqlite3.sqlite_version_info
+            if tup[0] < 3 or (tup[0] == 3 and tup[1] < 7):
+                self.skipTest(
+                    'sqlite version too old for reliable SQLA foreign_keys')
+            self.conn.execute("PRAGMA foreign_keys = ON")
+        pool_ids = []
+        for unused in range(3):
+            ins_stmt = self.console_pools.insert().values(deleted=1)
+            result = self.conn.execute(ins_stmt)
+            pool_ids.append(result.inserted_primary_key[0])
+        self.ids.extend(pool_ids)
+        # A console which isn't deleted still references the first pool.
+        ins_stmt = self.consoles.insert().values(deleted=0,
+                                                 pool_id=pool_ids[0])
+        result = self.conn.execute(ins_stmt)
+        self.ids.append(result.inserted_primary_key[0])
+        num = db.archive_deleted_rows_for_table(self.context, "console_pools")
+        self.assertEqual(num, 2)
+        rows = self.conn.execute(select([self.console_pools.c.id])).fetchall()
+        self.assertEqual([(pool_ids[0],)], rows)
+
+    def test_archive_deleted_rows_for_table_in_batches(self):
+        self.stubs.Set(sqlalchemy_api, '_ARCHIVE_BATCH_SIZE', 4)
+        batches = []
+        orig_archive_rows_by_keys = sqlalchemy_api._archive_rows_by_keys
+
+        def fake_archive_rows_by_keys(*args):
+            batches.append(len(args[-1]))
+            return orig_archive_rows_by_keys(*args)
+
+        self.stubs.Set(sqlalchemy_api, '_archive_rows_by_keys',
+                       fake_archive_rows_by_keys)
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr,
+                                                                 deleted=1)
+            self.conn.execute(ins_stmt)
+        num = db.archive_deleted_rows_for_table(self.context,
+                                                "instance_id_mappings",
+                                                max_rows=None)
+        self.assertEqual(num, 6)
+        self.assertEqual([4, 2], batches)
+
+    def test_archive_deleted_rows_sleeps_after_each_batch(self):
+        self.stubs.Set(sqlalchemy_api, '_ARCHIVE_BATCH_SIZE', 4)
+        sleeps = []
+        self.stubs.Set(time, 'sleep', sleeps.append)
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr,
+                                                                 deleted=1)
+            self.conn.execute(ins_stmt)
+        num = db.archive_deleted_rows(self.context, max_rows=10, sleep=0.5)
+        self.assertEqual(num, 6)
+        self.assertEqual([0.5, 0.5], sleeps)
+
+    def test_archive_deleted_rows_reflects_schema_once(self):
+        self.stubs.Set(sqlalchemy_api, '_archive_metadata', None)
+        db.archive_deleted_rows(self.context, max_rows=1)
+        metadata = sqlalchemy_api._archive_metadata
+        self.mox.StubOutWithMock(MetaData, 'reflect')
+        self.mox.ReplayAll()
+        db.archive_deleted_rows(self.context, max_rows=1)
+        self.assertIs(metadata, sqlalchemy_api._archive_metadata)
+
+    def test_archive_deleted_rows_for_table_all(self):
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr,
+                                                                 deleted=1)
+            self.conn.execute(ins_stmt)
+        num = db.archive_deleted_rows_for_table(self.context,
+                                                "instance_id_mappings",
+                                                max_rows=None)
+        self.assertEqual(num, 6)
+        qsiim = select([self.shadow_instance_id_mappings]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                                self.uuidstrs))
+        rows = self.conn.execute(qsiim).fetchall()
+        self.assertEqual(len(rows), 6)
+
     def test_archive_deleted_rows_2_tables(self):
         # Add 6 rows to each table
         for uuidstr in self.uuidstrs:
@@ -272,3 +272,17 @@ class ApiTestCase(test.TestCase):
         self.stubs.Set(self.network_api, 'get', fake_get)
 
         self.network_api.associate(self.context, FAKE_UUID, project=None)
+
+    def test_get_instance_nw_info_bulk(self):
+        instances = [{'uuid': 'uuid1'}, {'uuid': 'uuid2'}, {'uuid': 'uuid3'}]
+
+        def fake_get_instance_nw_info(context, instance):
+            if instance['uuid'] == 'uuid2':
+                raise exception.InstanceNotFound(instance_id='uuid2')
+            return 'nw_info_%s' % instance['uuid']
+
+        self.stubs.Set(self.network_api, 'get_instance_nw_info',
+                       fake_get_instance_nw_info)
+        self.assertEqual({'uuid1': 'nw_info_uuid1', 'uuid3': 'nw_info_uuid3'},
+                         self.network_api.get_instance_nw_info_bulk(
+                             self.context, instances))
@@ -91,6 +91,10 @@ class MyComparator(mox.Comparator):
 
 
 class TestNeutronClient(test.TestCase):
+    def setUp(self):
+        super(TestNeutronClient, self).setUp()
+        self.stubs.Set(neutronv2, '_ADMIN_AUTH_TOKEN', None)
+
     def test_withtoken(self):
         self.flags(neutron_url='http://anyhost/')
         self.flags(neutron_url_timeout=30)
@@ -130,6 +134,37 @@ class TestNeutronClient(test.TestCase):
         self.mox.ReplayAll()
         neutronv2.get_client(my_context)
 
+    def test_admin_token_reused(self):
+        self.flags(neutron_auth_strategy='keystone')
+        self.flags(neutron_url='http://anyhost/')
+        my_context = context.RequestContext('userid', 'my_tenantid')
+        self.mox.StubOutWithMock(neutronv2, '_get_auth_token')
+        neutronv2._get_auth_token().AndReturn('admin_token')
+        self.mox.ReplayAll()
+        for admin in (True, False):
+            neutron = neutronv2.get_client(my_context, admin=admin)
+            self.assertTrue(isinstance(neutron, neutronv2.AdminClient))
+            self.assertEqual('admin_token', neutron.httpclient.auth_token)
+            self.assertEqual('http://anyhost/',
+                             neutron.httpclient.endpoint_url)
+
+    def test_admin_token_renewed(self):
+        self.flags(neutron_auth_strategy='keystone')
+        self.flags(neutron_url='http://anyhost/')
+        self.stubs.Set(neutronv2, '_ADMIN_AUTH_TOKEN', 'expired_token')
+
+        def fake_do_request(self, *args, **kwargs):
+            self.httpclient.auth_token = 'new_token'
+            return {'ports': []}
+
+        self.stubs.Set(client.Client, 'do_request', fake_do_request)
+        my_context = context.RequestContext('userid', 'my_tenantid')
+        neutron = neutronv2.get_client(my_context, admin=True)
+        self.assertEqual('expired_token', neutron.httpclient.auth_token)
+        neutron.list_ports()
+        neutron = neutronv2.get_client(my_context, admin=True)
+        self.assertEqual('new_token', neutron.httpclient.auth_token)
+
 
 class TestNeutronv2Base(test.TestCase):
 
@@ -422,23 +457,18 @@ class TestNeutronv2Base(test.TestCase):
             shared=False).AndReturn({'networks': nets})
         self.moxed_client.list_networks(
             shared=True).AndReturn({'networks': []})
-        for i in xrange(1, number + 1):
-            float_data = number == 1 and self.float_data1 or self.float_data2
-            for ip in port_data[i - 1]['fixed_ips']:
-                float_data = [x for x in float_data
-                              if x['fixed_ip_address'] == ip['ip_address']]
-                self.moxed_client.list_floatingips(
-                    fixed_ip_address=ip['ip_address'],
-                    port_id=port_data[i - 1]['id']).AndReturn(
-                        {'floatingips': float_data})
-            subnet_data = i == 1 and self.subnet_data1 or self.subnet_data2
-            self.moxed_client.list_subnets(
-                id=mox.SameElementsAs(['my_subid%s' % i])).AndReturn(
-                    {'subnets': subnet_data})
-            self.moxed_client.list_ports(
-                network_id=subnet_data[0]['network_id'],
-                device_owner='network:dhcp').AndReturn(
-                    {'ports': []})
+        float_data = number == 1 and self.float_data1 or self.float_data2
+        self.moxed_client.list_floatingips(
+            port_id=mox.SameElementsAs([port['id'] for port in port_data])
+            ).AndReturn({'floatingips': float_data})
+        subnet_data = self.subnet_data1 + self.subnet_data2[:number - 1]
+        self.moxed_client.list_subnets(
+            id=mox.SameElementsAs([subnet['id'] for subnet in subnet_data])
+            ).AndReturn({'subnets': subnet_data})
+        self.moxed_client.list_ports(
+            network_id=mox.SameElementsAs(
+                [subnet['network_id'] for subnet in subnet_data]),
+            device_owner='network:dhcp').AndReturn({'ports': []})
         self.mox.ReplayAll()
         nw_inf = api.get_instance_nw_info(self.context, self.instance)
         for i in xrange(0, number):
@@ -481,17 +511,14 @@ class TestNeutronv2(TestNeutronv2Base):
             tenant_id=self.instance['project_id'],
             device_id=self.instance['uuid']).AndReturn(
                 {'ports': self.port_data1})
-        port_data = self.port_data1
-        for ip in port_data[0]['fixed_ips']:
-            self.moxed_client.list_floatingips(
-                fixed_ip_address=ip['ip_address'],
-                port_id=port_data[0]['id']).AndReturn(
-                    {'floatingips': self.float_data1})
+        self.moxed_client.list_floatingips(
+            port_id=['my_portid1']).AndReturn(
+                {'floatingips': self.float_data1})
         self.moxed_client.list_subnets(
-            id=mox.SameElementsAs(['my_subid1'])).AndReturn(
+            id=['my_subid1']).AndReturn(
                 {'subnets': self.subnet_data1})
         self.moxed_client.list_ports(
-            network_id='my_netid1',
+            network_id=['my_netid1'],
             device_owner='network:dhcp').AndReturn(
                 {'ports': self.dhcp_port_data1})
         neutronv2.get_client(mox.IgnoreArg(),
@@ -502,6 +529,57 @@ class TestNeutronv2(TestNeutronv2Base):
                                           self.instance,
                                           networks=self.nets1)
         self._verify_nw_info(nw_inf, 0)
+        subnet = nw_inf[0]['network']['subnets'][0]
+        self.assertEqual('10.0.1.9', subnet.get_meta('dhcp_server'))
+
+    def test_get_instance_nw_info_bulk(self):
+        api = neutronapi.API()
+        self.mox.StubOutWithMock(api.db, 'instance_info_cache_update')
+        instances = []
+        for instance, port in zip([self.instance, self.instance2],
+                                  reversed(self.port_data2)):
+            port['tenant_id'] = instance['project_id']
+            instance = dict(instance)
+            instance['info_cache'] = {'network_info': jsonutils.dumps(
+                [{'network': {'id': port['network_id']}}])}
+            instances.append(instance)
+            api.db.instance_info_cache_update(
+                mox.IgnoreArg(), instance['uuid'], mox.IgnoreArg())
+        neutronv2.get_client(mox.IgnoreArg(),
+                             admin=True).MultipleTimes().AndReturn(
+            self.moxed_client)
+        self.moxed_client.list_ports(
+            device_id=[self.instance['uuid'], self.instance2['uuid']]
+            ).AndReturn({'ports': self.port_data2})
+        self.moxed_client.list_networks(
+            tenant_id=self.instance['project_id'],
+            shared=False).AndReturn({'networks': self.nets2})
+        self.moxed_client.list_networks(
+            shared=True).AndReturn({'networks': []})
+        self.moxed_client.list_floatingips(
+            port_id=['my_portid2', 'my_portid1']).AndReturn(
+                {'floatingips': self.float_data2})
+        self.moxed_client.list_subnets(
+            id=mox.SameElementsAs(['my_subid1', 'my_subid2'])).AndReturn(
+                {'subnets': self.subnet_data1 + self.subnet_data2})
+        self.moxed_client.list_ports(
+            network_id=mox.SameElementsAs(['my_netid1', 'my_netid2']),
+            device_owner='network:dhcp').AndReturn(
+                {'ports': self.dhcp_port_data1})
+        self.mox.ReplayAll()
+        nw_infos = api.get_instance_nw_info_bulk(self.context, instances)
+        self.assertEqual(2, len(nw_infos))
+        for instance, suffix in ((self.instance, 2), (self.instance2, 1)):
+            nw_info = nw_infos[instance['uuid']]
+            self.assertEqual(1, len(nw_info))
+            self.assertEqual('my_portid%s' % suffix, nw_info[0]['id'])
+            self.assertEqual('my_netname%s' % suffix,
+                             nw_info[0]['network']['label'])
+            self.assertEqual(['10.0.%s.2' % suffix],
+                             [ip['address'] for ip in nw_info.fixed_ips()])
+            self.assertEqual(['172.0.%s.2' % suffix],
+                             [ip['address']
+                              for ip in nw_info.floating_ips()])
 
     def test_get_instance_nw_info_without_subnet(self):
         # Test get instance_nw_info for a port without subnet.
@@ -850,13 +928,10 @@ class TestNeutronv2(TestNeutronv2Base):
         self.moxed_client.list_networks(shared=True).AndReturn(
             {'networks': []})
         float_data = number == 1 and self.float_data1 or self.float_data2
-        for data in port_data[1:]:
-            for ip in data['fixed_ips']:
-                self.moxed_client.list_floatingips(
-                    fixed_ip_address=ip['ip_address'],
-                    port_id=data['id']).AndReturn(
-                        {'floatingips': float_data[1:]})
-        for port in port_data[1:]:
+        if port_data[1:]:
+            self.moxed_client.list_floatingips(
+                port_id=[port['id'] for port in port_data[1:]]).AndReturn(
+                    {'floatingips': float_data[1:]})
             self.moxed_client.list_subnets(id=['my_subid2']).AndReturn({})
 
         self.mox.ReplayAll()
@@ -1454,11 +1529,17 @@ class TestNeutronv2(TestNeutronv2Base):
         NeutronNotFound = exceptions.NeutronClientException(
             status_code=404)
         self.moxed_client.list_floatingips(
-            fixed_ip_address='1.1.1.1', port_id=1).AndRaise(NeutronNotFound)
+            port_id=[1]).AndRaise(NeutronNotFound)
+        self.mox.ReplayAll()
+        neutronv2.get_client('fake')
+        floatingips = api._get_floating_ips_by_ports(self.moxed_client, [1])
+        self.assertEqual(floatingips, [])
+
+    def test_list_floating_ips_without_ports(self):
+        api = neutronapi.API()
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
-        floatingips = api._get_floating_ips_by_fixed_and_port(
-            self.moxed_client, '1.1.1.1', 1)
+        floatingips = api._get_floating_ips_by_ports(self.moxed_client, [])
         self.assertEqual(floatingips, [])
 
     def test_nw_info_get_ips(self):
@@ -1467,15 +1548,20 @@ class TestNeutronv2(TestNeutronv2Base):
                 {'ip_address': '1.1.1.1'}],
             'id': 'port-id',
             }
+        fake_floating_ips = [
+            {'port_id': 'port-id', 'fixed_ip_address': '1.1.1.1',
+             'floating_ip_address': '10.0.0.1'},
+            {'port_id': 'port-id', 'fixed_ip_address': '1.1.1.2',
+             'floating_ip_address': '10.0.0.2'},
+            {'port_id': 'other-port-id', 'fixed_ip_address': '1.1.1.1',
+             'floating_ip_address': '10.0.0.3'},
+            ]
         api = neutronapi.API()
-        self.mox.StubOutWithMock(api, '_get_floating_ips_by_fixed_and_port')
-        api._get_floating_ips_by_fixed_and_port(
-            self.moxed_client, '1.1.1.1', 'port-id').AndReturn(
-                [{'floating_ip_address': '10.0.0.1'}])
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
-        result = api._nw_info_get_ips(self.moxed_client, fake_port)
+        result = api._nw_info_get_ips(fake_port, fake_floating_ips)
         self.assertEqual(len(result), 1)
+        self.assertEqual(len(result[0]['floating_ips']), 1)
         self.assertEqual(result[0]['address'], '1.1.1.1')
         self.assertEqual(result[0]['floating_ips'][0]['address'], '10.0.0.1')
 
@@ -1490,11 +1576,12 @@ class TestNeutronv2(TestNeutronv2Base):
         fake_ips = [model.IP(x['ip_address']) for x in fake_port['fixed_ips']]
         api = neutronapi.API()
         self.mox.StubOutWithMock(api, '_get_subnets_from_port')
-        api._get_subnets_from_port(self.context, fake_port).AndReturn(
+        api._get_subnets_from_port(fake_port, 'ipam-subnets').AndReturn(
             [fake_subnet])
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
-        subnets = api._nw_info_get_subnets(self.context, fake_port, fake_ips)
+        subnets = api._nw_info_get_subnets(fake_port, fake_ips,
+                                           'ipam-subnets')
         self.assertEqual(len(subnets), 1)
         self.assertEqual(len(subnets[0]['ips']), 1)
         self.assertEqual(subnets[0]['ips'][0]['address'], '1.1.1.1')
@@ -1566,12 +1653,16 @@ class TestNeutronv2(TestNeutronv2Base):
         self.moxed_client.list_ports(
             tenant_id='fake', device_id='uuid').AndReturn(
                 {'ports': fake_ports})
-        self.mox.StubOutWithMock(api, '_get_floating_ips_by_fixed_and_port')
-        api._get_floating_ips_by_fixed_and_port(
-            self.moxed_client, '1.1.1.1', 'port0').AndReturn(
-                [{'floating_ip_address': '10.0.0.1'}])
+        self.mox.StubOutWithMock(api, '_get_floating_ips_by_ports')
+        api._get_floating_ips_by_ports(
+            self.moxed_client, ['port0']).AndReturn(
+                [{'port_id': 'port0', 'fixed_ip_address': '1.1.1.1',
+                  'floating_ip_address': '10.0.0.1'}])
+        self.mox.StubOutWithMock(api, '_get_subnets_from_ports')
+        api._get_subnets_from_ports(self.context, [fake_ports[0]]).AndReturn(
+            'ipam-subnets')
         self.mox.StubOutWithMock(api, '_get_subnets_from_port')
-        api._get_subnets_from_port(self.context, fake_ports[0]).AndReturn(
+        api._get_subnets_from_port(fake_ports[0], 'ipam-subnets').AndReturn(
             fake_subnets)
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
@@ -1584,6 +1675,45 @@ class TestNeutronv2(TestNeutronv2Base):
         self.assertEqual(nw_info[0]['ovs_interfaceid'], None)
         self.assertEqual(nw_info[0]['type'], model.VIF_TYPE_BRIDGE)
         self.assertEqual(nw_info[0]['network']['bridge'], 'brqnet-id')
+        self.assertEqual(['10.0.0.1'],
+                         [ip['address'] for ip in nw_info.floating_ips()])
+
+    def test_get_subnets_from_ports(self):
+        api = neutronapi.API()
+        fake_ports = [
+            {'fixed_ips': [{'ip_address': '10.0.1.2',
+                            'subnet_id': 'my_subid1'}]},
+            {'fixed_ips': [{'ip_address': '10.0.1.3',
+                            'subnet_id': 'my_subid1'},
+                           {'ip_address': '10.0.2.2',
+                            'subnet_id': 'my_subid2'}]},
+            {'fixed_ips': []},
+            ]
+        self.moxed_client.list_subnets(
+            id=mox.SameElementsAs(['my_subid1', 'my_subid2'])).AndReturn(
+                {'subnets': self.subnet_data1 + self.subnet_data2})
+        self.moxed_client.list_ports(
+            network_id=mox.SameElementsAs(['my_netid1', 'my_netid2']),
+            device_owner='network:dhcp').AndReturn(
+                {'ports': self.dhcp_port_data1})
+        self.mox.ReplayAll()
+        ipam_subnets = api._get_subnets_from_ports(self.context, fake_ports)
+        self.assertEqual(['my_subid1', 'my_subid2'], sorted(ipam_subnets))
+
+        subnets = api._get_subnets_from_port(fake_ports[1], ipam_subnets)
+        self.assertEqual(['10.0.1.0/24', '10.0.2.0/24'],
+                         [subnet['cidr'] for subnet in subnets])
+        self.assertEqual('10.0.1.9', subnets[0].get_meta('dhcp_server'))
+        self.assertEqual(None, subnets[1].get_meta('dhcp_server'))
+        self.assertEqual([], api._get_subnets_from_port(fake_ports[2],
+                                                        ipam_subnets))
+
+    def test_get_subnets_from_ports_without_fixed_ips(self):
+        api = neutronapi.API()
+        self.mox.ReplayAll()
+        neutronv2.get_client('fake')
+        self.assertEqual({}, api._get_subnets_from_ports(self.context,
+                                                         [{'fixed_ips': []}]))
 
     def test_get_all_empty_list_networks(self):
         api = neutronapi.API()
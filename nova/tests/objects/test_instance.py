@@ -757,6 +757,43 @@ class _TestInstanceListObject(object):
         self.assertEqual(inst_list.objects[0].uuid, fakes[1]['uuid'])
         self.assertRemotes()
 
+    def test_get_batch_by_filters(self):
+        fakes = [self.fake_instance(1), self.fake_instance(2)]
+        self.mox.StubOutWithMock(db, 'instance_get_batch_by_filters')
+        db.instance_get_batch_by_filters(self.context, {'foo': 'bar'},
+                                         last_id=3, limit=2,
+                                         columns_to_join=['metadata']
+                                         ).AndReturn(fakes)
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_batch_by_filters(
+            self.context, {'foo': 'bar'}, last_id=3, limit=2,
+            expected_attrs=['metadata'])
+
+        for i in range(0, len(fakes)):
+            self.assertIsInstance(inst_list.objects[i], instance.Instance)
+            self.assertEqual(inst_list.objects[i].uuid, fakes[i]['uuid'])
+        self.assertRemotes()
+
+    def test_iter_by_filters(self):
+        fakes = [self.fake_instance(1, updates={'id': 1}),
+                 self.fake_instance(2, updates={'id': 2}),
+                 self.fake_instance(3, updates={'id': 3})]
+        self.mox.StubOutWithMock(db, 'instance_get_batch_by_filters')
+        db.instance_get_batch_by_filters(self.context, {'foo': 'bar'},
+                                         last_id=None, limit=2,
+                                         columns_to_join=['metadata']
+                                         ).AndReturn(fakes[:2])
+        db.instance_get_batch_by_filters(self.context, {'foo': 'bar'},
+                                         last_id=2, limit=2,
+                                         columns_to_join=['metadata']
+                                         ).AndReturn(fakes[2:])
+        self.mox.ReplayAll()
+        instances = instance.InstanceList.iter_by_filters(
+            self.context, {'foo': 'bar'}, batch_size=2,
+            expected_attrs=['metadata'])
+
+        self.assertEqual([1, 2, 3], [inst.id for inst in instances])
+
     def test_get_by_host(self):
         fakes = [self.fake_instance(1),
                  self.fake_instance(2)]
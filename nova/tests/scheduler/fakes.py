@@ -49,6 +49,14 @@ COMPUTE_NODES = [
         dict(id=5, local_gb=1024, memory_mb=1024, vcpus=1, service=None),
 ]
 
+AGGREGATES = [
+        dict(id=1, name='agg1', hosts=['host1', 'host3'],
+             metadetails={'availability_zone': 'az1',
+                          'cpu_allocation_ratio': '2.0'}),
+        dict(id=2, name='agg2', hosts=['host3'],
+             metadetails={'cpu_allocation_ratio': '4.0'}),
+]
+
 INSTANCES = [
         dict(root_gb=512, ephemeral_gb=0, memory_mb=512, vcpus=1,
              host='host1', node='node1'),
@@ -140,3 +148,5 @@ def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'compute_node_get_all')
 
     db.compute_node_get_all(mox.IgnoreArg()).AndReturn(COMPUTE_NODES)
+    mock.StubOutWithMock(db, 'aggregate_get_all')
+    db.aggregate_get_all(mox.IgnoreArg()).AndReturn(AGGREGATES)
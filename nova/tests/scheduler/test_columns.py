@@ -0,0 +1,66 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For HostStateColumns.
+"""
+
+from nova.scheduler import columns
+from nova import test
+from nova.tests.scheduler import fakes
+
+
+class HostStateColumnsTestCase(test.NoDBTestCase):
+    """Test case for HostStateColumns class."""
+
+    def setUp(self):
+        super(HostStateColumnsTestCase, self).setUp()
+        self.hosts = [fakes.FakeHostState('host%d' % x, 'node%d' % x,
+                                          {'free_ram_mb': x * 512,
+                                           'num_instances': x})
+                      for x in xrange(1, 5)]
+        self.columns = columns.HostStateColumns(iter(self.hosts))
+
+    def test_columns(self):
+        self.assertEqual(4, len(self.columns))
+        self.assertEqual(self.hosts, self.columns.host_states)
+        self.assertEqual([512, 1024, 1536, 2048],
+                         self.columns['free_ram_mb'])
+        self.assertEqual(['host1', 'host2', 'host3', 'host4'],
+                         self.columns['host'])
+
+    def test_column_built_once(self):
+        column = self.columns['free_ram_mb']
+        self.hosts[0].free_ram_mb = 0
+        self.assertIs(column, self.columns['free_ram_mb'])
+
+    def test_compress(self):
+        self.columns['free_ram_mb']
+        compressed = self.columns.compress([True, False, False, True])
+        self.assertEqual([self.hosts[0], self.hosts[3]],
+                         compressed.host_states)
+        self.assertEqual([512, 2048], compressed._columns['free_ram_mb'])
+        self.assertNotIn('num_instances', compressed._columns)
+        self.assertEqual([1, 4], compressed['num_instances'])
+
+    def test_set_limits(self):
+        self.columns.set_limits('memory_mb', [1, 2, 3, 4],
+                                [True, False, True, False])
+        self.assertEqual([{'memory_mb': 1}, {}, {'memory_mb': 3}, {}],
+                         self.columns['limits'])
+
+    def test_set_limits_without_mask(self):
+        self.columns.set_limits('vcpu', [1, 2, 3, 4])
+        self.assertEqual([1, 2, 3, 4],
+                         [host.limits['vcpu'] for host in self.hosts])
@@ -80,6 +80,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.aggregate_get_all(mox.IgnoreArg()).AndReturn([])
 
         self.mox.ReplayAll()
         sched.schedule_run_instance(
@@ -223,6 +225,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.aggregate_get_all(mox.IgnoreArg()).AndReturn([])
         self.mox.ReplayAll()
 
         sched._schedule(self.context, request_spec,
@@ -242,6 +246,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.aggregate_get_all(mox.IgnoreArg()).AndReturn([])
         self.mox.ReplayAll()
 
         sched._schedule(self.context, request_spec,
@@ -261,6 +267,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.aggregate_get_all(mox.IgnoreArg()).AndReturn([])
         self.mox.ReplayAll()
 
         sched._schedule(self.context, request_spec,
@@ -281,6 +289,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.aggregate_get_all(mox.IgnoreArg()).AndReturn([])
         self.mox.ReplayAll()
 
         sched._schedule(self.context, request_spec,
@@ -303,6 +313,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.aggregate_get_all(mox.IgnoreArg()).AndReturn([])
         self.mox.ReplayAll()
 
         sched._schedule(self.context, request_spec,
@@ -311,6 +323,22 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         num_attempts = filter_properties['retry']['num_attempts']
         self.assertEqual(2, num_attempts)
 
+    def test_retry_counts_reschedules_and_claim_conflicts(self):
+        self.flags(scheduler_max_attempts=4)
+        sched = fakes.FakeFilterScheduler()
+        instance_properties = {'project_id': '12345', 'os_type': 'Linux'}
+
+        sched._populate_retry({}, instance_properties)
+        self.assertEqual({}, sched.metrics.to_dict()['counters'])
+
+        filter_properties = dict(retry=dict(num_attempts=1, hosts=[]))
+        sched._populate_retry(filter_properties, instance_properties)
+        filter_properties['retry']['claim_failed'] = True
+        sched._populate_retry(filter_properties, instance_properties)
+
+        self.assertEqual({'reschedules': 2, 'claim_conflicts': 1},
+                         sched.metrics.to_dict()['counters'])
+
     def test_retry_exceeded_max_attempts(self):
         # Test for necessary explosion when max retries is exceeded and that
         # the information needed in request_spec is still present for error
@@ -533,6 +561,86 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.assertEquals(50, hosts[0].weight)
 
+    def test_select_destinations_timed(self):
+        sched = fakes.FakeFilterScheduler()
+        self.stubs.Set(sched, '_schedule',
+                       lambda *args: [weights.WeighedHost(
+                           host_manager.HostState('host', 'node'), 1)])
+        request_spec = {'num_instances': 1}
+        sched.select_destinations(self.context, request_spec, {})
+
+        timing = sched.metrics.to_dict()['timings']['schedule']
+        self.assertEqual(1, timing['count'])
+
+    def _schedule_with_ram(self, num_instances):
+        """Schedule num_instances with only the RamFilter and RAMWeigher,
+        and return the chosen hosts and the calls to get_filtered_hosts.
+        """
+        self.flags(scheduler_host_subset_size=1,
+                   scheduler_default_filters=['RamFilter'],
+                   scheduler_weight_classes=[
+                       'nova.scheduler.weights.ram.RAMWeigher'])
+        sched = fakes.FakeFilterScheduler()
+        self.stubs.Set(db, 'compute_node_get_all',
+                       lambda ctxt: fakes.COMPUTE_NODES)
+        self.stubs.Set(db, 'aggregate_get_all', lambda ctxt: [])
+
+        filtered_calls = []
+        get_filtered_hosts = sched.host_manager.get_filtered_hosts
+
+        def _get_filtered_hosts(hosts, filter_properties, index=0):
+            hosts = list(hosts)
+            filtered_calls.append(sorted(host.host for host in hosts))
+            return get_filtered_hosts(hosts, filter_properties, index=index)
+
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                       _get_filtered_hosts)
+
+        instance_properties = {'project_id': 1,
+                               'root_gb': 0,
+                               'memory_mb': 2048,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux'}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={'memory_mb': 2048},
+                            num_instances=num_instances)
+        hosts = sched._schedule(self.context, request_spec,
+                                filter_properties={})
+        return [host.obj.host for host in hosts], filtered_calls
+
+    def test_schedule_batch_placement(self):
+        self.flags(scheduler_batch_placement=True)
+        hosts, filtered_calls = self._schedule_with_ram(5)
+
+        self.assertEqual(['host4', 'host4', 'host4', 'host3', 'host4'],
+                         hosts)
+        # All the hosts are only filtered for the first instance, then only
+        # the chosen host is checked again.
+        self.assertEqual(['host1', 'host2', 'host3', 'host4'],
+                         filtered_calls[0])
+        self.assertEqual([['host4'], ['host4'], ['host4'], ['host3']],
+                         filtered_calls[1:])
+
+    def test_schedule_batch_placement_same_as_per_instance(self):
+        unbatched_hosts, filtered_calls = self._schedule_with_ram(5)
+        self.assertEqual(5, len(filtered_calls))
+
+        self.flags(scheduler_batch_placement=True)
+        batched_hosts, filtered_calls = self._schedule_with_ram(5)
+        self.assertEqual(unbatched_hosts, batched_hosts)
+
+    def test_schedule_batch_placement_runs_out_of_hosts(self):
+        self.flags(scheduler_batch_placement=True)
+        hosts, filtered_calls = self._schedule_with_ram(20)
+
+        # With the 1.5 ram ratio, host1 never has enough RAM, host2 fits one
+        # instance, host3 two instances and host4 six instances.
+        self.assertEqual(9, len(hosts))
+        self.assertEqual(1, hosts.count('host2'))
+        self.assertEqual(2, hosts.count('host3'))
+        self.assertEqual(6, hosts.count('host4'))
+
     def test_select_hosts_happy_day(self):
         """select_hosts is basically a wrapper around the _select() method.
 
@@ -204,3 +204,40 @@ class FiltersTestCase(test.NoDBTestCase):
                                                      filter_objs_initial,
                                                      filter_properties)
         self.assertEqual(None, result)
+
+    def test_get_filtered_objects_stats(self):
+        class OddFilter(filters.BaseFilter):
+            def _filter_one(self, obj, filter_properties):
+                return obj % 2
+
+        class NoneFilter(filters.BaseFilter):
+            def filter_all(self, filter_obj_list, filter_properties):
+                return None
+
+        def _fake_base_loader_init(*args, **kwargs):
+            pass
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       _fake_base_loader_init)
+
+        filter_handler = filters.BaseFilterHandler(filters.BaseFilter)
+        result = filter_handler.get_filtered_objects([OddFilter, Filter1],
+                                                     range(10), {})
+        self.assertEqual([1, 3, 5, 7, 9], result)
+        filter_handler.get_filtered_objects([OddFilter, NoneFilter],
+                                            range(4), {})
+
+        stats = filter_handler.get_filter_stats()
+        self.assertEqual(['Filter1', 'NoneFilter', 'OddFilter'],
+                         sorted(stats))
+        self.assertEqual(2, stats['OddFilter']['calls'])
+        self.assertEqual(14, stats['OddFilter']['objs_in'])
+        self.assertEqual(7, stats['OddFilter']['objs_out'])
+        self.assertEqual(1, stats['Filter1']['calls'])
+        self.assertEqual(5, stats['Filter1']['objs_in'])
+        self.assertEqual(5, stats['Filter1']['objs_out'])
+        self.assertEqual(2, stats['NoneFilter']['objs_in'])
+        self.assertEqual(0, stats['NoneFilter']['objs_out'])
+
+        filter_handler.reset_filter_stats()
+        self.assertEqual({}, filter_handler.get_filter_stats())
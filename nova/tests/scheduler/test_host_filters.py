@@ -25,6 +25,7 @@ from nova import db
 from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova.pci import pci_stats
+from nova.scheduler import columns
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
 from nova.scheduler.filters import trusted_filter
@@ -231,6 +232,87 @@ class ExtraSpecsOpsTestCase(test.NoDBTestCase):
             matches=False)
 
 
+class CheapFilter(filters.BaseHostFilter):
+    def host_passes(self, host_state, filter_properties):
+        filter_properties['calls'].append('CheapFilter')
+        return True
+
+
+class SelectiveFilter(filters.BaseHostFilter):
+    def host_passes(self, host_state, filter_properties):
+        filter_properties['calls'].append('SelectiveFilter')
+        return host_state.host == 'host1'
+
+
+class ExpensiveFilter(filters.BaseHostFilter):
+    def host_passes(self, host_state, filter_properties):
+        filter_properties['calls'].append('ExpensiveFilter')
+        return True
+
+
+class HostFilterHandlerTestCase(test.NoDBTestCase):
+    """Test case for the ordering of the filters by HostFilterHandler."""
+
+    def setUp(self):
+        super(HostFilterHandlerTestCase, self).setUp()
+        self.filter_handler = filters.HostFilterHandler()
+        self.filter_classes = [ExpensiveFilter, CheapFilter, SelectiveFilter]
+        self.filter_handler.filter_stats = {
+            'ExpensiveFilter': {'calls': 10, 'time': 1.0, 'objs_in': 100,
+                                'objs_out': 90},
+            'CheapFilter': {'calls': 10, 'time': 0.01, 'objs_in': 100,
+                            'objs_out': 100},
+        }
+
+    def test_order_filters_disabled(self):
+        self.assertEqual(self.filter_classes,
+                         self.filter_handler.order_filters(
+                             self.filter_classes))
+
+    def test_order_filters(self):
+        self.flags(scheduler_adaptive_filter_order=True)
+        # SelectiveFilter has not run yet, CheapFilter never removes hosts
+        self.assertEqual([SelectiveFilter, ExpensiveFilter, CheapFilter],
+                         self.filter_handler.order_filters(
+                             self.filter_classes))
+
+        self.filter_handler.filter_stats['SelectiveFilter'] = {
+            'calls': 10, 'time': 0.5, 'objs_in': 100, 'objs_out': 10}
+        self.assertEqual([SelectiveFilter, ExpensiveFilter, CheapFilter],
+                         self.filter_handler.order_filters(
+                             self.filter_classes))
+
+        self.filter_handler.filter_stats['SelectiveFilter']['time'] = 10.0
+        self.assertEqual([ExpensiveFilter, SelectiveFilter, CheapFilter],
+                         self.filter_handler.order_filters(
+                             self.filter_classes))
+
+    def test_order_filters_pinned(self):
+        self.flags(scheduler_adaptive_filter_order=True,
+                   scheduler_pinned_filters=['ExpensiveFilter'])
+        self.assertEqual([ExpensiveFilter, SelectiveFilter, CheapFilter],
+                         self.filter_handler.order_filters(
+                             self.filter_classes))
+
+    def test_get_filtered_objects_ordered(self):
+        self.flags(scheduler_adaptive_filter_order=True)
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                 for i in xrange(1, 4)]
+        filter_properties = {'calls': []}
+        result = self.filter_handler.get_filtered_objects(
+                self.filter_classes, hosts, filter_properties)
+        self.assertEqual(['host1'], [host.host for host in result])
+        self.assertEqual(['SelectiveFilter'] * 3 + ['ExpensiveFilter',
+                                                    'CheapFilter'],
+                         filter_properties['calls'])
+
+        filter_properties = {'calls': []}
+        result = self.filter_handler.get_filtered_columns(
+                self.filter_classes, hosts, filter_properties)
+        self.assertEqual(['host1'], [host.host for host in result])
+        self.assertEqual('SelectiveFilter', filter_properties['calls'][0])
+
+
 class HostFiltersTestCase(test.NoDBTestCase):
     """Test case for host filters."""
     # FIXME(sirp): These tests still require DB access until we can separate
@@ -265,6 +347,27 @@ class HostFiltersTestCase(test.NoDBTestCase):
         self.assertIn('AllHostsFilter', self.class_map)
         self.assertIn('ComputeFilter', self.class_map)
 
+    def _assert_filter_columns_matches(self, filt_cls, attribute_dicts,
+                                       filter_properties):
+        """Check filter_columns() gives the same result as host_passes()."""
+        def _hosts():
+            return [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                        dict(attributes))
+                    for i, attributes in enumerate(attribute_dicts)]
+        hosts = _hosts()
+        expected = [filt_cls.host_passes(host, filter_properties)
+                    for host in hosts]
+        # Make sure both passing and failing hosts are covered
+        self.assertIn(True, expected)
+        self.assertIn(False, expected)
+
+        column_hosts = _hosts()
+        passes = filt_cls.filter_columns(
+                columns.HostStateColumns(column_hosts), filter_properties)
+        self.assertEqual(expected, list(passes))
+        self.assertEqual([host.limits for host in hosts],
+                         [host.limits for host in column_hosts])
+
     def test_all_host_filter(self):
         filt_cls = self.class_map['AllHostsFilter']()
         host = fakes.FakeHostState('host1', 'node1', {})
@@ -474,6 +577,24 @@ class HostFiltersTestCase(test.NoDBTestCase):
                            params={'host': 'fake_host', 'instance_type_id': 2})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_type_filter_filter_all(self):
+        filt_cls = self.class_map['TypeAffinityFilter']()
+        filter_properties = {'context': self.context,
+                             'instance_type': {'id': 1}}
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                 for i in xrange(1, 4)]
+        fakes.FakeInstance(context=self.context,
+                           params={'host': 'host1', 'instance_type_id': 1})
+        fakes.FakeInstance(context=self.context,
+                           params={'host': 'host2', 'instance_type_id': 2})
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host_and_not_type')
+        self.mox.ReplayAll()
+
+        self.assertTrue(filt_cls.run_filter_once_per_request)
+        self.assertEqual(['host1', 'host3'],
+                         [host.host for host in filt_cls.filter_all(
+                             hosts, filter_properties)])
+
     def test_aggregate_type_filter(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['AggregateTypeAffinityFilter']()
@@ -528,6 +649,17 @@ class HostFiltersTestCase(test.NoDBTestCase):
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
         self.assertEqual(2048 * 2.0, host.limits['memory_mb'])
 
+    def test_ram_filter_columns(self):
+        filt_cls = self.class_map['RamFilter']()
+        self.flags(ram_allocation_ratio=1.5)
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+        self._assert_filter_columns_matches(filt_cls,
+                [{'free_ram_mb': 1023, 'total_usable_ram_mb': 1024},
+                 {'free_ram_mb': 1024, 'total_usable_ram_mb': 1024},
+                 {'free_ram_mb': -1024, 'total_usable_ram_mb': 4096},
+                 {'free_ram_mb': -2048, 'total_usable_ram_mb': 4096}],
+                filter_properties)
+
     def test_aggregate_ram_filter_value_error(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['AggregateRamFilter']()
@@ -595,6 +727,17 @@ class HostFiltersTestCase(test.NoDBTestCase):
                  'service': service})
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_disk_filter_columns(self):
+        filt_cls = self.class_map['DiskFilter']()
+        self.flags(disk_allocation_ratio=10.0)
+        filter_properties = {'instance_type': {'root_gb': 100,
+                                               'ephemeral_gb': 19}}
+        self._assert_filter_columns_matches(filt_cls,
+                [{'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 12},
+                 {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 13},
+                 {'free_disk_mb': 0, 'total_usable_disk_gb': 0}],
+                filter_properties)
+
     def test_disk_filter_fails(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['DiskFilter']()
@@ -643,6 +786,14 @@ class HostFiltersTestCase(test.NoDBTestCase):
                 {'free_ram_mb': 1024, 'service': service})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_compute_filter_columns(self):
+        self._stub_service_is_up(True)
+        filt_cls = self.class_map['ComputeFilter']()
+        self._assert_filter_columns_matches(filt_cls,
+                [{'service': {'disabled': False}},
+                 {'service': {'disabled': True}}],
+                {})
+
     def test_compute_filter_fails_on_service_down(self):
         self._stub_service_is_up(False)
         filt_cls = self.class_map['ComputeFilter']()
@@ -1201,6 +1352,55 @@ class HostFiltersTestCase(test.NoDBTestCase):
         }
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_json_filter_filter_all(self):
+        self.stubs.Set(self.class_map['JsonFilter'], '_compiled_queries', {})
+        filt_cls = self.class_map['JsonFilter']()
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                     {'free_ram_mb': i * 512,
+                                      'free_disk_mb': 200 * 1024,
+                                      'capabilities': {'enabled': i != 3}})
+                 for i in xrange(1, 5)]
+        query = jsonutils.dumps(
+                ['and', ['>=', '$free_ram_mb', 1024],
+                        ['=', '$capabilities.enabled', True]])
+        filter_properties = {'scheduler_hints': {'query': query}}
+
+        self.mox.StubOutWithMock(jsonutils, 'loads')
+        jsonutils.loads(query).AndReturn(
+                ['and', ['>=', '$free_ram_mb', 1024],
+                        ['=', '$capabilities.enabled', True]])
+        self.mox.ReplayAll()
+
+        # The query is only parsed once, and then cached
+        expected = [host.host for host in hosts
+                    if filt_cls.host_passes(host, filter_properties)]
+        self.assertEqual(['host2', 'host4'], expected)
+        self.assertEqual(expected,
+                         [host.host for host in filt_cls.filter_all(
+                             hosts, filter_properties)])
+        filt_cls = self.class_map['JsonFilter']()
+        self.assertEqual(expected,
+                         [host.host for host in filt_cls.filter_all(
+                             hosts, filter_properties)])
+
+    def test_json_filter_filter_all_no_query(self):
+        filt_cls = self.class_map['JsonFilter']()
+        hosts = [fakes.FakeHostState('host1', 'node1', {})]
+        self.assertEqual(hosts, list(filt_cls.filter_all(hosts, {})))
+
+    def test_json_filter_compiled_queries_bounded(self):
+        self.stubs.Set(self.class_map['JsonFilter'], '_compiled_queries', {})
+        self.stubs.Set(self.class_map['JsonFilter'], 'compiled_queries_max',
+                       2)
+        filt_cls = self.class_map['JsonFilter']()
+        host = fakes.FakeHostState('host1', 'node1', {})
+        for i in xrange(3):
+            query = jsonutils.dumps(['=', i, i])
+            filter_properties = {'scheduler_hints': {'query': query}}
+            self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        self.assertEqual([jsonutils.dumps(['=', 2, 2])],
+                         filt_cls._compiled_queries.keys())
+
     def test_trusted_filter_default_passes(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['TrustedFilter']()
@@ -1341,6 +1541,24 @@ class HostFiltersTestCase(test.NoDBTestCase):
                 {'vcpus_total': 4, 'vcpus_used': 8})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_core_filter_columns(self):
+        filt_cls = self.class_map['CoreFilter']()
+        self.flags(cpu_allocation_ratio=2)
+        filter_properties = {'instance_type': {'vcpus': 1}}
+        self._assert_filter_columns_matches(filt_cls,
+                [{'vcpus_total': 4, 'vcpus_used': 7},
+                 {'vcpus_total': 4, 'vcpus_used': 8},
+                 {'vcpus_total': 0, 'vcpus_used': 8}],
+                filter_properties)
+
+    def test_core_filter_columns_no_instance_type(self):
+        filt_cls = self.class_map['CoreFilter']()
+        hosts = [fakes.FakeHostState('host1', 'node1',
+                                     {'vcpus_total': 4, 'vcpus_used': 8})]
+        passes = filt_cls.filter_columns(columns.HostStateColumns(hosts), {})
+        self.assertEqual([True], passes)
+        self.assertEqual({}, hosts[0].limits)
+
     def test_aggregate_core_filter_value_error(self):
         filt_cls = self.class_map['AggregateCoreFilter']()
         filter_properties = {'context': self.context,
@@ -1387,6 +1605,20 @@ class HostFiltersTestCase(test.NoDBTestCase):
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
         self.assertEqual(4 * 2, host.limits['vcpu'])
 
+    def test_aggregate_core_filter_prefetched_metadata(self):
+        filt_cls = self.class_map['AggregateCoreFilter']()
+        filter_properties = {'context': self.context,
+                             'instance_type': {'vcpus': 1}}
+        self.flags(cpu_allocation_ratio=1)
+        host = fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 7,
+                 'aggregate_metadata': {'cpu_allocation_ratio': set(['2'])}})
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        # The metadata loaded by the host manager is used, not the DB
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        self.assertEqual(4 * 2, host.limits['vcpu'])
+
     @staticmethod
     def _make_zone_request(zone, is_admin=False):
         ctxt = context.RequestContext('fake', 'fake', is_admin=is_admin)
@@ -1415,6 +1647,18 @@ class HostFiltersTestCase(test.NoDBTestCase):
                                    {'service': service})
         self.assertFalse(filt_cls.host_passes(host, request))
 
+    def test_availability_zone_filter_prefetched_metadata(self):
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        host = fakes.FakeHostState('host1', 'node1',
+                {'aggregate_metadata': {'availability_zone': set(['az1']),
+                                        'opt1': set(['1'])}})
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        self.assertTrue(filt_cls.host_passes(host,
+                                             self._make_zone_request('az1')))
+        self.assertFalse(filt_cls.host_passes(host,
+                                              self._make_zone_request('nova')))
+
     def test_retry_filter_disabled(self):
         # Test case where retry/re-scheduling is disabled.
         filt_cls = self.class_map['RetryFilter']()
@@ -1450,6 +1694,12 @@ class HostFiltersTestCase(test.NoDBTestCase):
         filter_properties = {}
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_filter_num_iops_columns(self):
+        self.flags(max_io_ops_per_host=8)
+        filt_cls = self.class_map['IoOpsFilter']()
+        self._assert_filter_columns_matches(filt_cls,
+                [{'num_io_ops': 7}, {'num_io_ops': 8}], {})
+
     def test_filter_num_iops_fails(self):
         self.flags(max_io_ops_per_host=8)
         filt_cls = self.class_map['IoOpsFilter']()
@@ -1466,6 +1716,12 @@ class HostFiltersTestCase(test.NoDBTestCase):
         filter_properties = {}
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_filter_num_instances_columns(self):
+        self.flags(max_instances_per_host=5)
+        filt_cls = self.class_map['NumInstancesFilter']()
+        self._assert_filter_columns_matches(filt_cls,
+                [{'num_instances': 4}, {'num_instances': 5}], {})
+
     def test_filter_num_instances_fails(self):
         self.flags(max_instances_per_host=5)
         filt_cls = self.class_map['NumInstancesFilter']()
@@ -1539,6 +1795,19 @@ class HostFiltersTestCase(test.NoDBTestCase):
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_aggregate_multi_tenancy_isolation_prefetched_metadata(self):
+        filt_cls = self.class_map['AggregateMultiTenancyIsolation']()
+        filter_properties = {'context': self.context,
+                             'request_spec': {
+                                 'instance_properties': {
+                                     'project_id': 'my_tenantid'}}}
+        host = fakes.FakeHostState('host1', 'compute',
+                {'aggregate_metadata': {'filter_tenant_id':
+                                            set(['other_tenantid'])}})
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        self.assertFalse(filt_cls.host_passes(host, filter_properties))
+
     def _fake_pci_support_requests(self, pci_requests):
         self.pci_requests = pci_requests
         return self.pci_request_result
@@ -15,6 +15,8 @@
 """
 Tests For HostManager
 """
+import mox
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -37,6 +39,13 @@ class FakeFilterClass2(filters.BaseHostFilter):
         pass
 
 
+class FakeColumnsFilter(filters.BaseHostFilter):
+    supports_columns = True
+
+    def filter_columns(self, columns, filter_properties):
+        return [host != 'fake_host1' for host in columns['host']]
+
+
 class HostManagerTestCase(test.NoDBTestCase):
     """Test case for HostManager class."""
 
@@ -115,6 +124,31 @@ class HostManagerTestCase(test.NoDBTestCase):
                 fake_properties, filter_class_names=specified_filters)
         self._verify_result(info, result)
 
+    def test_get_filtered_hosts_with_columns(self):
+        self.flags(scheduler_use_host_columns=True)
+        fake_properties = {'moo': 1, 'cow': 2}
+
+        # FakeColumnsFilter drops fake_host1 before FakeFilterClass1 runs
+        info = {'expected_objs': self.fake_hosts[1:],
+                'expected_fprops': fake_properties}
+        self.mox.StubOutWithMock(self.host_manager, '_choose_host_filters')
+        self.host_manager._choose_host_filters(None).AndReturn(
+                [FakeColumnsFilter, FakeFilterClass1])
+        info['got_objs'] = []
+        info['got_fprops'] = []
+
+        def fake_filter_one(_self, obj, filter_props):
+            info['got_objs'].append(obj)
+            info['got_fprops'].append(filter_props)
+            return True
+
+        self.stubs.Set(FakeFilterClass1, '_filter_one', fake_filter_one)
+
+        self.mox.ReplayAll()
+        result = self.host_manager.get_filtered_hosts(self.fake_hosts,
+                fake_properties)
+        self._verify_result(info, result)
+
     def test_get_filtered_hosts_with_ignore(self):
         fake_properties = {'ignore_hosts': ['fake_host1', 'fake_host3',
             'fake_host5', 'fake_multihost']}
@@ -317,9 +351,11 @@ class HostManagerTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
         self.mox.StubOutWithMock(host_manager.LOG, 'warn')
 
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn(fakes.AGGREGATES)
         # Invalid service
         host_manager.LOG.warn("No service for compute ID 5")
 
@@ -357,6 +393,21 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(host_states_map[('host4', 'node4')].free_disk_mb,
                          8388608)
 
+        # Aggregates are loaded once and attached to every host
+        host1 = host_states_map[('host1', 'node1')]
+        self.assertEqual([fakes.AGGREGATES[0]], host1.aggregates)
+        self.assertEqual({'availability_zone': set(['az1']),
+                          'cpu_allocation_ratio': set(['2.0'])},
+                         host1.aggregate_metadata)
+        host3 = host_states_map[('host3', 'node3')]
+        self.assertEqual(fakes.AGGREGATES, host3.aggregates)
+        self.assertEqual({'availability_zone': set(['az1']),
+                          'cpu_allocation_ratio': set(['2.0', '4.0'])},
+                         host3.aggregate_metadata)
+        host4 = host_states_map[('host4', 'node4')]
+        self.assertEqual([], host4.aggregates)
+        self.assertEqual({}, host4.aggregate_metadata)
+
 
 class HostManagerChangedNodesTestCase(test.NoDBTestCase):
     """Test case for HostManager class."""
@@ -376,7 +427,9 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
         self.mox.ReplayAll()
 
         self.host_manager.get_all_host_states(context)
@@ -387,12 +440,15 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
         # all nodes active for first call
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
         # remove node4 for second call
         running_nodes = [n for n in fakes.COMPUTE_NODES
                          if n.get('hypervisor_hostname') != 'node4']
         db.compute_node_get_all(context).AndReturn(running_nodes)
+        db.aggregate_get_all(context).AndReturn([])
         self.mox.ReplayAll()
 
         self.host_manager.get_all_host_states(context)
@@ -404,10 +460,13 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
         # all nodes active for first call
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
         # remove all nodes for second call
         db.compute_node_get_all(context).AndReturn([])
+        db.aggregate_get_all(context).AndReturn([])
         self.mox.ReplayAll()
 
         self.host_manager.get_all_host_states(context)
@@ -415,6 +474,66 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         host_states_map = self.host_manager.host_state_map
         self.assertEqual(len(host_states_map), 0)
 
+    def test_get_all_host_states_cached(self):
+        self.flags(scheduler_host_state_resync_interval=60)
+        context = 'fake_context'
+        timeutils.set_time_override()
+        first_sync = timeutils.utcnow()
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        # full load for the first call
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
+        # only the changes for the second call: node1 got updated and
+        # node4 got deleted
+        node1 = dict(fakes.COMPUTE_NODES[0], free_ram_mb=256, deleted=0)
+        node4 = dict(fakes.COMPUTE_NODES[3], deleted=4)
+        db.compute_node_get_all_changed_since(context,
+                first_sync).AndReturn([node1, node4])
+        db.aggregate_get_all(context).AndReturn([])
+        # full reload once the resync interval is over
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(len(host_states_map), 4)
+
+        timeutils.advance_time_seconds(30)
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(len(host_states_map), 3)
+        self.assertEqual(256, host_states_map[('host1', 'node1')].free_ram_mb)
+        self.assertNotIn(('host4', 'node4'), host_states_map)
+
+        timeutils.advance_time_seconds(31)
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(len(host_states_map), 4)
+
+    def test_get_all_host_states_cached_not_reapplied(self):
+        self.flags(scheduler_host_state_resync_interval=60)
+        context = 'fake_context'
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(context).AndReturn([])
+        db.compute_node_get_all_changed_since(context,
+                mox.IgnoreArg()).AndReturn([])
+        db.aggregate_get_all(context).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        host_state = self.host_manager.host_state_map[('host4', 'node4')]
+        host_state.consume_from_instance(dict(root_gb=1, ephemeral_gb=0,
+                                              memory_mb=512, vcpus=1))
+        # Unchanged compute nodes do not override the consumed resources
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(8192 - 512, host_state.free_ram_mb)
+
 
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
@@ -434,6 +553,7 @@ class HostStateTestCase(test.NoDBTestCase):
             dict(key='num_os_type_linux', value='4'),
             dict(key='num_os_type_windoze', value='1'),
             dict(key='io_workload', value='42'),
+            dict(key='cached_image_image1', value='1'),
         ]
         compute = dict(stats=stats, memory_mb=1, free_disk_gb=0, local_gb=0,
                        local_gb_used=0, free_ram_mb=0, vcpus=0, vcpus_used=0,
@@ -455,7 +575,8 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertEqual(4, host.num_instances_by_os_type['linux'])
         self.assertEqual(1, host.num_instances_by_os_type['windoze'])
         self.assertEqual(42, host.num_io_ops)
-        self.assertEqual(10, len(host.stats))
+        self.assertEqual(set(['image1']), host.cached_images)
+        self.assertEqual(11, len(host.stats))
 
         self.assertEqual('127.0.0.1', host.host_ip)
         self.assertEqual('htype', host.hypervisor_type)
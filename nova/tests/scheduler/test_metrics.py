@@ -0,0 +1,64 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For SchedulerMetrics.
+"""
+
+import time
+
+from nova.scheduler import metrics
+from nova import test
+
+
+class SchedulerMetricsTestCase(test.NoDBTestCase):
+    """Test case for SchedulerMetrics class."""
+
+    def setUp(self):
+        super(SchedulerMetricsTestCase, self).setUp()
+        self.metrics = metrics.SchedulerMetrics()
+
+    def test_incr(self):
+        self.metrics.incr('reschedules')
+        self.metrics.incr('reschedules', 2)
+        self.metrics.incr('claim_conflicts')
+        self.assertEqual({'reschedules': 3, 'claim_conflicts': 1},
+                         self.metrics.to_dict()['counters'])
+
+    def test_add_timing(self):
+        self.metrics.add_timing('schedule', 0.5)
+        self.metrics.add_timing('schedule', 1.5)
+        self.assertEqual({'schedule': {'count': 2, 'total': 2.0, 'max': 1.5}},
+                         self.metrics.to_dict()['timings'])
+
+    def test_timed(self):
+        self.mox.StubOutWithMock(time, 'time')
+        time.time().AndReturn(10.0)
+        time.time().AndReturn(10.25)
+        self.mox.ReplayAll()
+
+        def _raise():
+            with self.metrics.timed('schedule'):
+                raise test.TestingException()
+
+        self.assertRaises(test.TestingException, _raise)
+        self.assertEqual({'count': 1, 'total': 0.25, 'max': 0.25},
+                         self.metrics.to_dict()['timings']['schedule'])
+
+    def test_reset(self):
+        self.metrics.incr('reschedules')
+        self.metrics.add_timing('schedule', 1.0)
+        self.metrics.reset()
+        self.assertEqual({'counters': {}, 'timings': {}},
+                         self.metrics.to_dict())
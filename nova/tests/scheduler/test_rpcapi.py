@@ -82,6 +82,10 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
                 filter_properties='fake_prop',
                 version='2.6')
 
+    def test_get_scheduler_stats(self):
+        self._test_scheduler_api('get_scheduler_stats', rpc_method='call',
+                version='2.11')
+
     def test_select_destinations(self):
         self._test_scheduler_api('select_destinations', rpc_method='call',
                 request_spec='fake_request_spec',
@@ -461,6 +461,38 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
                           self.manager.select_hosts,
                           self.context, {}, {})
 
+    def test_report_metrics(self):
+        self.manager.driver.metrics.incr('claim_conflicts')
+        stats = self.manager.driver.get_stats()
+        stats['filters'] = {'RamFilter': {'calls': 1, 'time': 0.1,
+                                          'objs_in': 4, 'objs_out': 2}}
+        stats['weighers'] = {'RAMWeigher': {'calls': 1, 'time': 0.1,
+                                            'objs': 2}}
+        self.mox.StubOutWithMock(self.manager.driver, 'get_stats')
+        self.manager.driver.get_stats().AndReturn(stats)
+        self.mox.StubOutWithMock(manager.LOG, 'info')
+        manager.LOG.info(mox.IgnoreArg(), stats)
+        manager.LOG.info(mox.IgnoreArg(),
+                         dict(stats['filters']['RamFilter'],
+                              cls_name='RamFilter'))
+        manager.LOG.info(mox.IgnoreArg(),
+                         dict(stats['weighers']['RAMWeigher'],
+                              cls_name='RAMWeigher'))
+        self.mox.ReplayAll()
+        self.manager._report_metrics(self.context)
+
+    def test_get_scheduler_stats(self):
+        self.manager.driver.metrics.incr('reschedules')
+        stats = self.manager.get_scheduler_stats(self.context)
+        self.assertEqual({'counters': {'reschedules': 1}, 'timings': {},
+                          'filters': {}, 'weighers': {}}, stats)
+
+    def test_report_metrics_disabled(self):
+        self.flags(scheduler_metrics_report_interval=0)
+        self.mox.StubOutWithMock(manager.LOG, 'info')
+        self.mox.ReplayAll()
+        self.manager._report_metrics(self.context)
+
     def test_prep_resize_post_populates_retry(self):
         self.manager.driver = fakes.FakeFilterScheduler()
 
@@ -34,8 +34,9 @@ class TestWeighedHost(test.NoDBTestCase):
     def test_all_weighers(self):
         classes = weights.all_weighers()
         class_names = [cls.__name__ for cls in classes]
-        self.assertEqual(len(classes), 1)
+        self.assertEqual(len(classes), 2)
         self.assertIn('RAMWeigher', class_names)
+        self.assertIn('ImageCacheWeigher', class_names)
 
 
 class RamWeigherTestCase(test.NoDBTestCase):
@@ -101,3 +102,84 @@ class RamWeigherTestCase(test.NoDBTestCase):
         weighed_host = self._get_weighed_host(hostinfo_list)
         self.assertEqual(weighed_host.weight, 8192 * 2)
         self.assertEqual(weighed_host.obj.host, 'host4')
+
+    def test_weigher_stats(self):
+        hostinfo_list = list(self._get_all_hosts())
+        self.weight_handler.get_weighed_objects(self.weight_classes,
+                                                hostinfo_list, {})
+        self.weight_handler.get_weighed_columns(self.weight_classes,
+                                                hostinfo_list[:2], {})
+
+        stats = self.weight_handler.get_weigher_stats()
+        self.assertEqual(['RAMWeigher'], stats.keys())
+        self.assertEqual(2, stats['RAMWeigher']['calls'])
+        self.assertEqual(6, stats['RAMWeigher']['objs'])
+
+        self.weight_handler.reset_weigher_stats()
+        self.assertEqual({}, self.weight_handler.get_weigher_stats())
+
+    def test_ram_weigher_columns(self):
+        self.flags(ram_weight_multiplier=2.0)
+        hostinfo_list = list(self._get_all_hosts())
+
+        expected = self.weight_handler.get_weighed_objects(
+                self.weight_classes, hostinfo_list, {})
+        weighed_hosts = self.weight_handler.get_weighed_columns(
+                self.weight_classes, hostinfo_list, {})
+        self.assertEqual([(x.obj, x.weight) for x in expected],
+                         [(x.obj, x.weight) for x in weighed_hosts])
+        self.assertEqual(weighed_hosts[0].weight, 8192 * 2)
+        self.assertEqual(weighed_hosts[0].obj.host, 'host4')
+
+    def test_columns_with_per_host_weigher(self):
+        class FakeWeigher(weights.BaseHostWeigher):
+            def _weigh_object(self, host_state, weight_properties):
+                # Favour host1 over everything else
+                return 100000 if host_state.host == 'host1' else 0
+
+        hostinfo_list = list(self._get_all_hosts())
+        weighed_hosts = self.weight_handler.get_weighed_columns(
+                self.weight_classes + [FakeWeigher], hostinfo_list, {})
+        self.assertEqual(weighed_hosts[0].obj.host, 'host1')
+        self.assertEqual(weighed_hosts[0].weight, 100000 + 512)
+        self.assertEqual(weighed_hosts[1].obj.host, 'host4')
+        self.assertEqual(weighed_hosts[1].weight, 8192)
+
+
+class ImageCacheWeigherTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ImageCacheWeigherTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler()
+        self.weight_classes = self.weight_handler.get_matching_classes(
+                ['nova.scheduler.weights.image_cache.ImageCacheWeigher'])
+        self.hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                                {'cached_images': set(['image1'])}),
+            fakes.FakeHostState('host2', 'node2',
+                                {'cached_images': set(['image2'])}),
+            fakes.FakeHostState('host3', 'node3', {'cached_images': set()}),
+        ]
+        self.weight_properties = {'request_spec': {
+            'instance_properties': {'image_ref': 'image2'}}}
+
+    def test_prefers_host_with_image_cached(self):
+        self.flags(image_cache_weight_multiplier=10.0)
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+                self.weight_classes, self.hosts, self.weight_properties)
+        self.assertEqual('host2', weighed_hosts[0].obj.host)
+        self.assertEqual(10.0, weighed_hosts[0].weight)
+        self.assertEqual([0.0, 0.0], [x.weight for x in weighed_hosts[1:]])
+
+    def test_columns(self):
+        self.flags(image_cache_weight_multiplier=10.0)
+        expected = self.weight_handler.get_weighed_objects(
+                self.weight_classes, self.hosts, self.weight_properties)
+        weighed_hosts = self.weight_handler.get_weighed_columns(
+                self.weight_classes, self.hosts, self.weight_properties)
+        self.assertEqual([(x.obj, x.weight) for x in expected],
+                         [(x.obj, x.weight) for x in weighed_hosts])
+
+    def test_no_image(self):
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+                self.weight_classes, self.hosts, {})
+        self.assertEqual([0.0] * 3, [x.weight for x in weighed_hosts])
@@ -16,10 +16,13 @@
 #    under the License.
 
 import fixtures
+import mox
 import StringIO
 import sys
+import time
 
 from nova.cmd import manage
+from nova.compute import rpcapi as compute_rpcapi
 from nova import context
 from nova import db
 from nova import exception
@@ -70,6 +73,41 @@ class FixedIpCommandsTestCase(test.TestCase):
         self.commands.list('banana')
         self.assertTrue(sys.stdout.getvalue().find('192.168.0.100') != -1)
 
+    def test_list_reads_instances_per_batch(self):
+        fixed_ips = []
+        for i in xrange(3):
+            fixed_ip = dict(db_fakes.fixed_ip_fields)
+            fixed_ip.update({'address': '192.168.0.%d' % (101 + i),
+                             'instance_uuid': 'fake-uuid-%d' % i})
+            fixed_ips.append(fixed_ip)
+        self.flags(instance_iter_batch_size=2)
+        self.mox.StubOutWithMock(db, 'fixed_ip_get_all')
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters_iter')
+        db.fixed_ip_get_all(mox.IgnoreArg()).AndReturn(fixed_ips)
+        db.instance_get_all_by_filters(
+            mox.IgnoreArg(),
+            {'uuid': mox.SameElementsAs(['fake-uuid-0', 'fake-uuid-1']),
+             'deleted': False, 'soft_deleted': True},
+            columns_to_join=[]).AndReturn(
+                [{'uuid': 'fake-uuid-0', 'hostname': 'vm0', 'host': 'h0'},
+                 {'uuid': 'fake-uuid-1', 'hostname': 'vm1', 'host': 'h1'}])
+        db.instance_get_all_by_filters(
+            mox.IgnoreArg(),
+            {'uuid': ['fake-uuid-2'], 'deleted': False,
+             'soft_deleted': True},
+            columns_to_join=[]).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.commands.list()
+        output = sys.stdout.getvalue()
+        self.assertIn('192.168.0.101  \tvm0            \th0', output)
+        self.assertIn('192.168.0.102  \tvm1            \th1', output)
+        self.assertIn('WARNING: fixed ip 192.168.0.103 allocated to missing'
+                      ' instance', output)
+
 
 class FloatingIpCommandsTestCase(test.TestCase):
     def setUp(self):
@@ -392,6 +430,64 @@ class DBCommandsTestCase(test.TestCase):
     def test_archive_deleted_rows_negative(self):
         self.assertEqual(1, self.commands.archive_deleted_rows(-1))
 
+    def test_archive_deleted_rows_negative_sleep(self):
+        self.assertEqual(1, self.commands.archive_deleted_rows(10, '-1'))
+
+    def test_archive_deleted_rows_continuous_needs_max_rows(self):
+        self.assertEqual(1, self.commands.archive_deleted_rows(
+            None, continuous=True))
+
+    def test_archive_deleted_rows_continuous(self):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows')
+        self.mox.StubOutWithMock(time, 'sleep')
+        db.archive_deleted_rows(mox.IgnoreArg(), 10,
+                                sleep=0.5).AndReturn(10)
+        db.archive_deleted_rows(mox.IgnoreArg(), 10,
+                                sleep=0.5).AndReturn(0)
+        time.sleep(60).AndRaise(KeyboardInterrupt)
+        self.mox.ReplayAll()
+        self.assertRaises(KeyboardInterrupt,
+                          self.commands.archive_deleted_rows, '10', '0.5',
+                          continuous=True)
+        self.assertIn('Archived 10 rows', sys.stdout.getvalue())
+
+    def test_archive_deleted_rows_sleep(self):
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows')
+        db.archive_deleted_rows(mox.IgnoreArg(), 10,
+                                sleep=0.5).AndReturn(10)
+        self.mox.ReplayAll()
+        self.assertEqual(None, self.commands.archive_deleted_rows('10',
+                                                                  '0.5'))
+
+
+class ImageCommandsTestCase(test.TestCase):
+    def setUp(self):
+        super(ImageCommandsTestCase, self).setUp()
+        self.commands = manage.ImageCommands()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        ctxt = context.get_admin_context()
+        aggregate = db.aggregate_create(ctxt, {'name': 'agg1'})
+        db.aggregate_host_add(ctxt, aggregate['id'], 'host1')
+        db.aggregate_host_add(ctxt, aggregate['id'], 'host2')
+
+    def test_cache(self):
+        self.mox.StubOutWithMock(compute_rpcapi.ComputeAPI, 'cache_images')
+        for host in ['host1', 'host2', 'host3']:
+            compute_rpcapi.ComputeAPI.cache_images(
+                mox.IgnoreArg(), host, ['image1', 'image2'])
+        self.mox.ReplayAll()
+        self.commands.cache('image1,image2', host='host3,host1',
+                            aggregate='agg1')
+
+    def test_cache_needs_hosts(self):
+        self.assertEqual(2, self.commands.cache('image1'))
+
+    def test_cache_unknown_aggregate(self):
+        self.assertEqual(2, self.commands.cache('image1', aggregate='agg2'))
+
 
 class ServiceCommandsTestCase(test.TestCase):
     def setUp(self):
@@ -131,6 +131,8 @@ VIR_ERR_INTERNAL_ERROR = 950
 # Readonly
 VIR_CONNECT_RO = 1
 
+VIR_CONNECT_LIST_DOMAINS_ACTIVE = 1
+
 # snapshotCreateXML flags
 VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA = 4
 VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY = 16
@@ -582,6 +584,11 @@ class Connection(object):
     def listDomainsID(self):
         return self._running_vms.keys()
 
+    def listAllDomains(self, flags):
+        if flags & VIR_CONNECT_LIST_DOMAINS_ACTIVE:
+            return self._running_vms.values()
+        return self._vms.values()
+
     def lookupByID(self, id):
         if id in self._running_vms:
             return self._running_vms[id]
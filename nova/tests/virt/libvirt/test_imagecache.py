@@ -23,6 +23,7 @@ import json
 import os
 import time
 
+from eventlet import greenthread
 from oslo.config import cfg
 
 from nova.compute import vm_states
@@ -33,6 +34,7 @@ from nova.openstack.common import log as logging
 from nova import test
 from nova import utils
 from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import imagepeers
 from nova.virt.libvirt import utils as virtutils
 
 CONF = cfg.CONF
@@ -394,6 +396,49 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
             self.assertFalse(os.path.exists(fname))
             self.assertFalse(os.path.exists(info_fname))
 
+    def test_list_cached_images(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            base_dir = os.path.join(tmpdir, CONF.base_dir_name)
+            os.mkdir(base_dir)
+            for image_id in ['image1', 'image2', 'image3']:
+                fname = os.path.join(base_dir,
+                                     hashlib.sha1(image_id).hexdigest())
+                open(fname, 'w').close()
+                if image_id != 'image3':
+                    imagecache.write_stored_info(fname, field='image_id',
+                                                 value=image_id)
+            open(os.path.join(base_dir, 'kernel'), 'w').close()
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            self.assertEqual(['image1', 'image2'],
+                             sorted(image_cache_manager.list_cached_images()))
+
+    def test_list_cached_images_without_base_dir(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            image_cache_manager = imagecache.ImageCacheManager()
+            self.assertEqual([], image_cache_manager.list_cached_images())
+
+    def test_remove_base_file_withdraws_it(self):
+        self.flags(fetch_base_images_from_peers=True, my_ip='10.0.0.1')
+        imagepeers.reset_cache()
+        self.addCleanup(imagepeers.reset_cache)
+        with self._make_base_file() as fname:
+            imagecache.write_stored_info(fname, field='image_id',
+                                         value='image')
+            imagepeers.advertise('image', fname)
+            self.flags(my_ip='10.0.0.2')
+            self.assertEqual(1, len(imagepeers.get_peers('image', fname)))
+            self.flags(my_ip='10.0.0.1')
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            os.utime(fname, (-1, time.time() - 3601))
+            image_cache_manager._remove_base_file(fname)
+
+            self.flags(my_ip='10.0.0.2')
+            self.assertEqual([], imagepeers.get_peers('image', fname))
+
     def test_remove_base_file_original(self):
         with self._make_base_file() as fname:
             image_cache_manager = imagecache.ImageCacheManager()
@@ -618,6 +663,10 @@ class ImageCacheManagerTestCase(test.NoDBTestCase):
         orig_utime = os.utime
         self.stubs.Set(os, 'utime', lambda x, y: None)
 
+        # And the recording of the image ids of the base files
+        self.stubs.Set(imagecache, 'write_stored_info',
+                       lambda *args, **kwargs: None)
+
         # Fake up some instances in the instances directory
         orig_listdir = os.listdir
 
@@ -920,3 +969,62 @@ class VerifyChecksumTestCase(test.NoDBTestCase):
             # Checksum requests for a file with no checksum now have the
             # side effect of creating the checksum
             self.assertTrue(os.path.exists(info_fname))
+
+    def test_verify_checksum_unchanged_file_not_read(self):
+        with utils.tempdir() as tmpdir:
+            image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            self.assertTrue(image_cache_manager._verify_checksum(self.img,
+                                                                 fname))
+
+            self.stubs.Set(image_cache_manager, '_hash_base_file',
+                           lambda *args: self.fail('File read again'))
+            self.assertTrue(image_cache_manager._verify_checksum(self.img,
+                                                                 fname))
+
+    def test_verify_checksum_over_several_passes(self):
+        self.flags(checksum_max_mb_per_pass=1, checksum_interval_seconds=0)
+        with utils.tempdir() as tmpdir:
+            image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            testdata = 'x' * (2 * 1024 * 1024 + 10)
+            with open(fname, 'w') as f:
+                f.write(testdata)
+            info_fname = imagecache.get_info_filename(fname)
+            with open(info_fname, 'w') as f:
+                f.write('{"sha1": "%s"}' % hashlib.sha1(testdata).hexdigest())
+
+            for _i in range(2):
+                self.assertEqual(None, image_cache_manager._verify_checksum(
+                    self.img, fname))
+            self.assertEqual(
+                2 * 1024 * 1024,
+                image_cache_manager.checksum_progress[fname][1])
+            self.assertTrue(image_cache_manager._verify_checksum(self.img,
+                                                                 fname))
+            self.assertEqual({}, image_cache_manager.checksum_progress)
+
+    def test_verify_checksum_restarts_for_changed_file(self):
+        self.flags(checksum_max_mb_per_pass=1, checksum_interval_seconds=0)
+        with utils.tempdir() as tmpdir:
+            image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            with open(fname, 'w') as f:
+                f.write('x' * (2 * 1024 * 1024))
+            self.assertEqual(None, image_cache_manager._verify_checksum(
+                self.img, fname))
+
+            with open(fname, 'w') as f:
+                f.write('y' * (2 * 1024 * 1024))
+            os.utime(fname, (0, 0))
+            self.assertEqual(None, image_cache_manager._verify_checksum(
+                self.img, fname))
+            self.assertEqual(
+                1024 * 1024, image_cache_manager.checksum_progress[fname][1])
+
+    def test_throttle_read(self):
+        self.flags(checksum_read_rate_mb=2)
+        sleeps = []
+        self.stubs.Set(greenthread, 'sleep', sleeps.append)
+        self.stubs.Set(time, 'time', lambda: 1000.0)
+        image_cache_manager = imagecache.ImageCacheManager()
+        image_cache_manager._throttle_read(1024 * 1024)
+        image_cache_manager._throttle_read(1024 * 1024)
+        self.assertEqual([0.5, 1.0], sleeps)
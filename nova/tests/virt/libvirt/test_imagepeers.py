@@ -0,0 +1,110 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import time
+
+from nova import test
+from nova.virt.libvirt import imagepeers
+
+ABC = hashlib.sha1('abc').hexdigest()
+DEF = hashlib.sha1('def').hexdigest()
+
+
+class ImagePeersTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ImagePeersTestCase, self).setUp()
+        self.flags(fetch_base_images_from_peers=True, my_ip='10.0.0.1')
+        imagepeers.reset_cache()
+        self.addCleanup(imagepeers.reset_cache)
+
+    def _advertise(self, my_ip, image_id, base_dir):
+        self.flags(my_ip=my_ip)
+        imagepeers.advertise(image_id,
+                             imagepeers.get_base_file(image_id, base_dir))
+
+    def _get_peers(self, image_id, base_dir='/c/_base'):
+        return imagepeers.get_peers(
+            image_id, imagepeers.get_base_file(image_id, base_dir))
+
+    def test_get_base_file(self):
+        self.assertEqual('/a/_base/%s' % ABC,
+                         imagepeers.get_base_file('abc', '/a/_base'))
+
+    def test_get_peers(self):
+        self._advertise('10.0.0.2', 'abc', '/a/_base')
+        self._advertise('10.0.0.3', 'abc', '/b/_base')
+        self._advertise('10.0.0.3', 'def', '/b/_base')
+        self.flags(my_ip='10.0.0.1')
+        self.assertEqual([('10.0.0.2', '/a/_base/%s' % ABC),
+                          ('10.0.0.3', '/b/_base/%s' % ABC)],
+                         sorted(self._get_peers('abc')))
+        self.assertEqual([], self._get_peers('ghi'))
+
+    def test_get_peers_on_same_host(self):
+        self._advertise('10.0.0.1', 'abc', '/a/_base')
+        self._advertise('10.0.0.1', 'abc', '/b/_base')
+        self.assertEqual([(None, '/b/_base/%s' % ABC)],
+                         self._get_peers('abc', '/a/_base'))
+
+    def test_get_peers_ignores_invalid_locations(self):
+        self._advertise('10.0.0.2', 'abc', '/a/_base')
+        key = imagepeers._make_key('abc')
+        locations = imagepeers._get_cache().get(key)
+        expires = time.time() + 60
+        for location in [('10.0.0.3', '/b/_base/%s' % DEF),
+                         ('10.0.0.3', '/b/instance/%s' % ABC),
+                         ('10.0.0.3', '/b/_base/../x/_base/%s' % ABC),
+                         ('10.0.0.3', 'b/_base/%s' % ABC),
+                         ('10.0.0.3', '/b/instance/kernel'),
+                         ('-oProxyCommand=x', '/b/_base/%s' % ABC),
+                         ('10.0.0.3',),
+                         None]:
+            locations[location] = expires
+        imagepeers._get_cache().set(key, locations)
+        self.flags(my_ip='10.0.0.1')
+        self.assertEqual([('10.0.0.2', '/a/_base/%s' % ABC)],
+                         self._get_peers('abc'))
+
+    def test_get_peers_ignores_invalid_entries(self):
+        imagepeers._get_cache().set(imagepeers._make_key('abc'), 'junk')
+        self.assertEqual([], self._get_peers('abc'))
+
+    def test_withdraw(self):
+        self._advertise('10.0.0.2', 'abc', '/a/_base')
+        self._advertise('10.0.0.3', 'abc', '/b/_base')
+        imagepeers.withdraw('abc', '/b/_base/%s' % ABC)
+        self.flags(my_ip='10.0.0.1')
+        self.assertEqual([('10.0.0.2', '/a/_base/%s' % ABC)],
+                         self._get_peers('abc'))
+
+    def test_expired(self):
+        self.flags(base_image_advertisement_ttl=10)
+        self._advertise('10.0.0.2', 'abc', '/a/_base')
+        now = time.time()
+        self.stubs.Set(time, 'time', lambda: now + 20)
+        self._advertise('10.0.0.3', 'abc', '/b/_base')
+        self.flags(my_ip='10.0.0.1')
+        self.assertEqual([('10.0.0.3', '/b/_base/%s' % ABC)],
+                         self._get_peers('abc'))
+
+    def test_disabled(self):
+        self._advertise('10.0.0.2', 'abc', '/a/_base')
+        self.flags(my_ip='10.0.0.1', fetch_base_images_from_peers=False)
+        self.assertEqual([], self._get_peers('abc'))
+        self._advertise('10.0.0.3', 'abc', '/b/_base')
+        self.flags(my_ip='10.0.0.1', fetch_base_images_from_peers=True)
+        self.assertEqual([('10.0.0.2', '/a/_base/%s' % ABC)],
+                         self._get_peers('abc'))
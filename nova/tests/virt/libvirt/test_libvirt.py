@@ -25,6 +25,7 @@ import mox
 import os
 import re
 import shutil
+import sys
 import tempfile
 
 from eventlet import greenthread
@@ -1484,6 +1485,25 @@ class LibvirtConnTestCase(test.TestCase):
                                       ("disk", "virtio", "vdb"),
                                       ("disk", "virtio", "vdc")))
 
+    def test_cache_image(self):
+        fetches = []
+
+        def fake_fetch_image(context, target, image_id, user_id, project_id,
+                             base_dir=None):
+            fetches.append((image_id, base_dir))
+            open(target, 'w').close()
+
+        self.stubs.Set(fake_libvirt_utils, 'fetch_image', fake_fetch_image)
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            conn.cache_image(self.context, 'image1')
+            conn.cache_image(self.context, 'image1')
+            self.assertEqual([('image1', os.path.join(tmpdir, '_base'))],
+                             fetches)
+            self.assertEqual(
+                ['image1'], conn.image_cache_manager.list_cached_images())
+
     def test_list_instances(self):
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByID = self.fake_lookup
@@ -1601,6 +1621,57 @@ class LibvirtConnTestCase(test.TestCase):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         self.assertRaises(exception.NovaException, conn.list_instance_uuids)
 
+    def _test_get_info_all(self, list_all_domains):
+        class DiagFakeDomain(FakeVirtDomain):
+            def __init__(self, domain_id, name):
+                super(DiagFakeDomain, self).__init__()
+                self.domain_id = domain_id
+                self.domain_name = name
+
+            def ID(self):
+                return self.domain_id
+
+            def name(self):
+                return self.domain_name
+
+            def info(self):
+                return [libvirt_driver.VIR_DOMAIN_RUNNING, 2048, 1024, 1, 0]
+
+        domains = {0: DiagFakeDomain(0, 'Domain-0'),
+                   1: DiagFakeDomain(1, 'instance-1'),
+                   2: DiagFakeDomain(2, 'instance-other')}
+        defined = {'instance-2': DiagFakeDomain(-1, 'instance-2')}
+
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        libvirt_driver.LibvirtDriver._conn.lookupByID = domains.get
+        libvirt_driver.LibvirtDriver._conn.lookupByName = defined.get
+        libvirt_driver.LibvirtDriver._conn.numOfDomains = lambda: 3
+        libvirt_driver.LibvirtDriver._conn.listDomainsID = domains.keys
+        libvirt_driver.LibvirtDriver._conn.listDefinedDomains = defined.keys
+        libvirt_driver.LibvirtDriver._conn.listAllDomains = (
+            lambda flags: domains.values() + defined.values())
+        self.stubs.Set(libvirt_driver.LibvirtDriver, 'has_min_version',
+                       lambda self, ver: list_all_domains)
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instances = [{'name': 'instance-1', 'uuid': 'fake-uuid-1'},
+                     {'name': 'instance-2', 'uuid': 'fake-uuid-2'},
+                     {'name': 'instance-3', 'uuid': 'fake-uuid-3'}]
+        infos = conn.get_info_all(instances)
+        # The hypervisor, unknown and missing domains are not listed
+        self.assertEqual(['fake-uuid-1', 'fake-uuid-2'], sorted(infos))
+        self.assertEqual({'state': power_state.RUNNING, 'max_mem': 2048,
+                          'mem': 1024, 'num_cpu': 1, 'cpu_time': 0, 'id': 1},
+                         infos['fake-uuid-1'])
+        self.assertEqual(-1, infos['fake-uuid-2']['id'])
+
+    def test_get_info_all(self):
+        self._test_get_info_all(list_all_domains=False)
+
+    def test_get_info_all_list_all_domains(self):
+        self._test_get_info_all(list_all_domains=True)
+
     def test_get_all_block_devices(self):
         xml = [
             # NOTE(vish): id 0 is skipped
@@ -4361,9 +4432,20 @@ class LibvirtConnTestCase(test.TestCase):
         # Ensure destroy calls managedSaveRemove for saved instance.
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
 
-        def list_instances():
-            return ['fake1', 'fake2']
-        self.stubs.Set(conn, 'list_instances', list_instances)
+        class DiagFakeDomain(FakeVirtDomain):
+            def __init__(self, name):
+                super(DiagFakeDomain, self).__init__(fake_xml=name)
+                self.domain_name = name
+
+            def ID(self):
+                return 1
+
+            def name(self):
+                return self.domain_name
+
+        def list_instance_domains():
+            return [DiagFakeDomain('fake1'), DiagFakeDomain('fake2')]
+        self.stubs.Set(conn, 'list_instance_domains', list_instance_domains)
 
         fake_disks = {'fake1': [{'type': 'qcow2', 'path': '/somepath/disk1',
                                  'virt_disk_size': '10737418240',
@@ -4376,13 +4458,43 @@ class LibvirtConnTestCase(test.TestCase):
                                  'disk_size': '10737418240',
                                  'over_committed_disk_size': '0'}]}
 
-        def get_info(instance_name):
+        def get_info(instance_name, xml):
+            self.assertEqual(instance_name, xml)
             return jsonutils.dumps(fake_disks.get(instance_name))
         self.stubs.Set(conn, 'get_instance_disk_info', get_info)
 
         result = conn.get_disk_over_committed_size_total()
         self.assertEqual(result, 10653532160)
 
+    def _test_disk_over_committed_size_total_libvirt_error(self, error_code):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+
+        class DeletedFakeDomain(FakeVirtDomain):
+            def ID(self):
+                return 1
+
+            def name(self):
+                return 'fake1'
+
+            def XMLDesc(self, flags):
+                raise libvirt.libvirtError("we deleted an instance!")
+
+        self.mox.StubOutWithMock(libvirt.libvirtError, "get_error_code")
+        libvirt.libvirtError.get_error_code().AndReturn(error_code)
+        self.mox.ReplayAll()
+        return conn.get_disk_over_committed_size_total(
+            domains=[DeletedFakeDomain()])
+
+    def test_disk_over_committed_size_total_deleted_domain(self):
+        self.assertEqual(0,
+            self._test_disk_over_committed_size_total_libvirt_error(
+                libvirt.VIR_ERR_NO_DOMAIN))
+
+    def test_disk_over_committed_size_total_libvirt_error(self):
+        self.assertRaises(libvirt.libvirtError,
+            self._test_disk_over_committed_size_total_libvirt_error,
+            libvirt.VIR_ERR_INTERNAL_ERROR)
+
     def test_cpu_info(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -4515,6 +4627,30 @@ class LibvirtConnTestCase(test.TestCase):
             if key not in ['phys_function', 'virt_functions', 'label']:
                 self.assertEqual(actctualvfs[0][key], expectvfs[1][key])
 
+    def test_get_pci_passthrough_devices_cached(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        libvirt_driver.LibvirtDriver._conn.listDevices = (
+            self.mox.CreateMockAnything())
+        self.mox.StubOutWithMock(conn, '_get_pcidev_info')
+        self.stubs.Set(conn.dev_filter, 'device_assignable', lambda x: True)
+
+        # The devices are listed once until the host info is invalidated
+        for i in range(2):
+            libvirt_driver.LibvirtDriver._conn.listDevices(
+                'pci', 0).AndReturn(['pci_0000_04_10_7'])
+            conn._get_pcidev_info('pci_0000_04_10_7').AndReturn(
+                {'dev_id': 'pci_0000_04_10_7', 'dev_type': 'type-VF'})
+        self.mox.ReplayAll()
+
+        for i in range(2):
+            actjson = conn.get_pci_passthrough_devices()
+            self.assertEqual('pci_0000_04_10_7',
+                             jsonutils.loads(actjson)[0]['dev_id'])
+        conn._invalidate_host_info()
+        self.assertEqual(None, conn._caps)
+        conn.get_pci_passthrough_devices()
+
     def test_diagnostic_vcpus_exception(self):
         xml = """
                 <domain type='kvm'>
@@ -4911,9 +5047,13 @@ class LibvirtConnTestCase(test.TestCase):
         """
 
         class DiagFakeDomain(object):
-            def __init__(self, vcpus):
+            def __init__(self, domain_id, vcpus):
+                self.domain_id = domain_id
                 self._vcpus = vcpus
 
+            def ID(self):
+                return self.domain_id
+
             def vcpus(self):
                 if self._vcpus is None:
                     return None
@@ -4926,13 +5066,100 @@ class LibvirtConnTestCase(test.TestCase):
         conn.lookupByID = self.mox.CreateMockAnything()
 
         driver.list_instance_ids().AndReturn([1, 2])
-        conn.lookupByID(1).AndReturn(DiagFakeDomain(None))
-        conn.lookupByID(2).AndReturn(DiagFakeDomain(5))
+        conn.lookupByID(1).AndReturn(DiagFakeDomain(1, None))
+        conn.lookupByID(2).AndReturn(DiagFakeDomain(2, 5))
 
         self.mox.ReplayAll()
 
         self.assertEqual(5, driver.get_vcpu_used())
 
+    def test_vcpu_count_from_listed_domains(self):
+        class DiagFakeDomain(object):
+            def __init__(self, domain_id, vcpus):
+                self.domain_id = domain_id
+                self._vcpus = vcpus
+
+            def ID(self):
+                return self.domain_id
+
+            def vcpus(self):
+                return ([1] * self._vcpus, [True] * self._vcpus)
+
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        self.mox.StubOutWithMock(driver, 'list_instance_domains')
+        self.mox.ReplayAll()
+
+        # The hypervisor and the domains which are not running are skipped
+        domains = [DiagFakeDomain(0, 4), DiagFakeDomain(1, 2),
+                   DiagFakeDomain(-1, 8), DiagFakeDomain(2, 1)]
+        self.assertEqual(3, driver.get_vcpu_used(domains))
+
+    def _test_vcpu_count_libvirt_error(self, error_code):
+        class DeletedFakeDomain(object):
+            def ID(self):
+                return 1
+
+            def vcpus(self):
+                raise libvirt.libvirtError("we deleted an instance!")
+
+        class DiagFakeDomain(object):
+            def ID(self):
+                return 2
+
+            def vcpus(self):
+                return ([1] * 2, [True] * 2)
+
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        self.mox.StubOutWithMock(libvirt.libvirtError, "get_error_code")
+        libvirt.libvirtError.get_error_code().AndReturn(error_code)
+        self.mox.ReplayAll()
+        return driver.get_vcpu_used([DeletedFakeDomain(), DiagFakeDomain()])
+
+    def test_vcpu_count_deleted_domain(self):
+        self.assertEqual(2, self._test_vcpu_count_libvirt_error(
+            libvirt.VIR_ERR_NO_DOMAIN))
+
+    def test_vcpu_count_libvirt_error(self):
+        self.assertRaises(libvirt.libvirtError,
+                          self._test_vcpu_count_libvirt_error,
+                          libvirt.VIR_ERR_INTERNAL_ERROR)
+
+    def _test_memory_mb_used_xen_libvirt_error(self, error_code):
+        class DeletedFakeDomain(object):
+            def ID(self):
+                return 1
+
+            def info(self):
+                raise libvirt.libvirtError("we deleted an instance!")
+
+        class DiagFakeDomain(object):
+            def ID(self):
+                return 2
+
+            def info(self):
+                return [0, 0, 2048 * 1024]
+
+        meminfo = ('MemFree: 0 kB\nBuffers: 0 kB\nCached: 0 kB\n')
+        self.flags(libvirt_type='xen')
+        self.stubs.Set(sys, 'platform', 'linux2')
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        self.mox.StubOutWithMock(libvirt.libvirtError, "get_error_code")
+        libvirt.libvirtError.get_error_code().AndReturn(error_code)
+        self.mox.ReplayAll()
+        with mock.patch('__builtin__.open',
+                        mock.mock_open(read_data=meminfo), create=True):
+            return driver.get_memory_mb_used([DeletedFakeDomain(),
+                                              DiagFakeDomain()])
+
+    def test_memory_mb_used_xen_deleted_domain(self):
+        self.assertEqual(2048, self._test_memory_mb_used_xen_libvirt_error(
+            libvirt.VIR_ERR_NO_DOMAIN))
+
+    def test_memory_mb_used_xen_libvirt_error(self):
+        self.assertRaises(libvirt.libvirtError,
+                          self._test_memory_mb_used_xen_libvirt_error,
+                          libvirt.VIR_ERR_INTERNAL_ERROR)
+
     def test_get_instance_capabilities(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -5402,19 +5629,31 @@ class HostStateTestCase(test.TestCase):
         "dev_type": 'type-PF',
         "phys_function": None}]
 
+    domains = ['fake-domain']
+
     class FakeConnection(object):
         """Fake connection object."""
 
+        def __init__(self):
+            self.domain_listings = 0
+
+        def list_instance_domains(self, only_running=False,
+                                  only_guests=True):
+            self.domain_listings += 1
+            return HostStateTestCase.domains
+
         def get_vcpu_total(self):
             return 1
 
-        def get_vcpu_used(self):
+        def get_vcpu_used(self, domains=None):
+            assert domains is HostStateTestCase.domains
             return 0
 
         def get_cpu_info(self):
             return HostStateTestCase.cpu_info
 
-        def get_disk_over_committed_size_total(self):
+        def get_disk_over_committed_size_total(self, domains=None):
+            assert domains is HostStateTestCase.domains
             return 0
 
         def get_local_gb_info(self):
@@ -5423,7 +5662,8 @@ class HostStateTestCase(test.TestCase):
         def get_memory_mb_total(self):
             return 497
 
-        def get_memory_mb_used(self):
+        def get_memory_mb_used(self, domains=None):
+            assert domains is HostStateTestCase.domains
             return 88
 
         def get_hypervisor_type(self):
@@ -5470,6 +5710,8 @@ class HostStateTestCase(test.TestCase):
         self.assertEquals(stats["disk_available_least"], 80)
         self.assertEquals(jsonutils.loads(stats["pci_passthrough_devices"]),
                           HostStateTestCase.pci_devices)
+        # The domains are listed once for all the usages
+        self.assertEqual(1, hs.driver.domain_listings)
 
 
 class NWFilterFakes:
@@ -15,10 +15,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import os
 
+from nova.openstack.common import processutils
 from nova import test
 from nova import utils
+from nova.virt import images
+from nova.virt.libvirt import imagepeers
 from nova.virt.libvirt import utils as libvirt_utils
 
 
@@ -40,3 +44,70 @@ blah BLAH: bb
         self.mox.ReplayAll()
         disk_type = libvirt_utils.get_disk_type(path)
         self.assertEqual(disk_type, 'raw')
+
+    def test_copy_image_receive(self):
+        self.mox.StubOutWithMock(utils, 'execute')
+        utils.execute('rsync', '--sparse', '--compress', '--dry-run',
+                      'host:/src', '/dest')
+        utils.execute('rsync', '--sparse', '--compress', 'host:/src', '/dest')
+        self.mox.ReplayAll()
+        libvirt_utils.copy_image('/src', '/dest', host='host', receive=True)
+
+    def test_fetch_image_from_peers(self):
+        base_file = '/i/_base/%s' % hashlib.sha1('image').hexdigest()
+        self.mox.StubOutWithMock(imagepeers, 'get_peers')
+        self.mox.StubOutWithMock(libvirt_utils, 'copy_image')
+        self.mox.StubOutWithMock(os, 'rename')
+        self.mox.StubOutWithMock(images, 'fetch_to_raw')
+        self.mox.StubOutWithMock(imagepeers, 'advertise')
+        imagepeers.get_peers('image', base_file).AndReturn(
+            [('host1', '/a/_base/abc'), (None, '/b/_base/abc')])
+        libvirt_utils.copy_image('/a/_base/abc', base_file + '.part',
+                                 host='host1', receive=True).AndRaise(
+            processutils.ProcessExecutionError())
+        libvirt_utils.copy_image('/b/_base/abc', base_file + '.part',
+                                 host=None, receive=True)
+        os.rename(base_file + '.part', base_file)
+        imagepeers.advertise('image', base_file)
+        self.mox.ReplayAll()
+        libvirt_utils.fetch_image('context', base_file, 'image', 'user',
+                                  'project', base_dir='/i/_base')
+
+    def test_fetch_image_falls_back_to_image_service(self):
+        base_file = '/i/_base/%s' % hashlib.sha1('image').hexdigest()
+        self.flags(base_image_peer_attempts=1)
+        self.mox.StubOutWithMock(imagepeers, 'get_peers')
+        self.mox.StubOutWithMock(libvirt_utils, 'copy_image')
+        self.mox.StubOutWithMock(images, 'fetch_to_raw')
+        self.mox.StubOutWithMock(imagepeers, 'advertise')
+        imagepeers.get_peers('image', base_file).AndReturn(
+            [('host1', '/a/_base/abc'), ('host2', '/b/_base/abc')])
+        libvirt_utils.copy_image('/a/_base/abc', base_file + '.part',
+                                 host='host1', receive=True).AndRaise(
+            processutils.ProcessExecutionError())
+        images.fetch_to_raw('context', 'image', base_file, 'user',
+                            'project')
+        imagepeers.advertise('image', base_file)
+        self.mox.ReplayAll()
+        libvirt_utils.fetch_image('context', base_file, 'image', 'user',
+                                  'project', base_dir='/i/_base')
+
+    def _test_fetch_image_outside_base_dir(self, target, base_dir):
+        self.mox.StubOutWithMock(imagepeers, 'get_peers')
+        self.mox.StubOutWithMock(images, 'fetch_to_raw')
+        self.mox.StubOutWithMock(imagepeers, 'advertise')
+        images.fetch_to_raw('context', 'image', target, 'user', 'project')
+        self.mox.ReplayAll()
+        libvirt_utils.fetch_image('context', target, 'image', 'user',
+                                  'project', base_dir=base_dir)
+
+    def test_fetch_image_to_instance_dir(self):
+        self._test_fetch_image_outside_base_dir('/i/instance/kernel',
+                                                '/i/_base')
+
+    def test_fetch_image_under_another_name(self):
+        self._test_fetch_image_outside_base_dir('/i/_base/image', '/i/_base')
+
+    def test_fetch_image_without_base_dir(self):
+        target = '/i/_base/%s' % hashlib.sha1('image').hexdigest()
+        self._test_fetch_image_outside_base_dir(target, None)
@@ -12,8 +12,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import os
+import struct
 
+import mox
+
+from nova import exception
+from nova.image import glance
 from nova import test
+from nova import utils
 from nova.virt import images
 
 
@@ -22,3 +30,154 @@ class QemuTestCase(test.NoDBTestCase):
         image_info = images.qemu_img_info("/path/that/does/not/exist")
         self.assertTrue(image_info)
         self.assertTrue(str(image_info))
+
+
+class CachedQemuImgInfoTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(CachedQemuImgInfoTestCase, self).setUp()
+        self.stubs.Set(images, '_disk_info_cache', {})
+
+    def _write_qcow2(self, path, backing_file='', nb_snapshots=0):
+        header = images.QCOW2_HEADER.pack(
+            images.QCOW2_MAGIC, 2, backing_file and 72 or 0,
+            len(backing_file), 16, 10 * 1024 * 1024 * 1024, 0, 0, 0, 0, 0,
+            nb_snapshots)
+        with open(path, 'wb') as image_file:
+            image_file.write(header + struct.pack('>Q', 0) + backing_file)
+
+    def test_qcow2_header(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self._write_qcow2(path, backing_file='/base/image')
+            self.mox.StubOutWithMock(utils, 'execute')
+            self.mox.ReplayAll()
+            image_info = images.cached_qemu_img_info(path)
+        self.assertEqual('qcow2', image_info.file_format)
+        self.assertEqual(10 * 1024 * 1024 * 1024, image_info.virtual_size)
+        self.assertEqual(65536, image_info.cluster_size)
+        self.assertEqual('/base/image', image_info.backing_file)
+
+    def test_qcow2_header_relative_backing_file(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self._write_qcow2(path, backing_file='image')
+            image_info = images.cached_qemu_img_info(path)
+            self.assertEqual(os.path.join(tmpdir, 'image'),
+                             image_info.backing_file)
+
+    def test_qcow2_header_without_backing_file(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self._write_qcow2(path)
+            image_info = images.cached_qemu_img_info(path)
+        self.assertEqual(None, image_info.backing_file)
+
+    def _test_runs_qemu_img(self, write_image):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            write_image(path)
+            self.mox.StubOutWithMock(images, 'qemu_img_info')
+            images.qemu_img_info(path).AndReturn('info')
+            self.mox.ReplayAll()
+            self.assertEqual('info', images.cached_qemu_img_info(path))
+
+    def test_raw_image_runs_qemu_img(self):
+        def write_image(path):
+            with open(path, 'wb') as image_file:
+                image_file.write('\0' * 1024)
+        self._test_runs_qemu_img(write_image)
+
+    def test_qcow2_snapshots_run_qemu_img(self):
+        self._test_runs_qemu_img(
+            lambda path: self._write_qcow2(path, nb_snapshots=1))
+
+    def test_missing_image_is_not_cached(self):
+        path = '/path/that/does/not/exist'
+        self.mox.StubOutWithMock(images, 'qemu_img_info')
+        images.qemu_img_info(path).AndReturn('info')
+        self.mox.ReplayAll()
+        self.assertEqual('info', images.cached_qemu_img_info(path))
+        self.assertEqual({}, images._disk_info_cache)
+
+    def test_unchanged_image_is_not_read_again(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self._write_qcow2(path, backing_file='/base/image')
+            image_info = images.cached_qemu_img_info(path)
+
+            self.mox.StubOutWithMock(images, '_qcow2_img_info')
+            self.mox.ReplayAll()
+            self.assertIs(image_info, images.cached_qemu_img_info(path))
+
+    def test_changed_image_is_read_again(self):
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self._write_qcow2(path, backing_file='/base/image')
+            images.cached_qemu_img_info(path)
+
+            self._write_qcow2(path, backing_file='/base/other-image')
+            image_info = images.cached_qemu_img_info(path)
+        self.assertEqual('/base/other-image', image_info.backing_file)
+
+
+class FakeImageService(object):
+    def __init__(self, chunks, checksum=None):
+        self.chunks = chunks
+        self.checksum = checksum
+
+    def show(self, context, image_id):
+        return {'id': image_id, 'checksum': self.checksum}
+
+    def download(self, context, image_id, data=None, dst_path=None):
+        for chunk in self.chunks:
+            data.write(chunk)
+
+
+class FetchTestCase(test.NoDBTestCase):
+    def _stub_image(self, chunks, checksum=None):
+        image_service = FakeImageService(chunks, checksum)
+        self.stubs.Set(glance, 'get_remote_image_service',
+                       lambda context, image_href: (image_service, 'fake'))
+
+    def test_fetch_is_sparse(self):
+        zeros = '\0' * images.SPARSE_BLOCK_SIZE
+        chunks = [zeros * 16, 'data', zeros * 16 + 'data', zeros * 16]
+        self._stub_image(chunks)
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            images.fetch(None, 'fake', path, None, None)
+            with open(path, 'rb') as image_file:
+                self.assertEqual(''.join(chunks), image_file.read())
+            stat = os.stat(path)
+            self.assertTrue(stat.st_blocks * 512 < stat.st_size / 4)
+
+    def test_fetch_checksum(self):
+        self._stub_image(['data'], hashlib.md5('data').hexdigest())
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            images.fetch(None, 'fake', path, None, None)
+            self.assertTrue(os.path.exists(path))
+
+    def test_fetch_bad_checksum(self):
+        self._stub_image(['data'], hashlib.md5('other data').hexdigest())
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self.assertRaises(exception.ImageUnacceptable,
+                              images.fetch, None, 'fake', path, None, None)
+            self.assertFalse(os.path.exists(path))
+
+    def test_fetch_to_raw_rejects_backing_file(self):
+        self._stub_image(['data'])
+        image_info = images.QemuImgInfo()
+        image_info.file_format = 'raw'
+        image_info.backing_file = '/etc/shadow'
+        self.mox.StubOutWithMock(images, 'qemu_img_info')
+        images.qemu_img_info(mox.IgnoreArg()).AndReturn(image_info)
+        self.mox.ReplayAll()
+        with utils.tempdir() as tmpdir:
+            path = os.path.join(tmpdir, 'disk')
+            self.assertRaises(exception.ImageUnacceptable,
+                              images.fetch_to_raw, None, 'fake', path, None,
+                              None)
+            self.assertFalse(os.path.exists(path + '.part'))
+            self.assertFalse(os.path.exists(path))
@@ -489,6 +489,15 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
                           self.connection.get_info,
                           {'name': 'I just made this name up'})
 
+    @catch_notimplementederror
+    def test_get_info_all(self):
+        instance_ref, network_info = self._get_running_instance()
+        unknown = {'name': 'I just made this name up',
+                   'uuid': 'I just made this uuid up'}
+        infos = self.connection.get_info_all([instance_ref, unknown])
+        self.assertEqual([instance_ref['uuid']], infos.keys())
+        self.assertIn('state', infos[instance_ref['uuid']])
+
     @catch_notimplementederror
     def test_get_diagnostics(self):
         instance_ref, network_info = self._get_running_instance()
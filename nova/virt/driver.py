@@ -26,6 +26,7 @@ import sys
 
 from oslo.config import cfg
 
+from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -155,6 +156,28 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_info_all(self, instances):
+        """Get the current status of several instances.
+
+        Returns a dict mapping the uuid of each instance found on the
+        hypervisor to the same dict as get_info().  Instances which are
+        not found are left out.
+
+        .. note::
+
+            This implementation works for all drivers, but it is
+            not particularly efficient. Maintainers of the virt drivers are
+            encouraged to override this method with something more
+            efficient.
+        """
+        infos = {}
+        for instance in instances:
+            try:
+                infos[instance['uuid']] = self.get_info(instance)
+            except exception.InstanceNotFound:
+                pass
+        return infos
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
@@ -916,6 +939,17 @@ class ComputeDriver(object):
         """
         pass
 
+    def cache_image(self, context, image_id):
+        """
+        Download an image into the driver's local image cache.
+
+        Drivers caching images implement this so that images can be fetched
+        before instances are created from them.  Drivers reporting the
+        images they cached do so under 'cached_images' in the result of
+        get_available_resource().
+        """
+        raise NotImplementedError()
+
     def add_to_aggregate(self, context, aggregate, host, **kwargs):
         """Add a compute host to an aggregate."""
         #NOTE(jogo) Currently only used for XenAPI-Pool
@@ -21,8 +21,10 @@
 Handling of VM disk images.
 """
 
+import hashlib
 import os
 import re
+import struct
 
 from oslo.config import cfg
 
@@ -44,6 +46,20 @@ image_opts = [
 
 CONF = cfg.CONF
 CONF.register_opts(image_opts)
+CONF.import_opt('allowed_direct_url_schemes', 'nova.image.glance')
+
+# The fields of a qcow2 header, up to the number of snapshots.
+QCOW2_HEADER = struct.Struct('>4sIQIIQIIQQII')
+QCOW2_MAGIC = 'QFI\xfb'
+
+# Size of the blocks of zeros fetch leaves as holes in the images it writes
+SPARSE_BLOCK_SIZE = 64 * 1024
+
+# Maximum number of disks whose qemu_img_info is kept by
+# cached_qemu_img_info
+DISK_INFO_CACHE_SIZE = 1000
+
+_disk_info_cache = {}
 
 
 class QemuImgInfo(object):
@@ -173,13 +189,111 @@ def qemu_img_info(path):
     return QemuImgInfo(out)
 
 
+def _qcow2_img_info(path, stat):
+    """Return the details of a qcow2 image read from its header, or None
+    if path is not a qcow2 image without snapshots.
+    """
+    with open(path, 'rb') as image_file:
+        header = image_file.read(QCOW2_HEADER.size)
+        if len(header) < QCOW2_HEADER.size:
+            return None
+        (magic, version, backing_file_offset, backing_file_size,
+         cluster_bits, size, crypt_method, l1_size, l1_table_offset,
+         refcount_table_offset, refcount_table_clusters,
+         nb_snapshots) = QCOW2_HEADER.unpack(header)
+        if magic != QCOW2_MAGIC or version not in (2, 3) or nb_snapshots:
+            return None
+        backing_file = None
+        if backing_file_offset:
+            image_file.seek(backing_file_offset)
+            backing_file = image_file.read(backing_file_size)
+            # Relative backing files are relative to the image, as in the
+            # actual path shown by qemu-img
+            backing_file = os.path.join(os.path.dirname(path), backing_file)
+
+    data = QemuImgInfo()
+    data.image = path
+    data.file_format = 'qcow2'
+    data.virtual_size = size
+    data.cluster_size = 1 << cluster_bits
+    data.disk_size = stat.st_blocks * 512
+    data.backing_file = backing_file
+    return data
+
+
+def cached_qemu_img_info(path):
+    """Return the qemu_img_info of a disk, reusing the details found the
+    last time as long as the modification time, size and inode of the
+    disk are unchanged.
+
+    The details of qcow2 images are read from their header instead of
+    running qemu-img.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return qemu_img_info(path)
+
+    key = (stat.st_mtime, stat.st_size, stat.st_ino)
+    cached = _disk_info_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        data = _qcow2_img_info(path, stat)
+    except (IOError, struct.error) as e:
+        LOG.debug(_('Could not read the qcow2 header of %(path)s: %(e)s'),
+                  {'path': path, 'e': e})
+        data = None
+    if data is None:
+        data = qemu_img_info(path)
+
+    if len(_disk_info_cache) >= DISK_INFO_CACHE_SIZE:
+        _disk_info_cache.clear()
+    _disk_info_cache[path] = (key, data)
+    return data
+
+
 def convert_image(source, dest, out_format, run_as_root=False):
     """Convert image to other format."""
     cmd = ('qemu-img', 'convert', '-O', out_format, source, dest)
     utils.execute(*cmd, run_as_root=run_as_root)
 
 
+class _SparseImageWriter(object):
+    """Writes an image as it is downloaded, leaving its zeros as holes.
+
+    The md5 of the image is kept as the data goes through.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._zeros = '\0' * SPARSE_BLOCK_SIZE
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, data):
+        self.md5.update(data)
+        for offset in xrange(0, len(data), SPARSE_BLOCK_SIZE):
+            block = data[offset:offset + SPARSE_BLOCK_SIZE]
+            if block == self._zeros[:len(block)]:
+                self._file.seek(len(block), os.SEEK_CUR)
+            else:
+                self._file.write(block)
+        self.size += len(data)
+
+    def close(self):
+        # Trailing holes are only part of the file once it is extended
+        self._file.truncate(self.size)
+        self._file.close()
+
+
 def fetch(context, image_href, path, _user_id, _project_id):
+    """Downloads an image to path.
+
+    The image is written sparsely and checked against the checksum Glance
+    has for it while it is downloaded.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -187,10 +301,38 @@ def fetch(context, image_href, path, _user_id, _project_id):
     (image_service, image_id) = glance.get_remote_image_service(context,
                                                                 image_href)
     with fileutils.remove_path_on_error(path):
-        image_service.download(context, image_id, dst_path=path)
+        if CONF.allowed_direct_url_schemes:
+            # The image may be copied from its location rather than
+            # downloaded, so it can't go through the writer.
+            image_service.download(context, image_id, dst_path=path)
+            return
+
+        image_meta = image_service.show(context, image_id)
+        writer = _SparseImageWriter(path)
+        try:
+            image_service.download(context, image_id, data=writer)
+        finally:
+            writer.close()
+
+        checksum = image_meta.get('checksum')
+        if checksum and checksum != writer.md5.hexdigest():
+            raise exception.ImageUnacceptable(image_id=image_href,
+                reason=(_("checksum %(actual)s does not match %(expected)s")
+                        % {'actual': writer.md5.hexdigest(),
+                           'expected': checksum}))
 
 
 def fetch_to_raw(context, image_href, path, user_id, project_id):
+    """Downloads an image to path, converting it to raw if needed.
+
+    The image is downloaded once by fetch, which writes it sparsely and
+    checks its md5 on the way.  Its format is then probed by qemu-img info,
+    which only reads the headers, and raw images are renamed into place
+    without being copied.  Other formats still take a pass of qemu-img
+    convert when force_raw_images is set, as qemu-img can't convert from a
+    stream.  The download goes to a .part file so that a partial or
+    unchecked image never shows up at path.
+    """
     path_tmp = "%s.part" % path
     fetch(context, image_href, path_tmp, user_id, project_id)
 
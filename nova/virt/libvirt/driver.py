@@ -228,6 +228,7 @@ CONF.import_opt('use_cow_images', 'nova.virt.driver')
 CONF.import_opt('live_migration_retry_count', 'nova.compute.manager')
 CONF.import_opt('vncserver_proxyclient_address', 'nova.vnc')
 CONF.import_opt('server_proxyclient_address', 'nova.spice', group='spice')
+CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
 
 DEFAULT_FIREWALL_DRIVER = "%s.%s" % (
     libvirt_firewall.__name__,
@@ -295,6 +296,8 @@ MIN_QEMU_LIVESNAPSHOT_VERSION = (1, 3, 0)
 MIN_LIBVIRT_BLOCKIO_VERSION = (0, 10, 2)
 # BlockJobInfo management requirement
 MIN_LIBVIRT_BLOCKJOBINFO_VERSION = (1, 1, 1)
+# Listing all the domain objects in one call
+MIN_LIBVIRT_LIST_ALL_DOMAINS_VERSION = (0, 9, 13)
 
 
 def libvirt_error_handler(context, err):
@@ -323,6 +326,7 @@ class LibvirtDriver(driver.ComputeDriver):
         self._wrapped_conn = None
         self._wrapped_conn_lock = threading.Lock()
         self._caps = None
+        self._pci_devices = None
         self._vcpu_total = 0
         self.read_only = read_only
         self.firewall_driver = firewall.load_driver(
@@ -591,6 +595,9 @@ class LibvirtDriver(driver.ComputeDriver):
             with self._wrapped_conn_lock:
                 self._wrapped_conn = wrapped_conn
 
+            # The host may have changed while we were not connected
+            self._invalidate_host_info()
+
             try:
                 LOG.debug(_("Registering for lifecycle events %s") %
                           str(self))
@@ -2315,6 +2322,7 @@ class LibvirtDriver(driver.ComputeDriver):
                            'kernel_id': instance['kernel_id'],
                            'ramdisk_id': instance['ramdisk_id']}
 
+        base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
         if disk_images['kernel_id']:
             fname = imagecache.get_cache_fname(disk_images, 'kernel_id')
             raw('kernel').cache(fetch_func=libvirt_utils.fetch_image,
@@ -2322,7 +2330,8 @@ class LibvirtDriver(driver.ComputeDriver):
                                 filename=fname,
                                 image_id=disk_images['kernel_id'],
                                 user_id=instance['user_id'],
-                                project_id=instance['project_id'])
+                                project_id=instance['project_id'],
+                                base_dir=base_dir)
             if disk_images['ramdisk_id']:
                 fname = imagecache.get_cache_fname(disk_images, 'ramdisk_id')
                 raw('ramdisk').cache(fetch_func=libvirt_utils.fetch_image,
@@ -2330,7 +2339,8 @@ class LibvirtDriver(driver.ComputeDriver):
                                      filename=fname,
                                      image_id=disk_images['ramdisk_id'],
                                      user_id=instance['user_id'],
-                                     project_id=instance['project_id'])
+                                     project_id=instance['project_id'],
+                                     base_dir=base_dir)
 
         inst_type = flavors.extract_flavor(instance)
 
@@ -2344,7 +2354,7 @@ class LibvirtDriver(driver.ComputeDriver):
             if size == 0 or suffix == '.rescue':
                 size = None
 
-            image('disk').cache(fetch_func=libvirt_utils.fetch_image,
+            image('disk').cache(fetch_func=self._fetch_base_image,
                                 context=context,
                                 filename=root_fname,
                                 size=size,
@@ -2558,6 +2568,13 @@ class LibvirtDriver(driver.ComputeDriver):
                       % {'dev': pci_devs, 'dom': dom.ID()})
             raise
 
+    def _invalidate_host_info(self):
+        """Forget the capabilities and PCI devices of the host, so that
+        they are read again from libvirt the next time they are needed.
+        """
+        self._caps = None
+        self._pci_devices = None
+
     def get_host_capabilities(self):
         """Returns an instance of config.LibvirtConfigCaps representing
            the capabilities of the host.
@@ -3100,6 +3117,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
         """
         virt_dom = self._lookup_by_name(instance['name'])
+        return self._get_domain_info(virt_dom)
+
+    def _get_domain_info(self, virt_dom):
         (state, max_mem, mem, num_cpu, cpu_time) = virt_dom.info()
         return {'state': LIBVIRT_POWER_STATE[state],
                 'max_mem': max_mem,
@@ -3108,6 +3128,56 @@ class LibvirtDriver(driver.ComputeDriver):
                 'cpu_time': cpu_time,
                 'id': virt_dom.ID()}
 
+    def list_instance_domains(self, only_running=False, only_guests=True):
+        """Returns the domain objects of the running and defined domains.
+
+        :param only_running: if True, leave out the defined domains which
+                             are not running
+        :param only_guests: if True, leave out the hypervisor domain
+        """
+        if self.has_min_version(MIN_LIBVIRT_LIST_ALL_DOMAINS_VERSION):
+            flags = 0
+            if only_running:
+                flags = libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE
+            return [virt_dom for virt_dom in self._conn.listAllDomains(flags)
+                    if not only_guests or virt_dom.ID() != 0]
+
+        domains = []
+        for domain_id in self.list_instance_ids():
+            try:
+                # We skip domains with ID 0 (hypervisors).
+                if domain_id != 0 or not only_guests:
+                    domains.append(self._lookup_by_id(domain_id))
+            except exception.InstanceNotFound:
+                # Ignore deleted instance while listing
+                continue
+        if not only_running:
+            for domain_name in self._conn.listDefinedDomains():
+                try:
+                    domains.append(self._lookup_by_name(domain_name))
+                except exception.InstanceNotFound:
+                    # Ignore deleted instance while listing
+                    continue
+        return domains
+
+    def get_info_all(self, instances):
+        """Efficient override of base get_info_all method, listing the
+        domains once instead of looking up each instance by name.
+        """
+        uuids_by_name = dict((instance['name'], instance['uuid'])
+                             for instance in instances)
+        infos = {}
+        for virt_dom in self.list_instance_domains():
+            try:
+                uuid = uuids_by_name.get(virt_dom.name())
+                if uuid is not None:
+                    infos[uuid] = self._get_domain_info(virt_dom)
+            except libvirt.libvirtError as ex:
+                # Ignore instance deleted while listing
+                if ex.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+        return infos
+
     def _create_domain(self, xml=None, domain=None,
                        instance=None, launch_flags=0, power_on=True):
         """Create a domain.
@@ -3386,9 +3456,11 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return info
 
-    def get_vcpu_used(self):
+    def get_vcpu_used(self, domains=None):
         """Get vcpu usage number of physical computer.
 
+        :param domains: the domains listed by list_instance_domains(), to
+                        avoid listing them again
         :returns: The total number of vcpu that currently used.
 
         """
@@ -3397,26 +3469,34 @@ class LibvirtDriver(driver.ComputeDriver):
         if CONF.libvirt_type == 'lxc':
             return total + 1
 
-        dom_ids = self.list_instance_ids()
-        for dom_id in dom_ids:
+        if domains is None:
+            domains = self.list_instance_domains(only_running=True)
+        for dom in domains:
+            dom_id = dom.ID()
+            # Skip the hypervisor and the domains which are not running
+            if dom_id <= 0:
+                continue
             try:
-                dom = self._lookup_by_id(dom_id)
                 vcpus = dom.vcpus()
-                if vcpus is None:
-                    LOG.debug(_("couldn't obtain the vpu count from domain id:"
-                                " %s") % dom_id)
-                else:
-                    total += len(vcpus[1])
-            except exception.InstanceNotFound:
+            except libvirt.libvirtError as e:
+                if e.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
                 LOG.info(_("libvirt can't find a domain with id: %s") % dom_id)
                 continue
+            if vcpus is None:
+                LOG.debug(_("couldn't obtain the vpu count from domain id:"
+                            " %s") % dom_id)
+            else:
+                total += len(vcpus[1])
             # NOTE(gtt116): give change to do other task.
             greenthread.sleep(0)
         return total
 
-    def get_memory_mb_used(self):
+    def get_memory_mb_used(self, domains=None):
         """Get the free memory size(MB) of physical computer.
 
+        :param domains: the domains listed by list_instance_domains(), to
+                        avoid listing them again
         :returns: the total usage of memory(MB).
 
         """
@@ -3430,10 +3510,19 @@ class LibvirtDriver(driver.ComputeDriver):
         idx3 = m.index('Cached:')
         if CONF.libvirt_type == 'xen':
             used = 0
-            for domain_id in self.list_instance_ids():
+            if domains is None:
+                domains = self.list_instance_domains(only_running=True,
+                                                     only_guests=False)
+            for dom in domains:
+                domain_id = dom.ID()
+                # Skip the domains which are not running
+                if domain_id < 0:
+                    continue
                 try:
-                    dom_mem = int(self._lookup_by_id(domain_id).info()[2])
-                except exception.InstanceNotFound:
+                    dom_mem = int(dom.info()[2])
+                except libvirt.libvirtError as e:
+                    if e.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                        raise
                     LOG.info(_("libvirt can't find a domain with id: %s")
                              % domain_id)
                     continue
@@ -3616,18 +3705,24 @@ class LibvirtDriver(driver.ComputeDriver):
 
         Refer to the objects/pci_device.py for more idea of these keys.
 
+        The devices are listed once and then kept until the connection to
+        libvirt is opened again.
+
         :returns: a list of the assignable pci devices information
         """
-        pci_info = []
+        if self._pci_devices is None:
+            pci_info = []
 
-        dev_names = self._conn.listDevices('pci', 0) or []
+            dev_names = self._conn.listDevices('pci', 0) or []
 
-        for name in dev_names:
-            pci_dev = self._get_pcidev_info(name)
-            if self._pci_device_assignable(pci_dev):
-                pci_info.append(pci_dev)
+            for name in dev_names:
+                pci_dev = self._get_pcidev_info(name)
+                if self._pci_device_assignable(pci_dev):
+                    pci_info.append(pci_dev)
 
-        return jsonutils.dumps(pci_info)
+            self._pci_devices = pci_info
+
+        return jsonutils.dumps(self._pci_devices)
 
     def get_all_volume_usage(self, context, compute_host_bdms):
         """Return usage info for volumes attached to vms on
@@ -3727,6 +3822,7 @@ class LibvirtDriver(driver.ComputeDriver):
         stats = self.host_state.get_host_stats(refresh=True)
         stats['supported_instances'] = jsonutils.dumps(
                 stats['supported_instances'])
+        stats['cached_images'] = self.image_cache_manager.list_cached_images()
         return stats
 
     def check_instance_shared_storage_local(self, context, instance):
@@ -4191,7 +4287,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 image = self.image_backend.image(instance,
                                                  instance_disk,
                                                  CONF.libvirt_images_type)
-                image.cache(fetch_func=libvirt_utils.fetch_image,
+                image.cache(fetch_func=self._fetch_base_image,
                             context=context,
                             filename=cache_name,
                             image_id=instance['image_ref'],
@@ -4335,15 +4431,25 @@ class LibvirtDriver(driver.ComputeDriver):
                               'over_committed_disk_size': over_commit_size})
         return jsonutils.dumps(disk_info)
 
-    def get_disk_over_committed_size_total(self):
-        """Return total over committed disk size for all instances."""
+    def get_disk_over_committed_size_total(self, domains=None):
+        """Return total over committed disk size for all instances.
+
+        :param domains: the domains listed by list_instance_domains(), to
+                        avoid listing them again
+        """
         # Disk size that all instance uses : virtual_size - disk_size
-        instances_name = self.list_instances()
+        if domains is None:
+            domains = self.list_instance_domains()
         disk_over_committed_size = 0
-        for i_name in instances_name:
+        for dom in domains:
+            # Skip the hypervisor
+            if dom.ID() == 0:
+                continue
+            i_name = dom.name()
             try:
+                xml = dom.XMLDesc(0)
                 disk_infos = jsonutils.loads(
-                        self.get_instance_disk_info(i_name))
+                        self.get_instance_disk_info(i_name, xml=xml))
                 for info in disk_infos:
                     disk_over_committed_size += int(
                         info['over_committed_disk_size'])
@@ -4356,6 +4462,10 @@ class LibvirtDriver(driver.ComputeDriver):
             except exception.InstanceNotFound:
                 # Instance was deleted during the check so ignore it
                 pass
+            except libvirt.libvirtError as e:
+                if e.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+                # Instance was deleted during the check so ignore it
             # NOTE(gtt116): give change to do other task.
             greenthread.sleep(0)
         return disk_over_committed_size
@@ -4383,6 +4493,33 @@ class LibvirtDriver(driver.ComputeDriver):
         """Manage the local cache of images."""
         self.image_cache_manager.verify_base_images(context, all_instances)
 
+    @staticmethod
+    def _fetch_base_image(context, target, image_id, user_id, project_id):
+        """Fetch a base image, recording its image id so that
+        get_available_resource reports it as cached.
+        """
+        base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
+        libvirt_utils.fetch_image(context, target, image_id, user_id,
+                                  project_id, base_dir=base_dir)
+        imagecache.write_stored_info(target, field='image_id', value=image_id)
+
+    def cache_image(self, context, image_id):
+        """Fetch the base image of image_id into _base if it's missing."""
+        filename = imagecache.get_cache_fname({'image_id': image_id},
+                                              'image_id')
+        base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
+        base = os.path.join(base_dir, filename)
+        lock_path = os.path.join(CONF.instances_path, 'locks')
+
+        @utils.synchronized(filename, external=True, lock_path=lock_path)
+        def fetch_if_missing():
+            if not os.path.exists(base):
+                fileutils.ensure_tree(base_dir)
+                self._fetch_base_image(context, base, image_id,
+                                       context.user_id, context.project_id)
+
+        fetch_if_missing()
+
     def _cleanup_remote_migration(self, dest, inst_base, inst_base_resize,
                                   shared_storage=False):
         """Used only for cleanup in case migrate_disk_and_power_off fails."""
@@ -4781,13 +4918,15 @@ class HostState(object):
             """
             disk_free_gb = disk_info_dict['free']
             disk_over_committed = (self.driver.
-                    get_disk_over_committed_size_total())
+                    get_disk_over_committed_size_total(domains))
             # Disk available least size
             available_least = disk_free_gb * (1024 ** 3) - disk_over_committed
             return (available_least / (1024 ** 3))
 
         LOG.debug(_("Updating host stats"))
         disk_info_dict = self.driver.get_local_gb_info()
+        # List the domains once for the vcpu, memory and disk usages
+        domains = self.driver.list_instance_domains(only_guests=False)
         data = {}
 
         #NOTE(dprince): calling capabilities before getVersion works around
@@ -4800,8 +4939,8 @@ class HostState(object):
         data["vcpus"] = self.driver.get_vcpu_total()
         data["memory_mb"] = self.driver.get_memory_mb_total()
         data["local_gb"] = disk_info_dict['total']
-        data["vcpus_used"] = self.driver.get_vcpu_used()
-        data["memory_mb_used"] = self.driver.get_memory_mb_used()
+        data["vcpus_used"] = self.driver.get_vcpu_used(domains)
+        data["memory_mb_used"] = self.driver.get_memory_mb_used(domains)
         data["local_gb_used"] = disk_info_dict['used']
         data["hypervisor_type"] = self.driver.get_hypervisor_type()
         data["hypervisor_version"] = self.driver.get_hypervisor_version()
@@ -28,6 +28,9 @@ import os
 import re
 import time
 
+from eventlet import greenpool
+from eventlet import greenthread
+from eventlet import tpool
 from oslo.config import cfg
 
 from nova.compute import task_states
@@ -37,10 +40,14 @@ from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova import utils
+from nova.virt.libvirt import imagepeers
 from nova.virt.libvirt import utils as virtutils
 
 LOG = logging.getLogger(__name__)
 
+# Size of the reads of base images being checksummed
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
 imagecache_opts = [
     cfg.StrOpt('base_dir_name',
                default='_base',
@@ -74,10 +81,24 @@ imagecache_opts = [
     cfg.IntOpt('checksum_interval_seconds',
                default=3600,
                help='How frequently to checksum base images'),
+    cfg.IntOpt('checksum_concurrency',
+               default=2,
+               help='Number of base images checksummed at once'),
+    cfg.IntOpt('checksum_read_rate_mb',
+               default=0,
+               help='Maximum rate in MB/s at which base images are read to '
+                    'checksum them, 0 for no limit'),
+    cfg.IntOpt('checksum_max_mb_per_pass',
+               default=0,
+               help='Maximum number of MB of a base image checksummed in '
+                    'one pass of the image cache manager, larger images '
+                    'are checksummed over several passes. 0 for no limit'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(imagecache_opts)
+CONF.import_opt('fetch_base_images_from_peers',
+                'nova.virt.libvirt.imagepeers')
 CONF.import_opt('host', 'nova.netconf')
 CONF.import_opt('instances_path', 'nova.compute.manager')
 
@@ -229,6 +250,21 @@ def read_stored_checksum(target, timestamped=True):
     return read_stored_info(target, field='sha1', timestamped=timestamped)
 
 
+def _get_stat_key(path):
+    """Return the size, mtime and inode of a file, which change with its
+    contents.
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime, stat.st_ino]
+
+
+def _read_and_hash(image_file, checksum):
+    """Hash the next chunk of image_file, returning its length."""
+    chunk = image_file.read(CHECKSUM_CHUNK_SIZE)
+    checksum.update(chunk)
+    return len(chunk)
+
+
 def write_stored_checksum(target):
     """Write a checksum to disk for a file in _base."""
 
@@ -240,6 +276,8 @@ def write_stored_checksum(target):
 class ImageCacheManager(object):
     def __init__(self):
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        # The checksums of base images in progress, kept across passes
+        self.checksum_progress = {}
         self._reset_state()
 
     def _reset_state(self):
@@ -254,6 +292,10 @@ class ImageCacheManager(object):
         self.originals = []
         self.removable_base_files = []
         self.unexplained_images = []
+        self.checksum_results = {}
+
+        self._read_start = None
+        self._read_bytes = 0
 
     def _store_image(self, base_dir, ent, original=False):
         """Store a base image for later examination."""
@@ -283,6 +325,27 @@ class ImageCacheManager(object):
                   not is_valid_info_file(os.path.join(base_dir, ent))):
                 self._store_image(base_dir, ent, original=False)
 
+    def list_cached_images(self):
+        """Return the ids of the images whose base file is in _base.
+
+        The image ids are recorded in the info files of the base files when
+        they are fetched, or when the image cache manager finds them in use.
+        """
+        base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
+        if not os.path.exists(base_dir):
+            return []
+
+        image_ids = []
+        digest_size = hashlib.sha1().digestsize * 2
+        for ent in os.listdir(base_dir):
+            if len(ent) == digest_size:
+                image_id = read_stored_info(os.path.join(base_dir, ent),
+                                            field='image_id',
+                                            timestamped=False)
+                if image_id:
+                    image_ids.append(image_id)
+        return image_ids
+
     def _list_running_instances(self, context, all_instances):
         """List running instances (on all compute nodes)."""
         self.used_images = {}
@@ -382,6 +445,55 @@ class ImageCacheManager(object):
             if m:
                 yield img, False, True
 
+    def _throttle_read(self, length):
+        """Sleep as long as needed to read checksummed base images at
+        checksum_read_rate_mb at most.
+        """
+        if not CONF.checksum_read_rate_mb:
+            return
+        now = time.time()
+        if self._read_start is None:
+            self._read_start = now
+        self._read_bytes += length
+        delay = (float(self._read_bytes) /
+                 (CONF.checksum_read_rate_mb * 1024 * 1024) -
+                 (now - self._read_start))
+        if delay > 0:
+            greenthread.sleep(delay)
+
+    def _hash_base_file(self, img_id, base_file):
+        """Compute the sha1 of a base image, resuming where the previous
+        pass stopped if the file didn't change since.
+
+        The file is read in native threads so that other greenthreads can
+        run.  Returns the sha1 and the stat key of the file, or None and the
+        stat key if checksum_max_mb_per_pass ran out first.
+        """
+        stat_key = _get_stat_key(base_file)
+        progress = self.checksum_progress.pop(base_file, None)
+        if progress is None or progress[0] != stat_key:
+            progress = (stat_key, 0, hashlib.sha1())
+        offset, checksum = progress[1:]
+
+        budget = CONF.checksum_max_mb_per_pass * 1024 * 1024
+        read = 0
+        with open(base_file, 'rb') as image_file:
+            image_file.seek(offset)
+            while not budget or read < budget:
+                length = tpool.execute(_read_and_hash, image_file, checksum)
+                if not length:
+                    return checksum.hexdigest(), stat_key
+                read += length
+                self._throttle_read(length)
+
+        self.checksum_progress[base_file] = (stat_key, offset + read,
+                                             checksum)
+        LOG.info(_('image %(id)s at (%(base_file)s): checksummed '
+                   '%(done)d of %(size)d bytes'),
+                 {'id': img_id, 'base_file': base_file,
+                  'done': offset + read, 'size': stat_key[0]})
+        return None, stat_key
+
     def _verify_checksum(self, img_id, base_file, create_if_missing=True):
         """Compare the checksum stored on disk with the current file.
 
@@ -416,8 +528,17 @@ class ImageCacheManager(object):
                     write_stored_info(base_file, field='sha1',
                                       value=stored_checksum)
 
-                with open(base_file, 'r') as f:
-                    current_checksum = utils.hash_file(f)
+                # Files which didn't change since they were last verified
+                # are not read again
+                stored_stat_key = read_stored_info(base_file,
+                                                   field='sha1-stat')
+                if stored_stat_key == _get_stat_key(base_file):
+                    return True
+
+                current_checksum, stat_key = self._hash_base_file(img_id,
+                                                                  base_file)
+                if current_checksum is None:
+                    return None
 
                 if current_checksum != stored_checksum:
                     LOG.error(_('image %(id)s at (%(base_file)s): image '
@@ -427,6 +548,8 @@ class ImageCacheManager(object):
                     return False
 
                 else:
+                    write_stored_info(base_file, field='sha1-stat',
+                                      value=stat_key)
                     return True
 
             else:
@@ -442,7 +565,13 @@ class ImageCacheManager(object):
                     LOG.info(_('%(id)s (%(base_file)s): generating checksum'),
                              {'id': img_id,
                               'base_file': base_file})
-                    write_stored_checksum(base_file)
+                    checksum, stat_key = self._hash_base_file(img_id,
+                                                              base_file)
+                    if checksum is not None:
+                        write_stored_info(base_file, field='sha1',
+                                          value=checksum)
+                        write_stored_info(base_file, field='sha1-stat',
+                                          value=stat_key)
 
                 return None
 
@@ -471,7 +600,13 @@ class ImageCacheManager(object):
         else:
             LOG.info(_('Removing base file: %s'), base_file)
             try:
+                image_id = None
+                if CONF.fetch_base_images_from_peers:
+                    image_id = read_stored_info(base_file, field='image_id',
+                                                timestamped=False)
                 os.remove(base_file)
+                if image_id:
+                    imagepeers.withdraw(image_id, base_file)
                 signature = get_info_filename(base_file)
                 if os.path.exists(signature):
                     os.remove(signature)
@@ -498,7 +633,10 @@ class ImageCacheManager(object):
                 and os.path.isfile(base_file)):
             # _verify_checksum returns True if the checksum is ok, and None if
             # there is no checksum file
-            checksum_result = self._verify_checksum(img_id, base_file)
+            if (img_id, base_file) in self.checksum_results:
+                checksum_result = self.checksum_results[(img_id, base_file)]
+            else:
+                checksum_result = self._verify_checksum(img_id, base_file)
             if checksum_result is not None:
                 image_bad = not checksum_result
 
@@ -574,6 +712,19 @@ class ImageCacheManager(object):
         self._list_base_images(base_dir)
         self._list_running_instances(context, all_instances)
 
+        # Checksum the base images in use a few at a time, before handling
+        # them
+        if CONF.checksum_base_images:
+            to_verify = []
+            for img in self.used_images:
+                fingerprint = hashlib.sha1(img).hexdigest()
+                for result in self._find_base_file(base_dir, fingerprint):
+                    if os.path.isfile(result[0]):
+                        to_verify.append((img, result[0]))
+            pool = greenpool.GreenPool(CONF.checksum_concurrency)
+            self.checksum_results = dict(zip(
+                to_verify, pool.starmap(self._verify_checksum, to_verify)))
+
         # Determine what images are on disk because they're in use
         for img in self.used_images:
             fingerprint = hashlib.sha1(img).hexdigest()
@@ -586,6 +737,14 @@ class ImageCacheManager(object):
 
                 if not image_small and not image_resized:
                     self.originals.append(base_file)
+                    if base_file in self.corrupt_base_files:
+                        imagepeers.withdraw(img, base_file)
+                    else:
+                        imagepeers.advertise(img, base_file)
+                    if not read_stored_info(base_file, field='image_id',
+                                            timestamped=False):
+                        write_stored_info(base_file, field='image_id',
+                                          value=img)
 
         # Elements remaining in unexplained_images might be in use
         inuse_backing_images = self._list_backing_images()
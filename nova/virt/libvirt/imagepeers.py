@@ -0,0 +1,176 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Registry of the compute nodes holding each base image.
+
+Compute nodes advertise the base images they hold, as the address and path
+other compute nodes can copy them from, so that they can be fetched from
+peers rather than from the image service.  The advertisements are keyed by
+image id, and only name the base file of the image, which is named after the
+sha1 of the image id, in a base directory.  The registry is shared by the
+compute nodes through memcached_servers, so the locations read from it are
+checked before being handed out.
+"""
+
+import hashlib
+import os
+import random
+import time
+
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.openstack.common import memorycache
+from nova import utils
+
+imagepeers_opts = [
+    cfg.BoolOpt('fetch_base_images_from_peers',
+                default=False,
+                help='Copy base images from the compute nodes which hold '
+                     'them before downloading them from the image service. '
+                     'Needs memcached_servers to be shared by the compute '
+                     'nodes, and ssh access between them as for resize'),
+    cfg.IntOpt('base_image_advertisement_ttl',
+               default=7200,
+               help='Number of seconds a compute node advertises one of its '
+                    'base images for. The image cache manager renews the '
+                    'advertisements, so it should be longer than '
+                    'image_cache_manager_interval'),
+    cfg.IntOpt('base_image_peer_attempts',
+               default=3,
+               help='Number of peers a base image is copied from at most '
+                    'before falling back to the image service'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(imagepeers_opts)
+CONF.import_opt('my_ip', 'nova.netconf')
+
+LOG = logging.getLogger(__name__)
+
+_CACHE = None
+
+
+def _get_cache():
+    global _CACHE
+    if not _CACHE:
+        _CACHE = memorycache.get_client()
+    return _CACHE
+
+
+def reset_cache():
+    """Reset the cache, mainly for testing purposes."""
+    global _CACHE
+    _CACHE = None
+
+
+def get_base_file(image_id, base_dir):
+    """Returns the path of the base file of image_id in base_dir."""
+    return os.path.join(base_dir, hashlib.sha1(str(image_id)).hexdigest())
+
+
+def _make_key(image_id):
+    # Image ids are hashed to keep the key within what memcached accepts.
+    return 'base-image-peers-%s' % hashlib.sha1(str(image_id)).hexdigest()
+
+
+def _make_location(base_file):
+    return (CONF.my_ip, base_file)
+
+
+def _get_locations(key):
+    """Returns the unexpired locations advertised under key."""
+    now = time.time()
+    locations = _get_cache().get(key)
+    if not isinstance(locations, dict):
+        return {}
+    return dict((location, expires) for location, expires
+                in locations.iteritems() if expires > now)
+
+
+def _is_valid_location(location, base_file):
+    """Returns whether location names a copy of base_file on a peer.
+
+    The host must be an IP address and the path the normalized absolute path
+    of a file with the name of base_file, in a directory with the name of the
+    directory of base_file.
+    """
+    try:
+        host, path = location
+    except (TypeError, ValueError):
+        return False
+    if not isinstance(host, basestring) or not isinstance(path, basestring):
+        return False
+    if not (utils.is_valid_ipv4(host) or utils.is_valid_ipv6(host)):
+        return False
+    return (os.path.isabs(path) and os.path.normpath(path) == path and
+            os.path.basename(path) == os.path.basename(base_file) and
+            (os.path.basename(os.path.dirname(path)) ==
+             os.path.basename(os.path.dirname(base_file))))
+
+
+def advertise(image_id, base_file):
+    """Advertise that this compute node holds base_file, the base file of
+    image_id.
+    """
+    if not CONF.fetch_base_images_from_peers:
+        return
+    key = _make_key(image_id)
+    ttl = CONF.base_image_advertisement_ttl
+    locations = _get_locations(key)
+    locations[_make_location(base_file)] = time.time() + ttl
+    _get_cache().set(key, locations, time=ttl)
+
+
+def withdraw(image_id, base_file):
+    """Stop advertising that this compute node holds base_file, the base
+    file of image_id.
+    """
+    if not CONF.fetch_base_images_from_peers:
+        return
+    key = _make_key(image_id)
+    locations = _get_locations(key)
+    if locations.pop(_make_location(base_file), None) is not None:
+        _get_cache().set(key, locations,
+                         time=CONF.base_image_advertisement_ttl)
+
+
+def get_peers(image_id, base_file):
+    """Returns the peers advertising the base file of image_id, to be copied
+    to base_file, in random order.
+
+    The peers are (host, path) tuples, the host being None for the peers
+    which share the address of this compute node.  The locations which are
+    not a file of the same name in a directory of the same name as base_file
+    are left out.
+    """
+    if not CONF.fetch_base_images_from_peers:
+        return []
+    own_location = _make_location(base_file)
+    peers = []
+    for location in _get_locations(_make_key(image_id)):
+        if location == own_location:
+            continue
+        if not _is_valid_location(location, base_file):
+            LOG.warn(_('Ignoring invalid location %(location)s advertised '
+                       'for image %(image_id)s'),
+                     {'location': location, 'image_id': image_id})
+            continue
+        host, path = location
+        peers.append((host != CONF.my_ip and host or None, path))
+    random.shuffle(peers)
+    return peers
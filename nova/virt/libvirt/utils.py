@@ -27,11 +27,13 @@ from lxml import etree
 from oslo.config import cfg
 
 from nova import exception
+from nova.openstack.common import fileutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common import processutils
 from nova import utils
 from nova.virt import images
+from nova.virt.libvirt import imagepeers
 
 libvirt_opts = [
     cfg.BoolOpt('libvirt_snapshot_compression',
@@ -429,7 +431,7 @@ def get_disk_size(path):
     :returns: Size (in bytes) of the given disk image as it would be seen
               by a virtual machine.
     """
-    size = images.qemu_img_info(path).virtual_size
+    size = images.cached_qemu_img_info(path).virtual_size
     return int(size)
 
 
@@ -439,19 +441,20 @@ def get_disk_backing_file(path, basename=True):
     :param path: Path to the disk image
     :returns: a path to the image's backing store
     """
-    backing_file = images.qemu_img_info(path).backing_file
+    backing_file = images.cached_qemu_img_info(path).backing_file
     if backing_file and basename:
         backing_file = os.path.basename(backing_file)
 
     return backing_file
 
 
-def copy_image(src, dest, host=None):
+def copy_image(src, dest, host=None, receive=False):
     """Copy a disk image to an existing directory
 
     :param src: Source image
     :param dest: Destination path
     :param host: Remote host
+    :param receive: Copy src from the remote host, rather than dest to it
     """
 
     if not host:
@@ -461,7 +464,10 @@ def copy_image(src, dest, host=None):
         # coreutils 8.11, holes can be read efficiently too.
         execute('cp', src, dest)
     else:
-        dest = "%s:%s" % (host, dest)
+        if receive:
+            src = "%s:%s" % (host, src)
+        else:
+            dest = "%s:%s" % (host, dest)
         # Try rsync first as that can compress and create sparse dest files.
         # Note however that rsync currently doesn't read sparse files
         # efficiently: https://bugzilla.samba.org/show_bug.cgi?id=8918
@@ -639,9 +645,42 @@ def get_fs_info(path):
             'used': used}
 
 
-def fetch_image(context, target, image_id, user_id, project_id):
-    """Grab image."""
-    images.fetch_to_raw(context, image_id, target, user_id, project_id)
+def _fetch_image_from_peers(target, image_id):
+    """Copy the base image target from a compute node which holds it.
+
+    Returns whether the image could be copied.
+    """
+    path_tmp = "%s.part" % target
+    peers = imagepeers.get_peers(image_id, target)
+    for host, path in peers[:CONF.base_image_peer_attempts]:
+        try:
+            with fileutils.remove_path_on_error(path_tmp):
+                copy_image(path, path_tmp, host=host, receive=True)
+                os.rename(path_tmp, target)
+        except processutils.ProcessExecutionError as e:
+            LOG.warn(_('Failed to copy %(path)s from %(host)s: %(error)s'),
+                     {'path': path, 'host': host or 'this host', 'error': e})
+        else:
+            LOG.debug(_('Copied %(path)s from %(host)s'),
+                      {'path': path, 'host': host or 'this host'})
+            return True
+    return False
+
+
+def fetch_image(context, target, image_id, user_id, project_id,
+                base_dir=None):
+    """Grab image.
+
+    When target is the base file of the image in base_dir, it is copied from
+    the compute nodes advertising it if possible, and advertised once there.
+    """
+    if (base_dir is None or
+            target != imagepeers.get_base_file(image_id, base_dir)):
+        images.fetch_to_raw(context, image_id, target, user_id, project_id)
+        return
+    if not _fetch_image_from_peers(target, image_id):
+        images.fetch_to_raw(context, image_id, target, user_id, project_id)
+    imagepeers.advertise(image_id, target)
 
 
 def get_instance_path(instance, forceold=False, relative=False):
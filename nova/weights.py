@@ -17,7 +17,13 @@
 Pluggable Weighing support
 """
 
+import time
+
 from nova import loadables
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
 
 
 class WeighedObject(object):
@@ -56,6 +62,39 @@ class BaseWeigher(object):
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
+    def __init__(self, *args, **kwargs):
+        super(BaseWeightHandler, self).__init__(*args, **kwargs)
+        self.weigher_stats = {}
+
+    def add_weigher_stats(self, cls_name, start, num_objs):
+        """Account a run of a weigher, started at time start, over num_objs
+        objects.  Returns the time the weigher took.
+        """
+        elapsed = time.time() - start
+        stats = self.weigher_stats.get(cls_name)
+        if stats is None:
+            stats = {'calls': 0, 'time': 0.0, 'objs': 0}
+            self.weigher_stats[cls_name] = stats
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['objs'] += num_objs
+        LOG.debug(_("Weigher %(cls_name)s weighed %(num_objs)d object(s) "
+                    "in %(elapsed).4f seconds"),
+                  {'cls_name': cls_name, 'num_objs': num_objs,
+                   'elapsed': elapsed})
+        return elapsed
+
+    def get_weigher_stats(self):
+        """Returns the number of runs, the total time and the total number
+        of objects weighed of each weigher, by weigher class name.
+        """
+        return dict((cls_name, dict(stats))
+                    for cls_name, stats in self.weigher_stats.iteritems())
+
+    def reset_weigher_stats(self):
+        """Forget the runs of the weighers accounted so far."""
+        self.weigher_stats = {}
+
     def get_weighed_objects(self, weigher_classes, obj_list,
             weighing_properties):
         """Return a sorted (highest score first) list of WeighedObjects."""
@@ -65,7 +104,10 @@ class BaseWeightHandler(loadables.BaseLoader):
 
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
         for weigher_cls in weigher_classes:
+            start = time.time()
             weigher = weigher_cls()
             weigher.weigh_objects(weighed_objs, weighing_properties)
+            self.add_weigher_stats(weigher_cls.__name__, start,
+                                   len(weighed_objs))
 
         return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
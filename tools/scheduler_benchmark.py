@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the FilterScheduler against a synthetic fleet of compute nodes.
+
+The compute nodes and aggregates are generated in memory and served to the
+scheduler by a HostManager which does not use the DB, so nothing but this
+tree is needed to run it.  The filters and weighers are the ones configured
+with scheduler_default_filters and scheduler_weight_classes, which can be
+overridden with --filters and --weighers.
+
+Run like:
+
+    ./tools/scheduler_benchmark.py --hosts 5000 --requests 200 \\
+        --filters RamFilter,CoreFilter,ComputeFilter
+
+The report has the time taken by each filter and weigher over the whole
+fleet, the latency percentiles and throughput of the scheduling requests,
+and the time taken by each filter and weigher during those requests.
+"""
+
+import os
+import random
+import sys
+import time
+
+from oslo.config import cfg
+
+# If ../nova/__init__.py exists, add ../ to Python search path, so that
+# it will override what happens to be installed in /usr/(local/)lib/python...
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import config
+from nova import context
+from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova.openstack.common import uuidutils
+from nova.scheduler import driver
+from nova.scheduler import filter_scheduler
+from nova.scheduler import host_manager
+
+benchmark_opts = [
+    cfg.IntOpt('hosts',
+               default=1000,
+               help='Number of compute nodes in the synthetic fleet'),
+    cfg.IntOpt('aggregates',
+               default=20,
+               help='Number of host aggregates in the synthetic fleet'),
+    cfg.IntOpt('requests',
+               default=100,
+               help='Number of scheduling requests to run'),
+    cfg.IntOpt('instances_per_request',
+               default=1,
+               help='Number of instances in each scheduling request'),
+    cfg.IntOpt('filter_passes',
+               default=10,
+               help='Number of times each filter and weigher is run over '
+                    'the fleet to time it'),
+    cfg.StrOpt('method',
+               default='select_destinations',
+               help='Scheduler method to benchmark: select_destinations '
+                    'or schedule_run_instance'),
+    cfg.ListOpt('filters',
+                help='Filters to use instead of scheduler_default_filters'),
+    cfg.ListOpt('weighers',
+                help='Weighers to use instead of scheduler_weight_classes'),
+    cfg.IntOpt('seed',
+               default=0,
+               help='Seed of the random generator of the fleet and the '
+                    'requests'),
+]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(benchmark_opts)
+
+FLAVORS = [
+    {'name': 'm1.tiny', 'memory_mb': 512, 'vcpus': 1, 'root_gb': 1},
+    {'name': 'm1.small', 'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20},
+    {'name': 'm1.medium', 'memory_mb': 4096, 'vcpus': 2, 'root_gb': 40},
+    {'name': 'm1.large', 'memory_mb': 8192, 'vcpus': 4, 'root_gb': 80},
+]
+
+HOST_SIZES = [
+    {'memory_mb': 65536, 'vcpus': 16, 'local_gb': 1024},
+    {'memory_mb': 131072, 'vcpus': 32, 'local_gb': 2048},
+    {'memory_mb': 262144, 'vcpus': 64, 'local_gb': 4096},
+]
+
+PCI_POOLS = [
+    {'vendor_id': '8086', 'product_id': '10ed', 'extra_info': {}},
+    {'vendor_id': '10de', 'product_id': '11b4', 'extra_info': {}},
+]
+
+
+def make_compute_node(index, rand):
+    """Returns a compute node row as returned by compute_node_get_all()."""
+    size = rand.choice(HOST_SIZES)
+    used = rand.random() * 0.8
+    num_instances = int(size['vcpus'] * used)
+    memory_mb_used = int(size['memory_mb'] * used)
+    local_gb_used = int(size['local_gb'] * used)
+    stats = {'num_instances': num_instances,
+             'num_vm_active': num_instances,
+             'num_task_None': num_instances,
+             'num_os_type_linux': num_instances,
+             'io_workload': rand.randint(0, 8)}
+    for project in xrange(rand.randint(0, 5)):
+        stats['num_proj_project%d' % project] = rand.randint(0, 10)
+    now = timeutils.utcnow()
+    host = 'host%05d' % index
+    compute = {
+        'id': index,
+        'service_id': index,
+        'service': {'id': index, 'host': host, 'binary': 'nova-compute',
+                    'topic': 'compute', 'disabled': rand.random() < 0.01,
+                    'created_at': now, 'updated_at': now},
+        'hypervisor_hostname': host,
+        'hypervisor_type': 'QEMU',
+        'hypervisor_version': 1005003,
+        'host_ip': '10.%d.%d.%d' % (index >> 16, (index >> 8) & 255,
+                                    index & 255),
+        'cpu_info': '',
+        'supported_instances': jsonutils.dumps([['x86_64', 'qemu', 'hvm'],
+                                                ['i686', 'qemu', 'hvm']]),
+        'memory_mb': size['memory_mb'],
+        'memory_mb_used': memory_mb_used,
+        'free_ram_mb': size['memory_mb'] - memory_mb_used,
+        'vcpus': size['vcpus'],
+        'vcpus_used': num_instances,
+        'local_gb': size['local_gb'],
+        'local_gb_used': local_gb_used,
+        'free_disk_gb': size['local_gb'] - local_gb_used,
+        'disk_available_least': size['local_gb'] - local_gb_used,
+        'updated_at': None,
+        'stats': [{'key': key, 'value': value}
+                  for key, value in stats.iteritems()],
+    }
+    if rand.random() < 0.2:
+        pools = [dict(pool, count=rand.randint(1, 8))
+                 for pool in PCI_POOLS if rand.random() < 0.5]
+        compute['pci_stats'] = jsonutils.dumps(pools)
+    return compute
+
+
+def make_aggregates(hosts, num_aggregates, rand):
+    """Returns aggregates as returned by aggregate_get_all(), splitting the
+    hosts between availability zones, and putting some of them in
+    aggregates with extra metadata.
+    """
+    aggregates = []
+    for index in xrange(num_aggregates):
+        if index % 2 == 0:
+            metadetails = {'availability_zone': 'az%d' % (index // 2)}
+        else:
+            metadetails = {'cpu_allocation_ratio': '4.0',
+                           'ram_allocation_ratio': '1.0',
+                           'filter_tenant_id': 'project%d' % (index % 5)}
+        aggregates.append({'id': index,
+                           'name': 'aggregate%d' % index,
+                           'hosts': [],
+                           'metadetails': metadetails})
+    for host in hosts:
+        if not aggregates:
+            break
+        rand.choice(aggregates[::2])['hosts'].append(host)
+        if rand.random() < 0.3 and len(aggregates) > 1:
+            rand.choice(aggregates[1::2])['hosts'].append(host)
+    return aggregates
+
+
+class BenchmarkHostManager(host_manager.HostManager):
+    """HostManager serving a synthetic fleet instead of the DB content."""
+
+    def __init__(self, compute_nodes, aggregates):
+        super(BenchmarkHostManager, self).__init__()
+        self.compute_nodes = compute_nodes
+        self.aggregates = aggregates
+
+    def _get_compute_nodes(self, context):
+        return self.compute_nodes
+
+    def _get_aggregates_by_host(self, context):
+        aggregates_by_host = {}
+        for aggregate in self.aggregates:
+            for host in aggregate['hosts']:
+                aggregates_by_host.setdefault(host, []).append(aggregate)
+        return aggregates_by_host
+
+
+class BenchmarkScheduler(filter_scheduler.FilterScheduler):
+    """FilterScheduler which does not send the instances to compute."""
+
+    def _provision_resource(self, context, weighed_host, request_spec,
+            filter_properties, requested_networks, injected_files,
+            admin_password, is_first_time, instance_uuid=None,
+            legacy_bdm_in_spec=True):
+        pass
+
+
+def make_request(rand):
+    flavor = rand.choice(FLAVORS)
+    instance_uuids = [uuidutils.generate_uuid()
+                      for i in xrange(CONF.instances_per_request)]
+    instance_properties = {'project_id': 'project%d' % rand.randint(0, 9),
+                           'os_type': 'linux',
+                           'memory_mb': flavor['memory_mb'],
+                           'vcpus': flavor['vcpus'],
+                           'root_gb': flavor['root_gb'],
+                           'ephemeral_gb': 0,
+                           'availability_zone': None,
+                           'uuid': instance_uuids[0]}
+    instance_type = dict(flavor, ephemeral_gb=0, swap=0, extra_specs={})
+    request_spec = {'instance_properties': instance_properties,
+                    'instance_type': instance_type,
+                    'image': {'properties': {}},
+                    'instance_uuids': instance_uuids,
+                    'num_instances': len(instance_uuids)}
+    return request_spec, {'scheduler_hints': {}}
+
+
+def percentile(sorted_values, percent):
+    index = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def time_filters(sched, ctxt, request_spec, filter_properties):
+    """Returns the seconds spent by each filter and weigher over the whole
+    fleet, along with the number of hosts each filter removed.
+    """
+    host_mgr = sched.host_manager
+    hosts = list(host_mgr.get_all_host_states(ctxt))
+    filter_properties = dict(filter_properties,
+                             context=ctxt,
+                             request_spec=request_spec,
+                             instance_type=request_spec['instance_type'],
+                             config_options={})
+    sched.populate_filter_properties(request_spec, filter_properties)
+
+    results = []
+    for filter_cls in host_mgr._choose_host_filters(None):
+        start = time.time()
+        for i in xrange(CONF.filter_passes):
+            passed = host_mgr.filter_handler.get_filtered_objects(
+                    [filter_cls], hosts, filter_properties)
+        elapsed = (time.time() - start) / CONF.filter_passes
+        removed = len(hosts) - len(passed or [])
+        results.append(('filter', filter_cls.__name__, elapsed, removed))
+    for weigher_cls in host_mgr.weight_classes:
+        start = time.time()
+        for i in xrange(CONF.filter_passes):
+            host_mgr.weight_handler.get_weighed_objects([weigher_cls], hosts,
+                                                        filter_properties)
+        elapsed = (time.time() - start) / CONF.filter_passes
+        results.append(('weigher', weigher_cls.__name__, elapsed, None))
+    return results
+
+
+def main():
+    config.parse_args(sys.argv)
+    logging.setup('nova')
+    if CONF.filters:
+        CONF.set_override('scheduler_default_filters', CONF.filters)
+    if CONF.weighers:
+        CONF.set_override('scheduler_weight_classes', CONF.weighers)
+
+    rand = random.Random(CONF.seed)
+    compute_nodes = [make_compute_node(index, rand)
+                     for index in xrange(CONF.hosts)]
+    hosts = [compute['service']['host'] for compute in compute_nodes]
+    aggregates = make_aggregates(hosts, CONF.aggregates, rand)
+
+    sched = BenchmarkScheduler()
+    sched.host_manager = BenchmarkHostManager(compute_nodes, aggregates)
+    ctxt = context.get_admin_context()
+
+    failures = []
+
+    def _count_failure(context, ex, instance_uuid, request_spec):
+        failures.append(instance_uuid)
+
+    # schedule_run_instance() puts the instances it cannot place in ERROR
+    # state in the DB, only count them.
+    driver.handle_schedule_error = _count_failure
+
+    print "Fleet: %d hosts, %d aggregates" % (len(compute_nodes),
+                                              len(aggregates))
+    request_spec, filter_properties = make_request(rand)
+    print "\n%-8s %-40s %12s %10s" % ('', 'class', 'ms/pass', 'removed')
+    for kind, name, elapsed, removed in time_filters(sched, ctxt,
+            request_spec, filter_properties):
+        print "%-8s %-40s %12.3f %10s" % (kind, name, elapsed * 1000,
+                                          removed if removed is not None
+                                          else '')
+    # Only report the runs of the filters and weighers made by the requests.
+    sched.host_manager.filter_handler.reset_filter_stats()
+    sched.host_manager.weight_handler.reset_weigher_stats()
+
+    latencies = []
+    start = time.time()
+    for i in xrange(CONF.requests):
+        request_spec, filter_properties = make_request(rand)
+        request_start = time.time()
+        if CONF.method == 'schedule_run_instance':
+            sched.schedule_run_instance(ctxt, request_spec, None, [], None,
+                    True, filter_properties, False)
+        else:
+            try:
+                sched.select_destinations(ctxt, request_spec,
+                                          filter_properties)
+            except Exception:
+                failures.extend(request_spec['instance_uuids'])
+        latencies.append(time.time() - request_start)
+    elapsed = time.time() - start
+
+    latencies.sort()
+    print "\n%s: %d requests of %d instance(s) in %.3f s" % (
+            CONF.method, CONF.requests, CONF.instances_per_request, elapsed)
+    print "throughput: %.1f requests/s" % (CONF.requests / elapsed)
+    print "latency p50: %.3f ms" % (percentile(latencies, 50) * 1000)
+    print "latency p99: %.3f ms" % (percentile(latencies, 99) * 1000)
+    print "latency max: %.3f ms" % (latencies[-1] * 1000)
+    print "instances not placed: %d" % len(failures)
+
+    stats = sched.get_stats()
+    print "\n%-8s %-40s %8s %12s %10s" % ('', 'class', 'runs', 'ms/run',
+                                          'hosts in')
+    for kind in ('filters', 'weighers'):
+        for name, cls_stats in sorted(stats[kind].iteritems()):
+            print "%-8s %-40s %8d %12.3f %10.1f" % (
+                    kind[:-1], name, cls_stats['calls'],
+                    cls_stats['time'] * 1000 / cls_stats['calls'],
+                    float(cls_stats.get('objs_in', cls_stats.get('objs')))
+                    / cls_stats['calls'])
+
+
+if __name__ == "__main__":
+    main()